@@ -6,9 +6,13 @@ import os
 import numpy as np
 import pandas as pd
 import datetime as dt
-from pylab import mpl, plt
-plt.style.use('seaborn')
-mpl.rcParams['font.family'] = 'serif'
+from profiling import StageProfiler
+from plotting import get_plt
+from TradeLedger import TradeLedger
+from data_store import load_csv
+from data_quality import validate
+from shared_data import SharedFrame
+from features import FeatureGraph
 
 
 class BackTestBase(object):
@@ -26,12 +30,34 @@ class BackTestBase(object):
         fixed transaction costs per trade (buy or sell)
     ptc: float
         proportional transaction costs per trade (buy or sell)
+    csv_file: str
+        optional path to the csv file passed to get_data, or a SharedFrame
+        of the data set in shared memory (see shared_data)
+    profile: bool
+        record wall time, CPU time and memory per stage of the back-test
+    cprofile: list
+        names of the stages to run under cProfile (e.g. ['loop'])
+    profile_memory: bool
+        also record the allocated memory per stage (slower, skews the times)
+    plot: bool
+        plot the strategy charts at the end of a run
+    quality: dict
+        optional data_quality.validate arguments checking (and repairing)
+        the data on load, e.g. {'repair_data': True, 'limit': 5}
+    quality_report: dict
+        report of the last data check
     data: DateFrame
         contains input DataFrame
+    features: FeatureGraph
+        indicators of data, computed once for all the runs
     result: DateFrame
         result is made by running the strategy
     statistics: DateFrame
         statistics is made after strategy
+    ledger: TradeLedger
+        fills of the last run
+    profiler: StageProfiler
+        per-stage measures, attached to result.attrs['profile'] after a run
 
     Methods
     =======
@@ -51,10 +77,18 @@ class BackTestBase(object):
         places a sell order
     close_out:
         closes out a long or short position
+    print_fill:
+        prints out a fill recorded in the ledger
+    get_trades:
+        returns the fills of the last run as a DataFrame
+    get_round_trips:
+        returns the PnL and holding time of each closed position
     '''
 
     def __init__(self, start, end, amount,
-                 ftc=0.0, ptc=0.0, verbose=True):
+                 ftc=0.0, ptc=0.0, verbose=True, csv_file=None,
+                 profile=False, cprofile=None, plot=True, quality=None,
+                 profile_memory=False):
         self.start = start
         self.end = end
         self.initial_amount = amount
@@ -62,20 +96,45 @@ class BackTestBase(object):
         self.ftc = ftc
         self.ptc = ptc
         self.verbose = verbose
+        self.plot = plot
+        self.quality = quality
+        self.quality_report = None
+        self.profiler = StageProfiler(profile or bool(cprofile), cprofile,
+                                      profile_memory)
         self.reset_strategy()
-        self.get_data()
+        if csv_file is None:
+            self.get_data()
+        else:
+            self.get_data(csv_file)
 
     def get_data(self, csv_file="./BTCUSDT-1m-2020-01-01_2022-08-11.csv"):
         ''' Retrieves and prepares the data.
 
         Arguments:
         - file: str
-            path to csv file containing Date:datetime and price:float
+            path to csv file containing Date:datetime and price:float,
+            or a SharedFrame
         '''
-        raw = pd.read_csv(csv_file, index_col=0, parse_dates=True).dropna()
-        raw = raw.loc[(raw.index > self.start) & (raw.index < self.end)]
-        raw['return'] = np.log(raw / raw.shift(1))
-        self.data = raw.dropna()
+        self.csv_file = csv_file
+        with self.profiler.stage('get_data'):
+            if isinstance(csv_file, SharedFrame):
+                # zero-copy slice of the shared data set, price only like
+                # the csv file
+                raw = csv_file.attach()[['price']]
+                raw = raw.iloc[raw.index.searchsorted(self.start, 'left'):
+                               raw.index.searchsorted(self.end, 'right')]
+            else:
+                raw = load_csv(csv_file, columns=['price'], start=self.start,
+                               end=self.end)
+            if self.quality is not None:
+                # no outlier column: the engines expect price only
+                raw, self.quality_report = validate(
+                    raw, **{**self.quality, 'mark_outliers': False})
+            raw = raw.dropna()
+            raw = raw.loc[(raw.index > self.start) & (raw.index < self.end)]
+            raw['return'] = np.log(raw / raw.shift(1))
+            self.data = raw.dropna()
+            self.features = FeatureGraph(self.data)
 
     def reset_strategy(self):
         ''' Set defaults to be able to re-run a new strategy with clean input '''
@@ -83,8 +142,10 @@ class BackTestBase(object):
         self.position = 0  # initial neutral position
         self.trades = 0  # no trades yet
         self.amount = self.initial_amount  # reset initial capital
+        self.ledger = TradeLedger()
         self.result = None
         self.statistics = None
+        self.profiler.reset(keep=['get_data'])
 
     def plot_data(self, cols=None, data=None, title=None, figsize=None):
         ''' Generalist plotting function
@@ -95,7 +156,9 @@ class BackTestBase(object):
             data = self.data
         if figsize is None:
             figsize = (10, 6)
-        data[cols].plot(figsize=figsize, title=title)
+        with self.profiler.stage('plot'):
+            get_plt()
+            data[cols].plot(figsize=figsize, title=title)
 
     def plot_strategy(self):
         ''' Draw an advanced strategy chart
@@ -105,35 +168,50 @@ class BackTestBase(object):
         if self.statistics is None:
             print('No statistics to plot yet. Run a strategy.')
         else:
-            cols = ['cum_returns', 'cum_strategy', 'cum_max']
-            is_long = self.statistics['position'] > 0
-            is_short = self.statistics['position'] < 0
-            min_val = self.statistics[cols].min().min()
-            max_val = self.statistics[cols].max().max()
-            self.statistics[cols].plot(figsize=(10, 6))
-            plt.fill_between(x=self.statistics.index, y1=max_val,
-                             y2=min_val, where=is_long, color="green", alpha=0.1)
-            plt.fill_between(x=self.statistics.index, y1=max_val,
-                             y2=min_val, where=is_short, color="red", alpha=0.1)
-            plt.show()
+            with self.profiler.stage('plot'):
+                plt = get_plt()
+                cols = ['cum_returns', 'cum_strategy', 'cum_max']
+                is_long = self.statistics['position'] > 0
+                is_short = self.statistics['position'] < 0
+                min_val = self.statistics[cols].min().min()
+                max_val = self.statistics[cols].max().max()
+                self.statistics[cols].plot(figsize=(10, 6))
+                plt.fill_between(x=self.statistics.index, y1=max_val,
+                                 y2=min_val, where=is_long, color="green", alpha=0.1)
+                plt.fill_between(x=self.statistics.index, y1=max_val,
+                                 y2=min_val, where=is_short, color="red", alpha=0.1)
+                plt.show()
 
     def calculate_statistics(self):
         ''' From self.result to self.statistics, calculate strategy statistics'''
         if self.result is None:
             print('No result to plot yet. Run a strategy.')
         else:
-            raw = self.result.copy()
+            with self.profiler.stage('calculate_statistics'):
+                raw = self.result.copy()
+
+                # cumulative real performance
+                raw['strategy'] = np.log(
+                    raw['valuation'] / raw['valuation'].shift(1))
+                raw['cum_returns'] = raw['return'].cumsum().apply(np.exp)
+                raw['cum_strategy'] = raw['strategy'].cumsum().apply(np.exp)
+                # used to calc drawdown later
+                raw['cum_max'] = raw['cum_strategy'].cummax()
+                raw['drawdown'] = raw['cum_max'] - raw['cum_strategy']
 
-            # cumulative real performance
-            raw['strategy'] = np.log(
-                raw['valuation'] / raw['valuation'].shift(1))
-            raw['cum_returns'] = raw['return'].cumsum().apply(np.exp)
-            raw['cum_strategy'] = raw['strategy'].cumsum().apply(np.exp)
-            # used to calc drawdown later
-            raw['cum_max'] = raw['cum_strategy'].cummax()
-            raw['drawdown'] = raw['cum_max'] - raw['cum_strategy']
+                self.statistics = raw
 
-            self.statistics = raw
+    def attach_profile(self):
+        ''' Attaches the profiling report of the last run to the result
+        (result.attrs['profile']) and returns it.
+        '''
+        if not self.profiler.enabled:
+            return None
+        report = self.profiler.report()
+        for frame in (self.result, self.statistics):
+            if frame is not None:
+                frame.attrs['profile'] = report
+        return report
 
     def get_date_price(self, bar: int):
         ''' Return date and price for bar.
@@ -164,10 +242,11 @@ class BackTestBase(object):
         self.amount -= (units * price) * (1 + self.ptc) + self.ftc
         self.units += units
         self.trades += 1
+        self.ledger.append(bar, 1, units, price,
+                           units * price * self.ptc + self.ftc,
+                           self.amount, self.units)
         if self.verbose:
-            print(f'{date} | buying {units} units at {price:.2f}')
-            self.print_balance(bar)
-            self.print_net_wealth(bar)
+            self.print_fill()
 
     def place_sell_order(self, bar, units=None, amount=None):
         ''' Place a sell order.
@@ -178,22 +257,49 @@ class BackTestBase(object):
         self.amount += (units * price) * (1 - self.ptc) - self.ftc
         self.units -= units
         self.trades += 1
+        self.ledger.append(bar, -1, units, price,
+                           units * price * self.ptc + self.ftc,
+                           self.amount, self.units)
         if self.verbose:
-            print(f'{date} | selling {units} units at {price:.2f}')
-            self.print_balance(bar)
-            self.print_net_wealth(bar)
+            self.print_fill()
 
     def close_out(self, bar):
         ''' Closing out a long or short position.
         '''
         date, price = self.get_date_price(bar)
-        self.amount += self.units * price
+        units = self.units
+        self.amount += units * price
         self.units = 0
         self.trades += 1
+        if units != 0:
+            self.ledger.append(bar, -np.sign(units), abs(units), price, 0.0,
+                               self.amount, self.units)
         if self.verbose:
             print(f'{date} | closing trading at {self.amount:.2f}')
             print('=' * 55)
 
+    def print_fill(self, i: int = -1):
+        ''' Print out the i-th fill of the ledger (the last by default).
+        '''
+        ledger = self.ledger
+        i = i % len(ledger)
+        date = self.data.index[ledger.bar[i]]
+        side = 'buying' if ledger.side[i] > 0 else 'selling'
+        price = ledger.price[i]
+        cash = ledger.cash[i]
+        net_wealth = ledger.position[i] * price + cash
+        print(f'{date} | {side} {ledger.units[i]:g} units at {price:.2f}')
+        print(f'{date} | current balance {cash:.2f}')
+        print(f'{date} | current net wealth {net_wealth:.2f}')
+
+    def get_trades(self) -> pd.DataFrame:
+        ''' Returns the fills of the last run as a DataFrame '''
+        return self.ledger.to_frame(self.data.index)
+
+    def get_round_trips(self) -> pd.DataFrame:
+        ''' Returns the PnL and holding time of each closed position '''
+        return self.ledger.round_trips(self.data.index)
+
     def get_gross_rate(self, initial: int, final: int) -> float:
         return (final - initial) / initial
 
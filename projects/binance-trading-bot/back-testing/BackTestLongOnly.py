@@ -19,35 +19,39 @@ class BackTestLongOnly(BackTestBase):
         self.reset_strategy()
         raw = self.data.copy()
 
-        raw['SMA1'] = raw['price'].rolling(SMA1).mean()
-        raw['SMA2'] = raw['price'].rolling(SMA2).mean()
-        raw['position'] = 0
+        with self.profiler.stage('indicators'):
+            raw['SMA1'] = self.features.get('sma', SMA1)
+            raw['SMA2'] = self.features.get('sma', SMA2)
+            raw['position'] = 0
 
         bar = 0
-        for bar in range(SMA2, len(raw)):
-            if self.position == 0:
-                if raw['SMA1'].iloc[bar] > raw['SMA2'].iloc[bar]:
-                    self.place_buy_order(bar, amount=self.amount)
-                    self.position = 1  # long position
-
-            elif self.position == 1:
-                if raw['SMA1'].iloc[bar] < raw['SMA2'].iloc[bar]:
-                    self.place_sell_order(bar, units=self.units)
-                    self.position = 0  # market neutral
-
-            # add position and balance to the DataFrame
-            price = self.get_date_price(bar)[1]
-            valuation = self.units * price + self.amount
-            raw.at[raw.index[bar], 'valuation'] = valuation
-            raw.at[raw.index[bar], 'position'] = self.position
+        with self.profiler.stage('loop', bars=len(raw) - SMA2):
+            for bar in range(SMA2, len(raw)):
+                if self.position == 0:
+                    if raw['SMA1'].iloc[bar] > raw['SMA2'].iloc[bar]:
+                        self.place_buy_order(bar, amount=self.amount)
+                        self.position = 1  # long position
+
+                elif self.position == 1:
+                    if raw['SMA1'].iloc[bar] < raw['SMA2'].iloc[bar]:
+                        self.place_sell_order(bar, units=self.units)
+                        self.position = 0  # market neutral
+
+                # add position and balance to the DataFrame
+                price = self.get_date_price(bar)[1]
+                valuation = self.units * price + self.amount
+                raw.at[raw.index[bar], 'valuation'] = valuation
+                raw.at[raw.index[bar], 'position'] = self.position
 
         self.result = raw
 
         self.close_out(bar)
         self.calculate_statistics()
         self.print_strategy_resume()
-        self.plot_data(['price', 'SMA1', 'SMA2'], raw)
-        self.plot_strategy()
+        if self.plot:
+            self.plot_data(['price', 'SMA1', 'SMA2'], raw)
+            self.plot_strategy()
+        self.attach_profile()
 
     def run_momentum_strategy(self, momentum=1):
         ''' Back-testing a momentum-based strategy.
@@ -66,32 +70,36 @@ class BackTestLongOnly(BackTestBase):
         self.reset_strategy()
         raw = self.data.copy()
 
-        raw['momentum'] = raw['return'].rolling(momentum).mean()
-        raw['position'] = 0
+        with self.profiler.stage('indicators'):
+            raw['momentum'] = self.features.get('momentum', momentum)
+            raw['position'] = 0
 
         bar = 0
-        for bar in range(momentum, len(raw)):
-            if self.position == 0:
-                if raw['momentum'].iloc[bar] > 0:
-                    self.place_buy_order(bar, amount=self.amount)
-                    self.position = 1  # long position
-            elif self.position == 1:
-                if raw['momentum'].iloc[bar] < 0:
-                    self.place_sell_order(bar, units=self.units)
-                    self.position = 0  # market neutral
-
-            # add position and balance to the DataFrame
-            price = self.get_date_price(bar)[1]
-            valuation = self.units * price + self.amount
-            raw.at[raw.index[bar], 'valuation'] = valuation
-            raw.at[raw.index[bar], 'position'] = self.position
+        with self.profiler.stage('loop', bars=len(raw) - momentum):
+            for bar in range(momentum, len(raw)):
+                if self.position == 0:
+                    if raw['momentum'].iloc[bar] > 0:
+                        self.place_buy_order(bar, amount=self.amount)
+                        self.position = 1  # long position
+                elif self.position == 1:
+                    if raw['momentum'].iloc[bar] < 0:
+                        self.place_sell_order(bar, units=self.units)
+                        self.position = 0  # market neutral
+
+                # add position and balance to the DataFrame
+                price = self.get_date_price(bar)[1]
+                valuation = self.units * price + self.amount
+                raw.at[raw.index[bar], 'valuation'] = valuation
+                raw.at[raw.index[bar], 'position'] = self.position
 
         self.result = raw
 
         self.close_out(bar)
         self.calculate_statistics()
         self.print_strategy_resume()
-        self.plot_strategy()
+        if self.plot:
+            self.plot_strategy()
+        self.attach_profile()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,186 @@
+#
+# Python Module with Class
+# for Vectorized Back-testing of the
+# long-only strategies of BackTestLongOnly
+#
+from BackTestBase import *
+
+
+class BackTestLongOnlyVector(BackTestBase):
+    ''' Vectorized equivalent of BackTestLongOnly.
+
+    The long-only rules are a two-state machine (flat / long): go long on
+    the entry condition while flat, go flat on the exit condition while
+    long. Since both conditions never hold on the same bar, the state is
+    the forward-filled last signal, so positions are derived with array
+    operations and only the trades are looped over, to size the orders
+    (`int(amount / price)`) and charge costs exactly as the event engine
+    does. Valuation, result, statistics and ledger match BackTestLongOnly.
+
+    Methods
+    =======
+    run_sma_strategy:
+        back-tests the SMA crossover strategy
+    run_momentum_strategy:
+        back-tests the momentum strategy
+    run_state_machine:
+        runs the long-only state machine on entry and exit signals
+    '''
+
+    def run_sma_strategy(self, SMA1: int, SMA2: int):
+        ''' Back-testing a SMA-based strategy.
+
+        Parameters
+        ==========
+        SMA1, SMA2: int
+            shorter and longer term simple moving average (in days)
+        '''
+        msg = f'\n\nRunning SMA strategy | SMA1={SMA1} & SMA2={SMA2}'
+        msg += f'\nfixed costs {self.ftc} | '
+        msg += f'proportional costs {self.ptc}'
+        print(msg)
+        print('=' * 55)
+
+        self.reset_strategy()
+        raw = self.data.copy()
+
+        with self.profiler.stage('indicators'):
+            raw['SMA1'] = self.features.get('sma', SMA1)
+            raw['SMA2'] = self.features.get('sma', SMA2)
+
+        self.run_state_machine(raw, raw['SMA1'].values > raw['SMA2'].values,
+                               raw['SMA1'].values < raw['SMA2'].values, SMA2)
+
+        if self.plot:
+            self.plot_data(['price', 'SMA1', 'SMA2'], raw)
+            self.plot_strategy()
+        self.attach_profile()
+
+    def run_momentum_strategy(self, momentum=1):
+        ''' Back-testing a momentum-based strategy.
+
+        Parameters
+        ==========
+        momentum: int
+            number of days for mean return calculation
+        '''
+        msg = f'\n\nRunning momentum strategy | {momentum} candle(s)'
+        msg += f'\nfixed costs {self.ftc} | '
+        msg += f'proportional costs {self.ptc}'
+        print(msg)
+        print('=' * 55)
+
+        self.reset_strategy()
+        raw = self.data.copy()
+
+        with self.profiler.stage('indicators'):
+            raw['momentum'] = self.features.get('momentum', momentum)
+
+        self.run_state_machine(raw, raw['momentum'].values > 0,
+                               raw['momentum'].values < 0, momentum)
+
+        if self.plot:
+            self.plot_strategy()
+        self.attach_profile()
+
+    def run_state_machine(self, raw: pd.DataFrame, enter: np.ndarray,
+                          exit: np.ndarray, start: int):
+        ''' Runs the long-only state machine from bar `start` on, fills
+        raw['position'] and raw['valuation'], closes out and calculates
+        the statistics.
+
+        Parameters
+        ==========
+        raw: DataFrame
+            copy of the data with the indicators
+        enter, exit: np.ndarray
+            boolean entry and exit conditions per bar
+        start: int
+            first bar of the back-test
+        '''
+        bars = len(raw)
+        start = min(start, bars)
+        with self.profiler.stage('signals', bars=bars - start):
+            # 1 on entry, 0 on exit, forward-filled over the other bars
+            signal = np.where(enter, 1.0, np.where(exit, 0.0, np.nan))
+            signal[:start] = 0
+            position = pd.Series(signal).ffill().values.astype(np.int64)
+            trade_bars = np.flatnonzero(np.diff(position, prepend=0))
+
+        with self.profiler.stage('trades', bars=len(trade_bars)):
+            for bar in trade_bars:
+                if position[bar] == 1:
+                    self.place_buy_order(bar, amount=self.amount)
+                else:
+                    self.place_sell_order(bar, units=self.units)
+            self.position = position[-1] if bars else 0
+
+        with self.profiler.stage('valuation', bars=bars - start):
+            # number of fills up to each bar selects its cash and units
+            fills = np.searchsorted(trade_bars, np.arange(bars), 'right')
+            cash = np.concatenate(([self.initial_amount],
+                                   self.ledger.column('cash')))[fills]
+            units = np.concatenate(([0], self.ledger.column('position')
+                                    .astype(np.int64)))[fills]
+            valuation = units * raw['price'].values + cash
+            valuation[:start] = np.nan
+            raw['position'] = position
+            raw['valuation'] = valuation
+
+        self.result = raw
+
+        self.close_out(bars - 1 if bars > start else 0)
+        self.calculate_statistics()
+        self.print_strategy_resume()
+
+
+def assert_equivalent(event, vector):
+    ''' Raises AssertionError unless two engines that ran the same
+    strategy on the same data have the same outcome.
+    '''
+    assert event.amount == vector.amount, (event.amount, vector.amount)
+    assert event.trades == vector.trades, (event.trades, vector.trades)
+    pd.testing.assert_frame_equal(event.get_trades(), vector.get_trades())
+    cols = ['position', 'valuation']
+    pd.testing.assert_frame_equal(event.result[cols], vector.result[cols],
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(event.statistics[cols],
+                                  vector.statistics[cols], check_dtype=False)
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import tempfile
+    from BackTestLongOnly import BackTestLongOnly
+
+    start = dt.datetime(2022, 6, 1)
+    end = dt.datetime(2022, 6, 3)
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else \
+        "./BTCUSDT-1m-2020-01-01_2022-08-11.csv"
+    if not os.path.exists(csv_file):
+        # synthetic 1m prices: 20,000 bars (about 2 weeks) from start
+        n = 20_000
+        returns = np.random.default_rng(0).normal(0, 1e-3, n)
+        raw = pd.DataFrame(
+            {'price': np.round(30_000 * np.exp(np.cumsum(returns)), 2)},
+            index=pd.date_range(start, periods=n, freq='1min', name='Date'))
+        csv_file = os.path.join(tempfile.mkdtemp(), 'prices.csv')
+        raw.to_csv(csv_file)
+        end = raw.index[-1] + pd.Timedelta(minutes=1)
+        print(f'{csv_file}: synthetic prices, {n:,} bars')
+    args = (start, end, 100000, 1, 0.001)
+
+    lobt = BackTestLongOnly(*args, verbose=False, plot=False,
+                            csv_file=csv_file)
+    lovbt = BackTestLongOnlyVector(*args, verbose=False, plot=False,
+                                   csv_file=csv_file)
+
+    for method, params in [('run_sma_strategy', (90, 194)),
+                           ('run_sma_strategy', (10, 30)),
+                           ('run_momentum_strategy', (1,)),
+                           ('run_momentum_strategy', (30,))]:
+        getattr(lobt, method)(*params)
+        getattr(lovbt, method)(*params)
+        assert_equivalent(lobt, lovbt)
+        print(f'{method}{params}: equivalent')
@@ -12,29 +12,34 @@ class BackTestLongShort(BackTestLongShortBase):
         self.reset_strategy()
         raw = self.data.copy()
 
-        raw['momentum'] = raw['return'].rolling(momentum).mean()
+        with self.profiler.stage('indicators'):
+            raw['momentum'] = self.features.get('momentum', momentum)
+
         bar = 0
-        for bar in range(momentum, len(raw)):
-            if self.position in [0, -1]:
-                if raw['momentum'].iloc[bar] > 0:
-                    self.go_long(bar, amount='all')
-                    self.position = 1  # long position
-            if self.position in [0, 1]:
-                if raw['momentum'].iloc[bar] <= 0:
-                    self.go_short(bar, amount='all')
-                    self.position = -1  # short position
-
-            # add position and balance to the DataFrame
-            price = self.get_date_price(bar)[1]
-            valuation = self.units * price + self.amount
-            raw.at[raw.index[bar], 'valuation'] = valuation
-            raw.at[raw.index[bar], 'position'] = self.position
+        with self.profiler.stage('loop', bars=len(raw) - momentum):
+            for bar in range(momentum, len(raw)):
+                if self.position in [0, -1]:
+                    if raw['momentum'].iloc[bar] > 0:
+                        self.go_long(bar, amount='all')
+                        self.position = 1  # long position
+                if self.position in [0, 1]:
+                    if raw['momentum'].iloc[bar] <= 0:
+                        self.go_short(bar, amount='all')
+                        self.position = -1  # short position
+
+                # add position and balance to the DataFrame
+                price = self.get_date_price(bar)[1]
+                valuation = self.units * price + self.amount
+                raw.at[raw.index[bar], 'valuation'] = valuation
+                raw.at[raw.index[bar], 'position'] = self.position
 
         self.result = raw
         self.close_out(bar)
         self.calculate_statistics()
         self.print_strategy_resume()
-        self.plot_strategy()
+        if self.plot:
+            self.plot_strategy()
+        self.attach_profile()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,390 @@
+#
+# Python Script with Class
+# for Event-Based Back-testing of a Portfolio
+#
+# Many symbols share one cash balance. The prices are a time-aligned panel
+# (one column per symbol) and the state is held in arrays: the loop goes
+# bar by bar and handles all the symbols of a bar with NumPy operations.
+#
+import numpy as np
+import pandas as pd
+from profiling import StageProfiler
+from plotting import get_plt
+from TradeLedger import TradeLedger
+from data_store import load_csv
+
+ALLOCATIONS = ('equal', 'volatility')
+
+
+class PortfolioLedger(TradeLedger):
+    ''' TradeLedger with the symbol (column number) of each fill '''
+
+    COLUMNS = TradeLedger.COLUMNS + ('symbol',)
+    DTYPES = TradeLedger.DTYPES + (np.int32,)
+
+    def append(self, bar: int, side: int, units: float, price: float,
+               fee: float, cash: float, position: float, symbol: int = 0):
+        ''' Records a fill '''
+        i = self.size
+        super().append(bar, side, units, price, fee, cash, position)
+        self.symbol[i] = symbol
+
+    def extend(self, bar: int, side, units, price, fee, cash, position,
+               symbol):
+        ''' Records the fills of a bar, given as arrays '''
+        n = len(symbol)
+        while self.size + n > len(self.bar):
+            self._grow()
+        i, j = self.size, self.size + n
+        self.bar[i:j] = bar
+        self.side[i:j] = side
+        self.units[i:j] = units
+        self.price[i:j] = price
+        self.fee[i:j] = fee
+        self.cash[i:j] = cash
+        self.position[i:j] = position
+        self.symbol[i:j] = symbol
+        self.size = j
+
+
+class BackTestPortfolio(object):
+    ''' Event-based back-testing of long-only strategies on many symbols
+    with a shared cash balance.
+
+    Attributes
+    ==========
+    data: DataFrame
+        aligned close prices, one column per symbol (forward-filled,
+        missing before a symbol is listed)
+    symbols: list
+        names of the columns
+    start, end: datetime
+        optional date range
+    amount: float
+        initial cash
+    ftc: float
+        fixed transaction costs per order
+    ptc: float
+        proportional transaction costs per order
+    ledger: PortfolioLedger
+        fills of the last run
+    result: DataFrame
+        equity, cash, exposure and number of positions at each bar
+
+    Methods
+    =======
+    get_data:
+        loads and aligns the price panel
+    run_momentum_strategy:
+        long the symbols with a positive mean return
+    run_sma_strategy:
+        long the symbols with their short SMA above the long one
+    run_signals:
+        back-tests any (bars x symbols) boolean signal
+    allocate:
+        returns the target weights of a bar
+    get_trades:
+        returns the fills of the last run as a DataFrame
+    print_strategy_resume:
+        prints final balance and performance
+    '''
+
+    def __init__(self, data, amount, start=None, end=None, ftc=0.0, ptc=0.0,
+                 verbose=True, profile=False, cprofile=None, plot=False,
+                 profile_memory=False):
+        self.initial_amount = amount
+        self.amount = amount
+        self.start = start
+        self.end = end
+        self.ftc = ftc
+        self.ptc = ptc
+        self.verbose = verbose
+        self.plot = plot
+        self.profiler = StageProfiler(profile or bool(cprofile), cprofile,
+                                      profile_memory)
+        self.reset_strategy()
+        self.get_data(data)
+
+    def get_data(self, data):
+        ''' Retrieves and aligns the prices.
+
+        Arguments:
+        - data: pd.DataFrame or dict
+            a panel of prices (one column per symbol), or a dict of
+            symbol: csv file containing Date:datetime and price:float
+        '''
+        with self.profiler.stage('get_data'):
+            if isinstance(data, dict):
+                data = pd.DataFrame({
+                    symbol: load_csv(csv_file, start=self.start,
+                                     end=self.end)['price']
+                    for symbol, csv_file in data.items()})
+            data = data.sort_index()
+            if self.start is not None:
+                data = data.loc[data.index >= self.start]
+            if self.end is not None:
+                data = data.loc[data.index <= self.end]
+            # a symbol keeps its last price until the next one
+            self.data = data.ffill().astype(float)
+            self.symbols = list(self.data.columns)
+            self.prices = self.data.to_numpy()
+            self.listed = ~np.isnan(self.prices)
+
+    def reset_strategy(self):
+        ''' Set defaults to be able to re-run a new strategy with clean input '''
+        self.amount = self.initial_amount
+        self.units = None
+        self.trades = 0
+        self.ledger = PortfolioLedger()
+        self.result = None
+        self.profiler.reset(keep=['get_data'])
+
+    def allocate(self, signal: np.ndarray, vol: np.ndarray = None,
+                 max_weight=1.0) -> np.ndarray:
+        ''' Returns the target weights of a bar: the symbols with a signal
+        share the equity equally, or in inverse proportion to their
+        volatility `vol` when given.
+        '''
+        if vol is None:
+            score = signal.astype(float)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score = np.where(signal & (vol > 0), 1 / vol, 0.0)
+        total = score.sum()
+        if total == 0:
+            return score
+        return np.minimum(score / total, max_weight)
+
+    def run_momentum_strategy(self, momentum=1, **kwargs):
+        ''' Back-testing a momentum strategy on each symbol.
+
+        Parameters
+        ==========
+        momentum: int
+            number of bars for the mean return
+        kwargs:
+            allocation, vol_window, max_weight, rebalance, min_order
+            (see run_signals)
+        '''
+        with self.profiler.stage('indicators'):
+            returns = np.log(self.data / self.data.shift(1))
+            mean = returns.rolling(momentum).mean().to_numpy()
+            signal = mean > 0
+        return self.run_signals(signal, f'momentum {momentum}', **kwargs)
+
+    def run_sma_strategy(self, SMA1: int, SMA2: int, **kwargs):
+        ''' Back-testing a SMA crossover on each symbol.
+
+        Parameters
+        ==========
+        SMA1, SMA2: int
+            shorter and longer term simple moving average (in bars)
+        kwargs:
+            see run_signals
+        '''
+        with self.profiler.stage('indicators'):
+            sma1 = self.data.rolling(SMA1).mean().to_numpy()
+            sma2 = self.data.rolling(SMA2).mean().to_numpy()
+            signal = sma1 > sma2
+        return self.run_signals(signal, f'SMA {SMA1}/{SMA2}', **kwargs)
+
+    def run_signals(self, signal: np.ndarray, name='signals',
+                    allocation='equal', vol_window=60, max_weight=1.0,
+                    rebalance=None, min_order=10.0):
+        ''' Back-testing a boolean (bars x symbols) long signal.
+
+        A symbol is bought at its target weight when its signal turns on
+        (as far as the cash allows) and sold out when it turns off; the
+        other positions are left as they are, except on rebalancing bars.
+
+        Parameters
+        ==========
+        allocation: str
+            'equal' or 'volatility' (inverse volatility) weights
+        vol_window: int
+            bars of the volatility estimate
+        max_weight: float
+            cap of the weight of a symbol, the rest stays in cash
+        rebalance: int
+            bring every position back to its target weight
+            every `rebalance` bars
+        min_order: float
+            orders smaller than this value are skipped (except exits)
+        '''
+        if allocation not in ALLOCATIONS:
+            raise ValueError(f'allocation must be one of {ALLOCATIONS}')
+        if self.verbose:
+            msg = f'\n\nRunning portfolio {name} strategy | '
+            msg += f'{len(self.symbols)} symbols, {allocation} weights'
+            msg += f'\nfixed costs {self.ftc} | '
+            msg += f'proportional costs {self.ptc}'
+            print(msg)
+            print('=' * 55)
+
+        self.reset_strategy()
+        with self.profiler.stage('indicators'):
+            signal = signal & self.listed
+            vol = None
+            if allocation == 'volatility':
+                returns = np.log(self.data / self.data.shift(1))
+                vol = returns.rolling(vol_window).std().to_numpy()
+            # symbols entering or leaving on each bar
+            flips = signal.copy()
+            flips[1:] ^= signal[:-1]
+            full = np.zeros(len(signal), dtype=bool)
+            if rebalance:
+                full[::rebalance] = True
+            events = flips.any(axis=1) | full
+
+        prices = np.nan_to_num(self.prices)
+        n_bars, n_symbols = prices.shape
+        ptc, ftc = self.ptc, self.ftc
+        cash = float(self.amount)
+        units = np.zeros(n_symbols)
+        equity = np.empty(n_bars)
+        cash_col = np.empty(n_bars)
+        exposure = np.empty(n_bars)
+        positions = np.empty(n_bars, dtype=np.int64)
+
+        with self.profiler.stage('loop', bars=n_bars):
+            for bar in range(n_bars):
+                price = prices[bar]
+                held = units @ price
+                if events[bar]:
+                    on = signal[bar]
+                    trade = (on | (units != 0)) if full[bar] else flips[bar]
+                    weights = self.allocate(on, None if vol is None else vol[bar],
+                                            max_weight)
+                    # leave room for the costs of the orders
+                    target = np.zeros(n_symbols)
+                    target[on] = weights[on] * (cash + held) * (1 - ptc) / price[on]
+                    delta = np.where(trade, target - units, 0.0)
+                    delta[on & (np.abs(delta) * price < min_order)] = 0.0
+
+                    sells = np.flatnonzero(delta < 0)
+                    if len(sells):
+                        value = -delta[sells] * price[sells]
+                        fees = value * ptc + ftc
+                        units[sells] += delta[sells]
+                        cash += (value - fees).sum()
+                        self.ledger.extend(bar, -1, -delta[sells], price[sells], fees,
+                                           cash, units[sells], sells)
+
+                    buys = np.flatnonzero(delta > 0)
+                    value = delta[buys] * price[buys]
+                    scale = 1.0
+                    while len(buys):
+                        # not enough cash: buy less of each, without the
+                        # orders left unable to pay their costs or too small
+                        budget = cash - ftc * len(buys)
+                        need = (value * (1 + ptc)).sum()
+                        scale = min(1.0, budget / need) if budget > 0 else 0.0
+                        if scale > 0 and scale * value.min() >= min_order:
+                            break
+                        smallest = np.argmin(value)
+                        buys = np.delete(buys, smallest)
+                        value = np.delete(value, smallest)
+                    if len(buys):
+                        bought = delta[buys] * scale
+                        value *= scale
+                        fees = value * ptc + ftc
+                        units[buys] += bought
+                        # a scaled buy spends the whole cash, up to rounding
+                        cash = max(cash - (value + fees).sum(), 0.0)
+                        self.ledger.extend(bar, 1, bought, price[buys], fees,
+                                           cash, units[buys], buys)
+                    held = units @ price
+
+                equity[bar] = cash + held
+                cash_col[bar] = cash
+                exposure[bar] = held
+                positions[bar] = np.count_nonzero(units)
+
+        self.amount = cash
+        self.units = units
+        self.result = pd.DataFrame({
+            'equity': equity, 'cash': cash_col, 'exposure': exposure,
+            'positions': positions}, index=self.data.index)
+        self.close_out()
+        if self.verbose:
+            self.print_strategy_resume()
+        if self.plot:
+            get_plt()
+            self.result['equity'].plot(figsize=(10, 6), title=name)
+        self.attach_profile()
+        return self.result
+
+    def close_out(self):
+        ''' Closing out the positions at the last prices '''
+        if len(self.data) == 0:
+            return
+        bar = len(self.data) - 1
+        price = np.nan_to_num(self.prices[bar])
+        held = np.flatnonzero(self.units)
+        if len(held):
+            units = self.units[held]
+            self.amount += units @ price[held]
+            self.units[held] = 0.0
+            self.ledger.extend(bar, -1, units, price[held], 0.0, self.amount,
+                               0.0, held)
+        self.trades = len(self.ledger)
+        if self.verbose:
+            date = self.data.index[bar]
+            print(f'{date} | closing trading at {self.amount:.2f}')
+            print('=' * 55)
+
+    def attach_profile(self):
+        ''' Attaches the profiling report of the last run to the result
+        (result.attrs['profile']) and returns it.
+        '''
+        if not self.profiler.enabled or self.result is None:
+            return None
+        report = self.profiler.report()
+        self.result.attrs['profile'] = report
+        return report
+
+    def get_trades(self) -> pd.DataFrame:
+        ''' Returns the fills of the last run as a DataFrame '''
+        trades = self.ledger.to_frame(self.data.index)
+        trades['symbol'] = np.array(self.symbols)[trades['symbol'].values]
+        return trades
+
+    def get_gross_rate(self, initial: float, final: float) -> float:
+        return (final - initial) / initial
+
+    def print_strategy_resume(self):
+        ''' Print final balance, performance and others metrics '''
+        perf = self.get_gross_rate(self.initial_amount, self.amount) * 100
+        print('Initial balance [$] {:.2f}'.format(self.initial_amount))
+        print('Final balance   [$] {:.2f}'.format(self.amount))
+        print('Net Performance [%] {:.2f}'.format(perf))
+        print('Symbols         [#] {}'.format(len(self.symbols)))
+        print('Trades Executed [#] {}'.format(self.trades))
+        if self.result is not None:
+            equity = self.result['equity']
+            drawdown = 1 - equity / equity.cummax()
+            print('Max drawdown    [%] {:.2f}'.format(drawdown.max() * 100))
+        print('=' * 55)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    # synthetic panel: correlated random walks of minute bars
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_bars = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    rng = np.random.default_rng(0)
+    market = rng.normal(0, 5e-4, (n_bars, 1))
+    returns = market + rng.normal(0, 1e-3, (n_bars, n_symbols))
+    panel = pd.DataFrame(100 * np.exp(np.cumsum(returns, axis=0)),
+                         index=pd.date_range('2022-01-01', periods=n_bars,
+                                             freq='1min', name='Date'),
+                         columns=[f'SYM{i}' for i in range(n_symbols)])
+
+    bt = BackTestPortfolio(panel, 1_000_000, ptc=0.001)
+    for allocation in ALLOCATIONS:
+        t0 = time.perf_counter()
+        bt.run_momentum_strategy(240, allocation=allocation, rebalance=1440)
+        print(f'{allocation}: {time.perf_counter() - t0:.1f} s for '
+              f'{n_bars} bars x {n_symbols} symbols')
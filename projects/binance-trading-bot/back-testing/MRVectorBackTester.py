@@ -0,0 +1,212 @@
+#
+# Python Module with Class
+# for Vectorized Back-testing
+# of Mean Reversion-based Strategies
+#
+# Python for Algorithmic Trading
+# (c) Dr. Yves J. Hilpisch
+# The Python Quants GmbH
+#
+from concurrent.futures import ProcessPoolExecutor
+from MomVectorBackTester import *
+
+# bytes of the temporaries of evaluate_thresholds per (threshold, bar) cell:
+# signal, index, position, strategy and the transaction cost arrays
+CELL_BYTES = 56
+
+
+def evaluate_thresholds(price: np.ndarray, SMA: int, thresholds: np.ndarray,
+                        amount: float, tc: float = 0,
+                        max_bytes: int = 2 ** 27) -> tuple:
+    ''' Evaluates the mean reversion strategy of one SMA window for all
+    thresholds at once, with the same rules as run_strategy.
+
+    The signals of every threshold form a (thresholds x bars) array, the
+    forward fill of the position is done with a running maximum of the
+    index of the last signal. Thresholds are processed in chunks whose
+    temporaries take at most about `max_bytes` (128 MB by default, for
+    each worker process of optimize_parameters).
+
+    Parameters
+    ==========
+    price: np.ndarray
+        prices, without missing values
+    SMA: int
+        window of the simple moving average
+    thresholds: np.ndarray
+        distances to the SMA triggering a position
+    amount: float
+        initial amount
+    tc: float
+        proportional transaction costs per unit of position change
+    max_bytes: int
+        memory budget of the temporaries of a chunk of thresholds
+
+    Returns
+    =======
+    absolute_perf, relative_perf: np.ndarray
+        performance of the strategy per threshold, as run_strategy
+    '''
+    price = pd.Series(price)
+    returns = np.log(price / price.shift(1))
+    sma = price.rolling(SMA).mean()
+    # rows kept by run_strategy after dropping missing values
+    keep = returns.notna() & sma.notna()
+    returns = returns[keep].values
+    distance = (price - sma)[keep].values
+    n = len(distance)
+
+    # crossing of current price and SMA resets the position
+    crossing = np.zeros(n, dtype=bool)
+    crossing[1:] = distance[1:] * distance[:-1] < 0
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    strategy_sum = np.empty(len(thresholds))
+    chunk = max(1, max_bytes // (CELL_BYTES * max(n, 1)))
+    for i in range(0, len(thresholds), chunk):
+        t = thresholds[i:i + chunk, None]
+        signal = np.where(distance > t, -1.0, np.nan)
+        signal = np.where(distance < -t, 1.0, signal)
+        signal[:, crossing] = 0
+
+        # forward fill: index of the last signal up to each bar
+        index = np.where(np.isnan(signal), 0, np.arange(n))
+        np.maximum.accumulate(index, axis=1, out=index)
+        position = np.take_along_axis(signal, index, axis=1)
+        position = np.nan_to_num(position, nan=0.0)
+
+        strategy = position[:, :-1] * returns[1:]
+        costs = transaction_costs(position, tc).sum(axis=1)
+        strategy_sum[i:i + chunk] = strategy.sum(axis=1) - costs
+
+    absolute_perf = amount * np.exp(strategy_sum)
+    relative_perf = absolute_perf - amount * np.exp(returns.sum())
+    return absolute_perf, relative_perf
+
+
+class MRVectorBackTester(MomVectorBackTester):
+    ''' Forked from py4at-04/MRVectorBackTester.py
+    '''
+
+    def run_strategy(self, SMA: int, threshold: float):
+        ''' Back-tests the trading strategy.
+        '''
+        self.SMA = SMA
+        self.threshold = threshold
+        self.profiler.reset()
+        with self.profiler.stage('indicators'):
+            data = self.raw.copy()
+            data['return'] = self.features.get('return')
+            data['sma'] = self.features.get('sma', SMA)
+            data['distance'] = self.features.get('distance', SMA)
+            data.dropna(inplace=True)
+
+        with self.profiler.stage('strategy', bars=len(data)):
+            # sell signals
+            data['position'] = np.where(
+                data['distance'] > threshold, -1, np.nan)
+
+            # buy signals
+            data['position'] = np.where(
+                data['distance'] < -threshold, 1, data['position'])
+
+            # crossing of current price and SMA (zero distance)
+            data['position'] = np.where(data['distance'] *
+                                        data['distance'].shift(1) < 0,
+                                        0, data['position'])
+            data['position'] = data['position'].ffill().fillna(0)
+            data['strategy'] = data['position'].shift(1) * data['return']
+
+            # subtract transaction costs, proportional to the position change
+            data['strategy'] -= transaction_costs(
+                data['position'].to_numpy(), self.tc)
+
+        with self.profiler.stage('statistics'):
+            data['cum_returns'] = self.amount * \
+                data['return'].cumsum().apply(np.exp)
+            data['cum_strategy'] = self.amount * \
+                data['strategy'].cumsum().apply(np.exp)
+        self.results = data
+        self.attach_profile()
+
+        # absolute performance of the strategy
+        absolute_perf = data['cum_strategy'].iloc[-1]
+
+        # out-/underperformance of strategy
+        out_perf = absolute_perf - data['cum_returns'].iloc[-1]
+
+        return round(absolute_perf, 2), round(out_perf, 2)
+
+    def optimize_parameters(self, SMA_range, thresholds, workers=1):
+        ''' Finds the best (SMA, threshold) pair of a grid.
+
+        Each SMA's distance series is computed once and all thresholds
+        are evaluated together (see evaluate_thresholds), SMA values are
+        spread over `workers` processes.
+
+        Parameters
+        ==========
+        SMA_range: tuple
+            tuple of the form (start, end, step size)
+        thresholds: list
+            threshold values to test
+        workers: int
+            parallel processes, None for the CPU count
+
+        Returns
+        =======
+        opt: tuple
+            winning (SMA, threshold) pair
+        strategy returns: float
+        '''
+        SMAs = range(SMA_range[0], SMA_range[1], SMA_range[2])
+        thresholds = np.asarray(thresholds, dtype=float)
+        price = self.raw['price'].values
+        args = [(price, SMA, thresholds, self.amount, self.tc)
+                for SMA in SMAs]
+        if workers == 1:
+            perfs = [evaluate_thresholds(*a) for a in args]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                perfs = list(executor.map(evaluate_thresholds, *zip(*args)))
+
+        results_df = pd.DataFrame({
+            'SMA': np.repeat(list(SMAs), len(thresholds)),
+            'threshold': np.tile(thresholds, len(SMAs)),
+            'absolute_perf': np.concatenate([p[0] for p in perfs]).round(2),
+            'relative_perf': np.concatenate([p[1] for p in perfs]).round(2),
+        })
+        results_df.sort_values('absolute_perf', ascending=False, inplace=True,
+                               kind='stable')
+        results_df.reset_index(drop=True, inplace=True)
+        self.benchmark = results_df
+
+        winner = results_df.iloc[0]
+        best = (int(winner['SMA']), float(winner['threshold']))
+
+        # re-execute winner to save the winning results in the class
+        self.run_strategy(*best)
+
+        return best, winner['absolute_perf']
+
+    def plot_results(self):
+        ''' Plots the cumulative performance of the trading strategy
+        compared to the symbol.
+        '''
+        if self.results is None:
+            print('No results to plot yet. Run a strategy.')
+        else:
+            get_plt()
+            title = f"SMA {self.SMA} | threshold {self.threshold}"
+            self.results[['cum_returns', 'cum_strategy']].plot(
+                title=title, figsize=(10, 6))
+
+
+if __name__ == '__main__':
+    raw = pd.read_csv('./input/binance-btc-usd-1m.csv',
+                      index_col=0, parse_dates=True).dropna()
+
+    mr_bt = MRVectorBackTester(raw, 10000, verbose=False)
+    print(mr_bt.run_strategy(SMA=25, threshold=5))
+    print(mr_bt.optimize_parameters((10, 101, 5), range(1, 51), workers=None))
+    print(mr_bt.benchmark.head(10))
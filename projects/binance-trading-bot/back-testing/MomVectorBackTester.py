@@ -8,49 +8,72 @@
 #
 import numpy as np
 import pandas as pd
-from pylab import mpl, plt
-plt.style.use('seaborn')
-mpl.rcParams['font.family'] = 'serif'
+from profiling import StageProfiler
+from plotting import get_plt
+from streaming import iter_chunks, RollingMean, CumSum, LogReturns
+from features import shared_graph
+from accounting import transaction_costs, trade_table
 
 
 class MomVectorBackTester(object):
     ''' Forked from py4at-04/MomVectorBackTester.py
     '''
 
-    def __init__(self, initial_data: pd.DataFrame, amount, tc=0, verbose=True):
+    def __init__(self, initial_data: pd.DataFrame, amount, tc=0, verbose=True,
+                 profile=False, cprofile=None, features=None,
+                 profile_memory=False):
         """
         Parameters:
         ===========
         initial_data: pd.DataFrame
             index: Datetime, price: float
+        profile: bool
+            record wall time, CPU time and memory per stage of a run
+        cprofile: list
+            names of the stages to run under cProfile
+        profile_memory: bool
+            also record the allocated memory per stage (slower)
+        features: FeatureGraph
+            indicators shared with other testers, by default the
+            graph of initial_data (see features.shared_graph)
         """
         self.amount = amount
         self.tc = tc
         self.results = None
-        self.raw = initial_data.copy().dropna()
+        self.features = features or shared_graph(initial_data)
+        # no copy: the data may be a shared read-only data set
+        self.raw = self.features.data
         self.verbose = verbose
+        self.profiler = StageProfiler(profile or bool(cprofile), cprofile,
+                                      profile_memory)
 
     def run_strategy(self, momentum: int = 1):
         ''' Back-tests the trading strategy.
         '''
         self.momentum = momentum
-        data = self.raw.copy().dropna()
-        data['return'] = np.log(data['price'] / data['price'].shift(1))
-        data.dropna(inplace=True)
-        data['position'] = np.sign(data['return'].rolling(momentum).mean())
-        data['strategy'] = data['position'].shift(1) * data['return']
-
-        # determine when a trade takes place
-        data.dropna(inplace=True)
-        trades = data['position'].diff().fillna(0) != 0
-
-        # subtract transaction costs from return when trade takes place
-        data['strategy'][trades] -= self.tc
-        data['cum_returns'] = self.amount * \
-            data['return'].cumsum().apply(np.exp)
-        data['cum_strategy'] = self.amount * \
-            data['strategy'].cumsum().apply(np.exp)
+        self.profiler.reset()
+        with self.profiler.stage('indicators'):
+            base = self.features.base()
+            data = base.data.copy()
+            momentum_mean = base.get('momentum', momentum)
+
+        with self.profiler.stage('strategy', bars=len(data)):
+            data['position'] = np.sign(momentum_mean)
+            data['strategy'] = data['position'].shift(1) * data['return']
+
+            data.dropna(inplace=True)
+
+            # subtract transaction costs, proportional to the position change
+            data['strategy'] -= transaction_costs(
+                data['position'].to_numpy(), self.tc)
+
+        with self.profiler.stage('statistics'):
+            data['cum_returns'] = self.amount * \
+                data['return'].cumsum().apply(np.exp)
+            data['cum_strategy'] = self.amount * \
+                data['strategy'].cumsum().apply(np.exp)
         self.results = data
+        self.attach_profile()
 
         # absolute performance of the strategy
         absolute_perf = data['cum_strategy'].iloc[-1]
@@ -60,10 +83,68 @@ class MomVectorBackTester(object):
 
         return round(absolute_perf, 2), round(out_perf, 2)
 
+    def run_strategy_chunked(self, momentum: int = 1, source=None,
+                             chunk_size: int = 100_000,
+                             keep_results: bool = False):
+        ''' Same back-test as run_strategy, on chunks of `chunk_size` bars:
+        the rolling window, the last position and the cumulative sums are
+        carried from one chunk to the next, so memory does not grow with
+        the history length.
+
+        Parameters
+        ==========
+        source: str or pd.DataFrame
+            csv file streamed from disk, or a DataFrame (self.raw by default)
+        keep_results: bool
+            concatenate the chunk results into self.results (unbounded memory)
+        '''
+        self.momentum = momentum
+        source = self.raw if source is None else source
+        self.profiler.reset()
+        returns, cum_returns, cum_strategy = LogReturns(), CumSum(), CumSum()
+        rolling = RollingMean(momentum)
+        last_position = np.nan  # of the previous row
+        last_kept = np.nan  # of the previous row kept, for the trades
+        absolute_perf = out_perf = np.nan
+        kept = []
+        for chunk in iter_chunks(source, chunk_size):
+            with self.profiler.stage('chunks', bars=len(chunk)):
+                ret = returns.update(chunk.to_numpy(dtype=float))
+                valid = ~np.isnan(ret)
+                ret = ret[valid]
+                position = np.sign(rolling.update(ret))
+                strategy = np.concatenate(([last_position], position[:-1])) * ret
+                if len(position):
+                    last_position = position[-1]
+
+                keep = ~(np.isnan(position) | np.isnan(strategy))
+                position, ret, strategy = position[keep], ret[keep], strategy[keep]
+                # transaction costs when the position changes
+                strategy = strategy - transaction_costs(position, self.tc,
+                                                        last_kept)
+                if len(position):
+                    last_kept = position[-1]
+
+                cr = self.amount * np.exp(cum_returns.update(ret))
+                cs = self.amount * np.exp(cum_strategy.update(strategy))
+                if len(cs):
+                    absolute_perf, out_perf = cs[-1], cs[-1] - cr[-1]
+                if keep_results:
+                    kept.append(pd.DataFrame({
+                        'price': chunk.to_numpy()[valid][keep],
+                        'return': ret, 'position': position,
+                        'strategy': strategy,
+                        'cum_returns': cr, 'cum_strategy': cs,
+                    }, index=chunk.index[valid][keep]))
+        self.results = pd.concat(kept) if kept else None
+        self.attach_profile()
+
+        return round(absolute_perf, 2), round(out_perf, 2)
+
     def optimize_parameters(self, mom_range):
         raw = []
         for momentum in range(mom_range[0], mom_range[1], mom_range[2]):
-            (abs_perf, rel_perf) = self.run_strategy()
+            (abs_perf, rel_perf) = self.run_strategy(momentum)
 
             raw.append({
                 "momentum": momentum,
@@ -80,6 +161,27 @@ class MomVectorBackTester(object):
 
         return best_momentum, winner['absolute_perf']
 
+    def get_trades(self) -> pd.DataFrame:
+        ''' Returns the trades of the last run, one row per position held
+        with its log return, costs and holding period (see
+        accounting.trade_table).
+        '''
+        if self.results is None:
+            return None
+        return trade_table(self.results['position'].to_numpy(),
+                           self.results['return'].to_numpy(), self.tc,
+                           self.results.index)
+
+    def attach_profile(self):
+        ''' Attaches the profiling report of the last run to the results
+        (results.attrs['profile']) and returns it.
+        '''
+        if not self.profiler.enabled or self.results is None:
+            return None
+        report = self.profiler.report()
+        self.results.attrs['profile'] = report
+        return report
+
     def plot_results(self):
         ''' Plots the cumulative performance of the trading strategy
         compared to the symbol.
@@ -87,6 +189,7 @@ class MomVectorBackTester(object):
         if self.results is None:
             print('No results to plot yet. Run a strategy.')
         else:
+            get_plt()
             title = f"Momentum {self.momentum}"
             self.results[['cum_returns', 'cum_strategy']].plot(
                 title=title, figsize=(10, 6))
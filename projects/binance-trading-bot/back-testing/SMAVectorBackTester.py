@@ -9,39 +9,59 @@
 #
 import numpy as np
 import pandas as pd
-from pylab import mpl, plt
-plt.style.use('seaborn')
-mpl.rcParams['font.family'] = 'serif'
+from profiling import StageProfiler
+from plotting import get_plt
+from streaming import iter_chunks, RollingMean, CumSum, LogReturns
+from features import shared_graph
 
 
 class SMAVectorBackTester(object):
-    def __init__(self, initial_data: pd.DataFrame, sma1: int = 10, sma2: int = 26, verbose=True):
+    def __init__(self, initial_data: pd.DataFrame, sma1: int = 10, sma2: int = 26, verbose=True,
+                 profile=False, cprofile=None, features=None,
+                 profile_memory=False):
         """
         Parameters:
         ===========
         initial_data: pd.DataFrame
             index: Datetime, price: float
+        profile: bool
+            record wall time, CPU time and memory per stage of a run
+        cprofile: list
+            names of the stages to run under cProfile
+        profile_memory: bool
+            also record the allocated memory per stage (slower)
+        features: FeatureGraph
+            indicators shared with other testers, by default the
+            graph of initial_data (see features.shared_graph)
         """
         self.results = None
         self.benchmark = None
         self.sma1 = sma1
         self.sma2 = sma2
-        self.raw = initial_data.copy().dropna()
+        self.features = features or shared_graph(initial_data)
+        # no copy: the data may be a shared read-only data set
+        self.raw = self.features.data
         self.verbose = verbose
+        self.profiler = StageProfiler(profile or bool(cprofile), cprofile,
+                                      profile_memory)
 
     def run_strategy(self):
-        data = self.raw.copy()
-        data['return'] = np.log(data['price'] / data['price'].shift(1))
-        data.dropna(inplace=True)
-        data['SMA1'] = data['price'].rolling(self.sma1).mean()
-        data['SMA2'] = data['price'].rolling(self.sma2).mean()
-        data['position'] = np.where(data['SMA1'] > data['SMA2'], 1, -1)
-        data['strategy'] = data['position'].shift(1) * data['return']
-        data.dropna(inplace=True)
-        data['cum_returns'] = data['return'].cumsum().apply(np.exp)
-        data['cum_strategy'] = data['strategy'].cumsum().apply(np.exp)
-        data.dropna(inplace=True)
+        self.profiler.reset()
+        with self.profiler.stage('indicators'):
+            base = self.features.base()
+            data = base.data.copy()
+            data['SMA1'] = base.get('sma', self.sma1)
+            data['SMA2'] = base.get('sma', self.sma2)
+        with self.profiler.stage('strategy', bars=len(data)):
+            data['position'] = np.where(data['SMA1'] > data['SMA2'], 1, -1)
+            data['strategy'] = data['position'].shift(1) * data['return']
+            data.dropna(inplace=True)
+        with self.profiler.stage('statistics'):
+            data['cum_returns'] = data['return'].cumsum().apply(np.exp)
+            data['cum_strategy'] = data['strategy'].cumsum().apply(np.exp)
+            data.dropna(inplace=True)
         self.results = data
+        self.attach_profile()
 
         # gross performance of the strategy
         perf = data['cum_strategy'].iloc[-1]
@@ -50,6 +70,65 @@ class SMAVectorBackTester(object):
 
         return round(perf, 2), round(out_perf, 2)
 
+    def run_strategy_chunked(self, source=None, chunk_size: int = 100_000,
+                             keep_results: bool = False):
+        ''' Same back-test as run_strategy, on chunks of `chunk_size` bars:
+        the rolling windows and cumulative sums are carried from one chunk
+        to the next, so memory does not grow with the history length.
+
+        Parameters
+        ==========
+        source: str or pd.DataFrame
+            csv file streamed from disk, or a DataFrame (self.raw by default)
+        keep_results: bool
+            concatenate the chunk results into self.results (unbounded memory)
+        '''
+        source = self.raw if source is None else source
+        self.profiler.reset()
+        returns, cum_returns, cum_strategy = LogReturns(), CumSum(), CumSum()
+        sma1, sma2 = RollingMean(self.sma1), RollingMean(self.sma2)
+        last_position = np.nan
+        perf = out_perf = np.nan
+        kept = []
+        for chunk in iter_chunks(source, chunk_size):
+            with self.profiler.stage('chunks', bars=len(chunk)):
+                ret = returns.update(chunk.to_numpy(dtype=float))
+                valid = ~np.isnan(ret)
+                price, ret = chunk.to_numpy(dtype=float)[valid], ret[valid]
+                s1 = sma1.update(price)
+                s2 = sma2.update(price)
+                position = np.where(s1 > s2, 1, -1)
+                strategy = np.concatenate(([last_position], position[:-1])) * ret
+                if len(position):
+                    last_position = position[-1]
+
+                keep = ~(np.isnan(s1) | np.isnan(s2) | np.isnan(strategy))
+                cr = np.exp(cum_returns.update(ret[keep]))
+                cs = np.exp(cum_strategy.update(strategy[keep]))
+                if len(cs):
+                    perf, out_perf = cs[-1], cs[-1] - cr[-1]
+                if keep_results:
+                    kept.append(pd.DataFrame({
+                        'price': price[keep], 'return': ret[keep],
+                        'SMA1': s1[keep], 'SMA2': s2[keep],
+                        'position': position[keep], 'strategy': strategy[keep],
+                        'cum_returns': cr, 'cum_strategy': cs,
+                    }, index=chunk.index[valid][keep]))
+        self.results = pd.concat(kept) if kept else None
+        self.attach_profile()
+
+        return round(perf, 2), round(out_perf, 2)
+
+    def attach_profile(self):
+        ''' Attaches the profiling report of the last run to the results
+        (results.attrs['profile']) and returns it.
+        '''
+        if not self.profiler.enabled or self.results is None:
+            return None
+        report = self.profiler.report()
+        self.results.attrs['profile'] = report
+        return report
+
     def plot_results(self):
         ''' Plots the cumulative performance of the last trading strategy
         compared to the symbol.
@@ -57,6 +136,7 @@ class SMAVectorBackTester(object):
         if self.results is None:
             print('No results to plot yet. Run a strategy.')
         else:
+            get_plt()
             data = self.results.copy()
             data[['cum_returns', 'cum_strategy']].plot(figsize=(12, 6))
             data[['price', 'SMA1', 'SMA2']].plot(figsize=(12, 6))
@@ -0,0 +1,389 @@
+#
+# Python Script with Class
+# for Tick-Based Back-testing
+#
+# Trades (ticks) are read from disk in chunks: a .npy file of TICK_DTYPE
+# records is memory-mapped, a CSV file is streamed. The strategy state
+# (indicators, position, cash) is carried from one chunk to the next, so
+# data sets far larger than the memory can be back-tested.
+#
+import numpy as np
+import pandas as pd
+import datetime as dt
+from profiling import StageProfiler
+from TradeLedger import TradeLedger
+
+TICK_DTYPE = np.dtype([('time', '<i8'), ('price', '<f8'), ('qty', '<f8')])
+# columns of the binance trades dumps (data.binance.vision), without header
+BINANCE_TRADES = ['id', 'price', 'qty', 'quote_qty', 'time', 'is_buyer_maker',
+                  'is_best_match']
+
+
+def to_ms(date) -> int:
+    ''' Returns a (naive UTC) date as epoch milliseconds '''
+    return int(pd.Timestamp(date).value // 1_000_000)
+
+
+def _csv_reader(path: str, chunk_size: int):
+    ''' Streams a CSV of ticks: a binance trades dump, or a file with a
+    header holding time (ms) and price columns and optionally qty.
+    '''
+    with open(path) as f:
+        first = f.readline()
+    if first[:1].isdigit():
+        return pd.read_csv(path, header=None, names=BINANCE_TRADES,
+                           usecols=['time', 'price', 'qty'],
+                           chunksize=chunk_size)
+    header = first.strip().split(',')
+    usecols = [c for c in ('time', 'price', 'qty') if c in header]
+    return pd.read_csv(path, usecols=usecols, chunksize=chunk_size)
+
+
+def iter_ticks(path: str, chunk_size: int = 1_000_000, start=None, end=None):
+    ''' Yields the ticks of a file as (time, price, qty) arrays of at most
+    `chunk_size` ticks, between `start` (included) and `end` (excluded).
+
+    Parameters
+    ==========
+    path: str
+        .npy file of TICK_DTYPE records (memory-mapped) or CSV file
+        (streamed), sorted by time
+    start, end: datetime
+        optional (naive UTC) date range
+    '''
+    start = None if start is None else to_ms(start)
+    end = None if end is None else to_ms(end)
+
+    if path.endswith('.npy'):
+        ticks = np.load(path, mmap_mode='r')
+        times = ticks['time']
+        first = 0 if start is None else np.searchsorted(times, start)
+        last = len(ticks) if end is None else np.searchsorted(times, end)
+        for i in range(first, last, chunk_size):
+            chunk = ticks[i:min(i + chunk_size, last)]
+            yield chunk['time'], chunk['price'], chunk['qty']
+        return
+
+    for chunk in _csv_reader(path, chunk_size):
+        times = chunk['time'].to_numpy(np.int64)
+        past_end = end is not None and len(times) and times[-1] >= end
+        mask = np.ones(len(times), dtype=bool)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times < end
+        if not mask.all():
+            chunk = chunk[mask]
+            times = times[mask]
+        if len(times):
+            qty = chunk['qty'].to_numpy(np.float64) if 'qty' in chunk \
+                else np.zeros(len(times))
+            yield times, chunk['price'].to_numpy(np.float64), qty
+        if past_end:
+            break
+
+
+def convert_to_npy(csv_path: str, npy_path: str, chunk_size: int = 1_000_000,
+                   block_size: int = 1 << 24) -> int:
+    ''' Converts a CSV of ticks (see iter_ticks) into a .npy file of
+    TICK_DTYPE records, chunk by chunk. Returns the number of ticks.
+    '''
+    # count the rows first, to allocate the file
+    rows = 0
+    with open(csv_path, 'rb') as f:
+        header = not f.readline()[:1].isdigit()
+        f.seek(0)
+        last = b'\n'
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            rows += block.count(b'\n')
+            last = block[-1:]
+    rows += last != b'\n'
+    rows -= header
+
+    out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=TICK_DTYPE,
+                                    shape=(rows,))
+    i = 0
+    for times, prices, qty in iter_ticks(csv_path, chunk_size):
+        n = len(times)
+        out['time'][i:i + n] = times
+        out['price'][i:i + n] = prices
+        out['qty'][i:i + n] = qty
+        i += n
+    out.flush()
+    del out
+    return i
+
+
+class TickBackTester(object):
+    ''' Event-based back-testing on ticks, read chunk by chunk.
+
+    Attributes
+    ==========
+    path: str
+        tick file, see iter_ticks
+    start, end: datetime
+        optional date range of the ticks
+    amount: float
+        amount to be invested
+    ftc: float
+        fixed transaction costs per trade (buy or sell)
+    ptc: float
+        proportional transaction costs per trade (buy or sell)
+    chunk_size: int
+        number of ticks per chunk
+    sample: str
+        interval of the valuation samples kept in the result
+    ledger: TradeLedger
+        fills of the last run, `bar` being the tick number
+    fill_times: np.ndarray
+        tick time (ms) of each fill
+    result: DataFrame
+        price, position and valuation sampled every `sample`
+    ticks: int
+        number of ticks of the last run
+    profiler: StageProfiler
+        per-stage measures, the 'loop' stage reports ticks per second
+        (allocated memory too with profile_memory, slower)
+
+    Methods
+    =======
+    run_ema_strategy:
+        back-tests a long-only crossover of two tick EMAs
+    get_trades:
+        returns the fills of the last run as a DataFrame
+    get_round_trips:
+        returns the PnL and holding time of each closed position
+    print_strategy_resume:
+        prints final balance, performance and throughput
+    '''
+
+    def __init__(self, path, amount, start=None, end=None, ftc=0.0, ptc=0.0,
+                 chunk_size=1_000_000, sample='1min', verbose=True,
+                 profile=False, profile_memory=False):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.initial_amount = amount
+        self.ftc = ftc
+        self.ptc = ptc
+        self.chunk_size = chunk_size
+        self.sample = sample
+        self.verbose = verbose
+        self.profiler = StageProfiler(profile, memory=profile_memory)
+        self.reset_strategy()
+
+    def reset_strategy(self):
+        ''' Set defaults to be able to re-run a new strategy with clean input '''
+        self.amount = self.initial_amount
+        self.units = 0.0
+        self.position = 0
+        self.trades = 0
+        self.ticks = 0
+        self.first_price = None
+        self.last_price = None
+        self.last_time = None
+        self.ledger = TradeLedger()
+        self.fill_times = np.empty(0, dtype=np.int64)
+        self.result = None
+        self.elapsed = None
+        self.profiler.reset()
+
+    def run_ema_strategy(self, fast: int, slow: int):
+        ''' Back-testing a crossover of two exponential moving averages of
+        the tick prices: long while the fast EMA is above the slow one.
+
+        Parameters
+        ==========
+        fast, slow: int
+            spans of the EMAs, in ticks
+        '''
+        if self.verbose:
+            msg = f'\n\nRunning tick EMA strategy | fast={fast} & slow={slow}'
+            msg += f'\nfixed costs {self.ftc} | '
+            msg += f'proportional costs {self.ptc}'
+            print(msg)
+            print('=' * 55)
+
+        self.reset_strategy()
+        # strategy state, carried from one chunk to the next
+        state = {'fast': 0.0, 'slow': 0.0, 'n': 0, 'position': 0,
+                 'units': 0.0, 'cash': self.amount, 'next_sample': -1}
+        fills, fill_times, samples = [], [], []
+        sample_ms = pd.Timedelta(self.sample).value // 1_000_000
+        started = dt.datetime.now()
+
+        chunks = iter_ticks(self.path, self.chunk_size, self.start, self.end)
+        while True:
+            with self.profiler.stage('read'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            times, prices, _ = chunk
+            n = len(times)
+            with self.profiler.stage('loop', bars=n):
+                self._ema_kernel(times.tolist(), prices.tolist(), state,
+                                 2 / (fast + 1), 2 / (slow + 1), slow,
+                                 sample_ms, fills, fill_times, samples)
+            if self.first_price is None:
+                self.first_price = float(prices[0])
+            self.last_price = float(prices[-1])
+            self.last_time = int(times[-1])
+
+        self.elapsed = (dt.datetime.now() - started).total_seconds()
+        with self.profiler.stage('result'):
+            for fill in fills:
+                self.ledger.append(*fill)
+            self.fill_times = np.array(fill_times, dtype=np.int64)
+            self.ticks = state['n']
+            self.trades = len(fills)
+            self.amount = state['cash']
+            self.units = state['units']
+            self.position = state['position']
+            self.result = pd.DataFrame(
+                samples, columns=['time', 'price', 'position', 'valuation'])
+            self.result.index = pd.to_datetime(self.result.pop('time'),
+                                               unit='ms')
+            self.result.index.name = 'Date'
+        if self.ticks:
+            self.close_out()
+        if self.verbose:
+            self.print_strategy_resume()
+        return self.result
+
+    def _ema_kernel(self, times, prices, state, a_fast, a_slow, warmup,
+                    sample_ms, fills, fill_times, samples):
+        ''' Inner loop over the ticks of a chunk, on python lists and
+        local variables; `state` is read at the start and written back at
+        the end of the chunk.
+        '''
+        fast, slow, n = state['fast'], state['slow'], state['n']
+        position, units, cash = state['position'], state['units'], state['cash']
+        next_sample = state['next_sample']
+        ptc, ftc = self.ptc, self.ftc
+        for i in range(len(prices)):
+            price = prices[i]
+            if n == 0:
+                fast = slow = price
+            else:
+                fast += a_fast * (price - fast)
+                slow += a_slow * (price - slow)
+            n += 1
+            t = times[i]
+            if t >= next_sample:
+                samples.append((t - t % sample_ms, price, position,
+                                units * price + cash))
+                next_sample = t - t % sample_ms + sample_ms
+            if n <= warmup:
+                continue
+            if position == 0:
+                if fast > slow:
+                    size = (cash - ftc) / (price * (1 + ptc))
+                    if size <= 0:
+                        continue
+                    units = size
+                    fee = units * price * ptc + ftc
+                    cash -= units * price + fee
+                    position = 1
+                    fills.append((n - 1, 1, units, price, fee, cash, units))
+                    fill_times.append(t)
+            elif fast < slow:
+                fee = units * price * ptc + ftc
+                cash += units * price - fee
+                fills.append((n - 1, -1, units, price, fee, cash, 0.0))
+                fill_times.append(t)
+                units = 0.0
+                position = 0
+        state.update(fast=fast, slow=slow, n=n, position=position,
+                     units=units, cash=cash, next_sample=next_sample)
+
+    def close_out(self):
+        ''' Closing out the position at the last tick price '''
+        if self.units != 0:
+            price = self.last_price
+            self.amount += self.units * price
+            self.ledger.append(self.ticks - 1, -1, self.units, price, 0.0,
+                               self.amount, 0.0)
+            self.fill_times = np.append(self.fill_times, self.last_time)
+            self.trades += 1
+            self.units = 0.0
+            self.position = 0
+        if self.verbose:
+            date = pd.to_datetime(self.last_time, unit='ms')
+            print(f'{date} | closing trading at {self.amount:.2f}')
+            print('=' * 55)
+
+    def get_trades(self) -> pd.DataFrame:
+        ''' Returns the fills of the last run as a DataFrame '''
+        trades = self.ledger.to_frame()
+        trades.insert(0, 'date', pd.to_datetime(self.fill_times, unit='ms'))
+        return trades
+
+    def get_round_trips(self) -> pd.DataFrame:
+        ''' Returns the PnL and holding time of each closed position '''
+        trips = self.ledger.round_trips()
+        bars = self.ledger.column('bar')
+        times = pd.to_datetime(self.fill_times, unit='ms')
+        entry = times[np.searchsorted(bars, trips['entry_bar'].values)]
+        exit = times[np.searchsorted(bars, trips['exit_bar'].values)]
+        trips['holding_time'] = exit - entry
+        return trips
+
+    def get_gross_rate(self, initial: float, final: float) -> float:
+        return (final - initial) / initial
+
+    def print_strategy_resume(self):
+        ''' Print final balance, performance and throughput '''
+        perf = self.get_gross_rate(self.initial_amount, self.amount) * 100
+        print('Initial balance [$] {:.2f}'.format(self.initial_amount))
+        print('Final balance   [$] {:.2f}'.format(self.amount))
+        print('Net Performance [%] {:.2f}'.format(perf))
+        if self.first_price is not None:
+            sym_perf = self.get_gross_rate(self.first_price,
+                                           self.last_price) * 100
+            print('Sym Performance [%] {:.2f}'.format(sym_perf))
+        print('Trades Executed [#] {}'.format(self.trades))
+        print('Ticks processed [#] {}'.format(self.ticks))
+        if self.elapsed:
+            print('Throughput [ticks/s] {:,.0f}'.format(
+                self.ticks / self.elapsed))
+        print('=' * 55)
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        # synthetic ticks: 5 million trades over ~2 days
+        n = 5_000_000
+        rng = np.random.default_rng(0)
+        ticks = np.empty(n, dtype=TICK_DTYPE)
+        ticks['time'] = to_ms('2022-08-01') + np.cumsum(rng.integers(0, 70, n))
+        ticks['price'] = np.round(
+            24_000 * np.exp(np.cumsum(rng.normal(0, 2e-5, n))), 2)
+        ticks['qty'] = rng.exponential(0.01, n)
+        path = os.path.join(tempfile.mkdtemp(), 'ticks.npy')
+        np.save(path, ticks)
+        del ticks
+
+    tbt = TickBackTester(path, 10_000, ptc=0.001)
+    tbt.run_ema_strategy(2_000, 20_000)
+    print(tbt.get_round_trips().tail())
+
+    # the state carried across chunks gives the same result
+    small = TickBackTester(path, 10_000, ptc=0.001, chunk_size=77_777,
+                           verbose=False)
+    small.run_ema_strategy(2_000, 20_000)
+    assert small.amount == tbt.amount and small.trades == tbt.trades
+
+    # an amount below the fixed fee buys nothing and keeps the cash
+    poor = TickBackTester(path, 5, ftc=10, verbose=False)
+    poor.run_ema_strategy(2_000, 20_000)
+    assert poor.trades == 0 and poor.amount == 5 and poor.units == 0
+    assert (poor.result['valuation'] == 5).all()
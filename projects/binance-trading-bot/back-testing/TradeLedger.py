@@ -0,0 +1,126 @@
+#
+# Python Module with Class
+# for recording the fills of a back-test
+#
+import numpy as np
+import pandas as pd
+
+
+class TradeLedger(object):
+    ''' Columnar record of the fills of a back-test.
+
+    Columns are preallocated NumPy arrays, doubled when full, so
+    appending a fill is O(1) (amortized) and nothing is formatted or
+    printed while the back-test runs.
+
+    Attributes
+    ==========
+    bar: np.ndarray
+        bar index of the fill
+    side: np.ndarray
+        1 for a buy, -1 for a sell
+    units: np.ndarray
+        filled units (positive)
+    price: np.ndarray
+        fill price
+    fee: np.ndarray
+        transaction costs paid for the fill
+    cash: np.ndarray
+        cash balance after the fill
+    position: np.ndarray
+        units held after the fill
+
+    Methods
+    =======
+    append:
+        records a fill
+    to_frame:
+        returns the fills as a DataFrame
+    round_trips:
+        returns the PnL and holding time of each closed position
+    '''
+
+    COLUMNS = ('bar', 'side', 'units', 'price', 'fee', 'cash', 'position')
+    DTYPES = (np.int64, np.int8, np.float64, np.float64, np.float64,
+              np.float64, np.float64)
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        for name, dtype in zip(self.COLUMNS, self.DTYPES):
+            setattr(self, name, np.empty(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = max(2 * len(self.bar), 1)
+        for name in self.COLUMNS:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, bar: int, side: int, units: float, price: float,
+               fee: float, cash: float, position: float):
+        ''' Records a fill '''
+        if self.size == len(self.bar):
+            self._grow()
+        i = self.size
+        self.bar[i] = bar
+        self.side[i] = side
+        self.units[i] = units
+        self.price[i] = price
+        self.fee[i] = fee
+        self.cash[i] = cash
+        self.position[i] = position
+        self.size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        ''' Returns a view on the recorded values of a column '''
+        return getattr(self, name)[:self.size]
+
+    def to_frame(self, index: pd.Index = None) -> pd.DataFrame:
+        ''' Returns the fills as a DataFrame, with their date
+        when the bar `index` of the data is given.
+        '''
+        df = pd.DataFrame({name: self.column(name) for name in self.COLUMNS})
+        if index is not None:
+            df.insert(0, 'date', index[df['bar'].values])
+        return df
+
+    def round_trips(self, index: pd.Index = None) -> pd.DataFrame:
+        ''' Returns one row per closed position (from flat to flat) with
+        its direction, entry/exit bars and prices, PnL net of fees and
+        holding period (in bars, and as a duration when `index` is given).
+        '''
+        position = self.column('position')
+        cash_flow = -self.column('side') * self.column('units') * \
+            self.column('price') - self.column('fee')
+
+        # a round trip ends on every fill leaving the position flat
+        ends = np.flatnonzero(np.isclose(position, 0))
+        starts = np.concatenate(([0], ends[:-1] + 1))[:len(ends)]
+        # fills after the last flat point belong to the open position
+        closed = ends[-1] + 1 if len(ends) else 0
+        pnl = np.add.reduceat(cash_flow[:closed], starts) if closed else []
+        fees = np.add.reduceat(self.column('fee')[:closed], starts) \
+            if closed else []
+
+        bar = self.column('bar')
+        price = self.column('price')
+        trips = pd.DataFrame({
+            'direction': self.column('side')[starts],
+            'entry_bar': bar[starts],
+            'exit_bar': bar[ends],
+            'entry_price': price[starts],
+            'exit_price': price[ends],
+            'pnl': pnl,
+            'fees': fees,
+        })
+        # orders of zero units do not open a position
+        trips = trips[self.column('units')[starts] > 0].reset_index(drop=True)
+        trips['bars'] = trips['exit_bar'] - trips['entry_bar']
+        if index is not None:
+            trips['holding_time'] = index[trips['exit_bar'].values] - \
+                index[trips['entry_bar'].values]
+        return trips
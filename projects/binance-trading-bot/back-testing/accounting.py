@@ -0,0 +1,137 @@
+#
+# Python Module with functions
+# for vectorized trade accounting
+#
+# A position taken at the close of a bar earns the return of the next bar:
+# the strategy return of a bar is the previous position times the bar
+# return. Transaction costs are proportional to the size of the position
+# change (a flip from short to long pays twice) and are booked on the bar
+# of the change.
+#
+# Positions are 1-D (bars) or 2-D (rows x bars, e.g. params x bars or
+# assets x bars) arrays, the bars along the last axis. A NaN position (e.g.
+# during the warm-up of an indicator) is flat.
+#
+import numpy as np
+import pandas as pd
+
+
+def position_changes(position, previous=np.nan) -> np.ndarray:
+    ''' Returns the change of position at each bar.
+
+    Parameters
+    ==========
+    position: np.ndarray
+        position at the close of each bar, NaN being flat
+    previous: float or np.ndarray
+        position before the first bar (e.g. at the end of the previous
+        chunk, one per row), NaN when unknown: no change on the first bar
+    '''
+    position = np.nan_to_num(np.asarray(position, dtype=float))
+    previous = np.broadcast_to(np.asarray(previous, dtype=float)[..., None],
+                               position.shape[:-1] + (1,))
+    before = np.where(np.isnan(previous), position[..., :1], previous)
+    before = np.concatenate((before, position[..., :-1]), axis=-1)
+    return position - before
+
+
+def transaction_costs(position, tc: float, previous=np.nan) -> np.ndarray:
+    ''' Returns the costs (in log return) booked on each bar: tc times the
+    absolute change of position (see position_changes).
+    '''
+    return tc * np.abs(position_changes(position, previous))
+
+
+def trade_table(position, returns, tc: float = 0, index=None) -> pd.DataFrame:
+    ''' Returns one row per trade: a run of bars holding the same non-zero
+    position, with its log return, costs and holding period.
+
+    A trade entered at the close of bar `entry_bar` earns the returns of
+    the bars after it, up to `exit_bar` where the position changes (or the
+    last bar, the trade is then `open`). It pays tc * |position| at the
+    entry, except on the first bar where no cost is booked, and at the
+    exit. For positions of -1, 0 or 1 the costs of the trades add up to
+    transaction_costs. The return of the first bar, earned by a position
+    held before it, belongs to no trade. NaN positions are flat, like in
+    transaction_costs.
+
+    Parameters
+    ==========
+    position: np.ndarray
+        positions, 1-D or 2-D (rows x bars): a 'row' column then gives the
+        row of each trade
+    returns: np.ndarray
+        log returns of the bars, broadcast to the positions
+    tc: float
+        proportional transaction costs
+    index: pd.Index
+        dates of the bars, adds the holding time of the trades
+    '''
+    position = np.nan_to_num(np.asarray(position, dtype=float))
+    returns = np.broadcast_to(np.asarray(returns, dtype=float), position.shape)
+    # rows x bars, also for empty arrays
+    shape = (int(np.prod(position.shape[:-1])), position.shape[-1])
+    n = shape[1]
+    pos = position.reshape(shape)
+    ret = returns.reshape(shape)
+
+    # cumulative strategy return of each row, 0 before the first bar
+    pnl = np.zeros(shape)
+    pnl[:, 1:] = np.nan_to_num(pos[:, :-1] * ret[:, 1:])
+    pnl = np.cumsum(pnl, axis=1)
+
+    # runs of the same position
+    start = np.ones(pos.shape, dtype=bool)
+    start[:, 1:] = pos[:, 1:] != pos[:, :-1]
+    row, entry = np.nonzero(start)
+    last = np.ones(len(row), dtype=bool)
+    last[:-1] = row[1:] != row[:-1]
+    exit_ = np.where(last, n - 1, np.roll(entry, -1))
+
+    held = pos[row, entry]
+    size = np.abs(held)
+    gross = pnl[row, exit_] - pnl[row, entry]
+    costs = tc * size * ((entry > 0).astype(float) + ~last)
+    trades = pd.DataFrame({
+        'row': row,
+        'position': held,
+        'entry_bar': entry,
+        'exit_bar': exit_,
+        'bars': exit_ - entry,
+        'return': gross,
+        'costs': costs,
+        'net_return': gross - costs,
+        'open': last,
+    })
+    trades = trades[size > 0].reset_index(drop=True)
+    if position.ndim == 1:
+        trades.drop(columns='row', inplace=True)
+    if index is not None:
+        trades['holding_time'] = index[trades['exit_bar'].values] - \
+            index[trades['entry_bar'].values]
+    return trades
+
+
+if __name__ == '__main__':
+    # the trades add up to the strategy returns, on a (params x bars)
+    # batch of momentum positions with NaN warm-ups of different lengths
+    n, tc = 10_000, 0.001
+    returns = np.random.default_rng(0).normal(0, 1e-3, n)
+    windows = range(1, 60, 5)
+    position = np.vstack([
+        np.sign(pd.Series(returns).rolling(window).mean().to_numpy())
+        for window in windows])
+    position[3, 5_000:5_010] = np.nan  # missing values inside a row
+
+    held = np.nan_to_num(position)
+    strategy = np.zeros(position.shape)
+    strategy[:, 1:] = held[:, :-1] * returns[1:]
+    strategy -= transaction_costs(position, tc)
+
+    trades = trade_table(position, returns, tc)
+    net = trades.groupby('row')['net_return'].sum()
+    assert np.allclose(net.to_numpy(), strategy.sum(axis=1)), \
+        (net.to_numpy(), strategy.sum(axis=1))
+    assert trade_table(np.array([]), np.array([])).empty
+    print(f'{len(trades)} trades in {len(windows)} rows: the net returns '
+          f'add up to the strategy returns')
@@ -0,0 +1,242 @@
+#
+# Python Script to benchmark
+# the back-testing engines
+#
+# Usage:
+#   python benchmark.py --sizes 10000 100000 --output bench.json
+#   python benchmark.py --baseline bench.json --threshold 0.2
+#
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+import data_store
+from BackTestBase import BackTestBase
+from BackTestLongOnly import BackTestLongOnly
+from BackTestLongOnlyVector import BackTestLongOnlyVector
+from BackTestLongShort import BackTestLongShort
+from SMAVectorBackTester import SMAVectorBackTester
+from MomVectorBackTester import MomVectorBackTester
+from MRVectorBackTester import MRVectorBackTester
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# the event engines loop over bars in Python, above this size
+# a single run takes minutes so they are skipped by default
+MAX_EVENT_BARS = 100_000
+
+
+def synthetic_prices(bars: int, seed: int = 42) -> pd.DataFrame:
+    ''' Returns a geometric brownian motion of 1m close prices
+    with a Date index and a price column, like the binance klines.
+    '''
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.001, bars)
+    price = 20_000 * np.exp(np.cumsum(returns))
+    index = pd.date_range('2020-01-01', periods=bars, freq='1min',
+                          name='Date')
+    return pd.DataFrame({'price': price}, index=index)
+
+
+def machine_info() -> dict:
+    ''' Describes the machine and library versions the results come from '''
+    info = {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+    try:
+        pages = os.sysconf('SC_PHYS_PAGES')
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        info['memory_gb'] = round(pages * page_size / 1024 ** 3, 2)
+    except (ValueError, OSError, AttributeError):
+        pass
+    return info
+
+
+def measure(func, repeat=1, memory=True) -> dict:
+    ''' Times `func` (best of `repeat` runs) and records its peak
+    allocated memory in a separate traced run.
+    '''
+    timings = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t0)
+    result = {'seconds': min(timings)}
+
+    if memory:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result['peak_mb'] = round(peak / 1024 ** 2, 3)
+    return result
+
+
+def get_cases(data: pd.DataFrame, csv_file: str, max_event_bars: int):
+    ''' Returns a list of (case name, callable) to benchmark on `data` '''
+    bars = len(data)
+    start = data.index[0] - dt.timedelta(minutes=1)
+    end = data.index[-1] + dt.timedelta(minutes=1)
+
+    def new_event(cls):
+        return cls(start, end, 100_000, verbose=False, csv_file=csv_file,
+                   plot=False)
+
+    # statistics are timed on a result frame built without running a loop
+    stats_bt = new_event(BackTestBase)
+
+    def calculate_statistics():
+        stats_bt.result = stats_bt.data.assign(
+            valuation=stats_bt.data['price'], position=1)
+        stats_bt.calculate_statistics()
+
+    def get_data():
+        # stats_bt already loaded the file: time a read from disk, not
+        # a hit in the load_csv cache
+        data_store._cache.clear()
+        stats_bt.get_data(csv_file)
+
+    cases = [
+        ('BackTestBase.get_data', get_data),
+        ('BackTestBase.calculate_statistics', calculate_statistics),
+    ]
+
+    if bars <= max_event_bars:
+        long_only = new_event(BackTestLongOnly)
+        long_short = new_event(BackTestLongShort)
+        cases += [
+            ('BackTestLongOnly.run_sma_strategy',
+             lambda: long_only.run_sma_strategy(90, 194)),
+            ('BackTestLongOnly.run_momentum_strategy',
+             lambda: long_only.run_momentum_strategy(10)),
+            ('BackTestLongShort.run_momentum_strategy',
+             lambda: long_short.run_momentum_strategy(10)),
+        ]
+
+    long_only_vector = new_event(BackTestLongOnlyVector)
+    cases += [
+        ('BackTestLongOnlyVector.run_sma_strategy',
+         lambda: long_only_vector.run_sma_strategy(90, 194)),
+        ('BackTestLongOnlyVector.run_momentum_strategy',
+         lambda: long_only_vector.run_momentum_strategy(10)),
+    ]
+
+    sma_bt = SMAVectorBackTester(data, 90, 194, verbose=False)
+    mom_bt = MomVectorBackTester(data, 100_000, verbose=False)
+    mr_bt = MRVectorBackTester(data, 100_000, verbose=False)
+    cases += [
+        ('SMAVectorBackTester.run_strategy', sma_bt.run_strategy),
+        ('SMAVectorBackTester.optimize_parameters',
+         lambda: sma_bt.optimize_parameters((10, 51, 20), (60, 201, 70))),
+        ('MomVectorBackTester.run_strategy',
+         lambda: mom_bt.run_strategy(10)),
+        ('MomVectorBackTester.optimize_parameters',
+         lambda: mom_bt.optimize_parameters((1, 51, 10))),
+        ('MRVectorBackTester.run_strategy',
+         lambda: mr_bt.run_strategy(25, 50)),
+    ]
+    return cases
+
+
+def run_benchmarks(sizes, repeat=1, memory=True, max_event_bars=MAX_EVENT_BARS,
+                   cases=None) -> dict:
+    ''' Runs every benchmark case on synthetic data of each size.
+
+    Parameters
+    ==========
+    sizes: list
+        number of bars of the synthetic data sets
+    repeat: int
+        timings are the best of `repeat` runs
+    memory: bool
+        record the peak allocated memory of each case
+    max_event_bars: int
+        skip the event-based engines above this size
+    cases: list
+        optional case names to run, all by default
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for bars in sizes:
+            data = synthetic_prices(bars)
+            csv_file = os.path.join(tmp, f'synthetic-{bars}.csv')
+            data.to_csv(csv_file)
+
+            for name, func in get_cases(data, csv_file, max_event_bars):
+                if cases and name not in cases:
+                    continue
+                row = {'case': name, 'bars': bars}
+                row.update(measure(func, repeat, memory))
+                results.append(row)
+                print(f"{name:<42} {bars:>10} bars "
+                      f"{row['seconds']:>10.4f} s")
+            os.remove(csv_file)
+
+    return {
+        'created': dt.datetime.now().isoformat(timespec='seconds'),
+        'machine': machine_info(),
+        'results': results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float = 0.1) -> list:
+    ''' Returns the cases slower than the baseline by more than `threshold`
+    (e.g. 0.1 = 10%).
+    '''
+    previous = {(r['case'], r['bars']): r for r in baseline['results']}
+    regressions = []
+    for row in report['results']:
+        base = previous.get((row['case'], row['bars']))
+        if base is None:
+            continue
+        ratio = row['seconds'] / base['seconds']
+        if ratio > 1 + threshold:
+            regressions.append({**row, 'baseline_seconds': base['seconds'],
+                                'ratio': round(ratio, 3)})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--cases', nargs='+', default=None)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--max-event-bars', type=int, default=MAX_EVENT_BARS)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, args.repeat, not args.no_memory,
+                            args.max_event_bars, args.cases)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results saved in {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} ({r['bars']} bars): "
+                  f"{r['baseline_seconds']:.4f} s -> {r['seconds']:.4f} s "
+                  f"(x{r['ratio']})")
+        if regressions:
+            sys.exit(1)
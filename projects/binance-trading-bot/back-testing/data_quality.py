@@ -0,0 +1,172 @@
+#
+# Python Module with functions
+# for validating and repairing kline data
+#
+# Missing minutes, duplicated timestamps and exchange outages distort
+# rolling windows and returns. Every check is a vectorized pass over the
+# int64 timestamps or the prices, so they can run on each load of
+# million-row data sets.
+#
+#   data, report = validate(raw, freq='1min', repair_data=True, limit=5)
+#
+import numpy as np
+import pandas as pd
+
+FILL_POLICIES = ('ffill', 'interpolate', 'nan', 'drop')
+
+
+def timestamps(index: pd.DatetimeIndex) -> np.ndarray:
+    ''' Returns the index as int64 nanoseconds '''
+    return index.values.astype('datetime64[ns]').view(np.int64)
+
+
+def find_duplicates(index: pd.DatetimeIndex) -> np.ndarray:
+    ''' Returns a mask of the rows repeating an earlier timestamp '''
+    return index.duplicated(keep='first')
+
+
+def find_gaps(index: pd.DatetimeIndex, freq='1min') -> pd.DataFrame:
+    ''' Returns one row per gap of a sorted index: the last timestamp
+    before the gap, the first after it and the number of missing bars.
+    '''
+    ts = timestamps(index)
+    step = pd.Timedelta(freq).value
+    delta = np.diff(ts)
+    at = np.flatnonzero(delta > step)
+    return pd.DataFrame({
+        'start': index[at],
+        'end': index[at + 1],
+        'missing': delta[at] // step - (delta[at] % step == 0),
+    })
+
+
+def find_misaligned(index: pd.DatetimeIndex, freq='1min') -> np.ndarray:
+    ''' Returns a mask of the timestamps off the `freq` grid '''
+    return timestamps(index) % pd.Timedelta(freq).value != 0
+
+
+def flag_outliers(price: pd.Series, threshold=10.0,
+                  window=None) -> pd.Series:
+    ''' Flags the log returns further than `threshold` robust standard
+    deviations (scaled median absolute deviation) from the median, over
+    the whole series or a rolling `window` of bars.
+    '''
+    returns = np.log(price / price.shift(1))
+    if window is None:
+        median = returns.median()
+        mad = (returns - median).abs().median()
+    else:
+        median = returns.rolling(window, min_periods=1).median()
+        mad = (returns - median).abs().rolling(
+            window, min_periods=1).median()
+    scale = 1.4826 * mad
+    score = (returns - median).abs() / scale
+    return (score > threshold).fillna(False) & (scale > 0)
+
+
+def repair(data: pd.DataFrame, freq='1min', fill='ffill',
+           limit=None) -> pd.DataFrame:
+    ''' Returns the data sorted, without duplicated timestamps (the last
+    row is kept) and reindexed onto the complete `freq` grid.
+
+    Parameters
+    ==========
+    fill: str
+        how missing bars are filled: 'ffill' (last price), 'interpolate'
+        (linear in time), 'nan' (left missing) or 'drop' (grid not
+        completed)
+    limit: int
+        maximum number of consecutive bars filled, longer outages are
+        left missing
+    '''
+    if fill not in FILL_POLICIES:
+        raise ValueError(f'fill must be one of {FILL_POLICIES}')
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index(kind='stable')
+    data = data[~data.index.duplicated(keep='last')]
+    if fill == 'drop' or data.empty:
+        return data
+
+    grid = pd.date_range(data.index[0].floor(freq), data.index[-1],
+                         freq=freq, unit=data.index.unit, name=data.index.name)
+    data = data.reindex(grid)
+    if fill == 'ffill':
+        data = data.ffill(limit=limit)
+    elif fill == 'interpolate':
+        data = data.interpolate(method='time', limit=limit,
+                                limit_area='inside')
+    return data
+
+
+def validate(data: pd.DataFrame, freq='1min', column='price',
+             repair_data=False, fill='ffill', limit=None,
+             outlier_threshold=10.0, outlier_window=None,
+             mark_outliers=True, verbose=False):
+    ''' Checks (and optionally repairs) kline data.
+
+    Parameters
+    ==========
+    data: pd.DataFrame
+        klines indexed by date
+    freq: str
+        expected bar interval
+    column: str
+        price column checked for outlier returns
+    repair_data: bool
+        return the repaired data (see repair) instead of the input
+    fill, limit:
+        fill policy of the repaired data
+    outlier_threshold, outlier_window:
+        see flag_outliers
+    mark_outliers: bool
+        add the boolean 'outlier' column when outliers are found
+
+    Returns
+    =======
+    data: pd.DataFrame
+        the input, or the repaired data, with a boolean 'outlier' column
+        when outliers are found
+    report: dict
+        counts of unsorted rows, duplicates, misaligned timestamps, gaps,
+        missing bars, missing values and outliers, and the largest gap
+    '''
+    index = data.index
+    report = {
+        'rows': len(data),
+        'unsorted': int(np.count_nonzero(np.diff(timestamps(index)) < 0)),
+        'duplicates': int(np.count_nonzero(find_duplicates(index))),
+        'misaligned': int(np.count_nonzero(find_misaligned(index, freq))),
+        'missing_values': int(data.isna().any(axis=1).sum()),
+    }
+    clean = data
+    if report['unsorted'] or report['duplicates']:
+        clean = repair(data, freq, fill='drop')
+    gaps = find_gaps(clean.index, freq)
+    report['gaps'] = len(gaps)
+    report['missing_bars'] = int(gaps['missing'].sum())
+    if len(gaps):
+        largest = gaps.loc[gaps['missing'].idxmax()]
+        report['largest_gap'] = {'start': str(largest['start']),
+                                 'end': str(largest['end']),
+                                 'missing': int(largest['missing'])}
+
+    if repair_data:
+        data = repair(data, freq, fill, limit)
+    if column in data:
+        outliers = flag_outliers(data[column], outlier_threshold,
+                                 outlier_window)
+        report['outliers'] = int(outliers.sum())
+        if mark_outliers and report['outliers']:
+            data = data.assign(outlier=outliers)
+
+    if verbose:
+        print(' | '.join(f'{k} {v}' for k, v in report.items()
+                         if k != 'largest_gap'))
+    return data, report
+
+
+if __name__ == '__main__':
+    raw = pd.read_csv('./BTCUSDT-1m-2020-01-01_2022-08-11.csv',
+                      index_col=0, parse_dates=True)
+    data, report = validate(raw, repair_data=True, limit=5, verbose=True)
+    print(report.get('largest_gap'))
@@ -0,0 +1,156 @@
+#
+# Python Module with functions
+# for loading date-indexed CSV files
+#
+# load_csv() reads only the requested columns with explicit dtypes, and
+# only the requested date range: a sidecar index (<file>.idx.json) keeps
+# the byte offset of the first row of each day, so a range is read by
+# seeking instead of parsing the whole file. Parsed frames are cached in
+# memory, keyed by the file modification time and size.
+#
+# The CSV rows must be sorted by date, the first column being the date
+# (e.g. 2022-06-01 00:00:00). Unsorted files are read in full.
+#
+import os
+import io
+import json
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+# parsed frames by (path, columns, start, end, dtype)
+_cache = OrderedDict()
+CACHE_SIZE = 8
+
+
+def csv_engine() -> str:
+    ''' Returns the fastest available pandas CSV engine '''
+    try:
+        import pyarrow  # noqa: F401
+        return 'pyarrow'
+    except ImportError:
+        return 'c'
+
+
+def file_stamp(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def build_index(path: str) -> dict:
+    ''' Scans the file once and returns its day index:
+    the header size and the byte offset of the first row of each day.
+    '''
+    data = np.fromfile(path, dtype=np.uint8)
+    starts = np.flatnonzero(data == ord('\n')) + 1
+    header_end = int(starts[0]) if len(starts) else len(data)
+    starts = starts[starts + 10 <= len(data)]
+
+    # the first 10 bytes of a row are its day (YYYY-MM-DD)
+    days = data[starts[:, None] + np.arange(10)]
+    days = days.copy().view('S10').ravel()
+    new_day = np.ones(len(days), dtype=bool)
+    new_day[1:] = days[1:] != days[:-1]
+    first = np.flatnonzero(new_day)
+
+    index = {'stamp': list(file_stamp(path)), 'header_end': header_end,
+             'sorted': bool(np.all(days[first][1:] > days[first][:-1])),
+             'days': [d.decode() for d in days[first]],
+             'offsets': starts[first].tolist()}
+    return index
+
+
+def get_index(path: str) -> dict:
+    ''' Returns the day index of a file, from its sidecar when it is up
+    to date, else rebuilt and saved next to the file.
+    '''
+    sidecar = f'{path}.idx.json'
+    try:
+        with open(sidecar) as f:
+            index = json.load(f)
+        if tuple(index['stamp']) == file_stamp(path):
+            return index
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    index = build_index(path)
+    try:
+        with open(sidecar, 'w') as f:
+            json.dump(index, f)
+    except OSError:
+        # read-only data directory, the index is rebuilt next time
+        pass
+    return index
+
+
+def read_range(path: str, start=None, end=None) -> io.BytesIO:
+    ''' Returns the header and the rows of the days from `start`
+    to `end` (inclusive), read by seeking to their byte offsets.
+    '''
+    index = get_index(path)
+    days = index['days']
+    with open(path, 'rb') as f:
+        header = f.read(index['header_end'])
+        if not index['sorted']:
+            return io.BytesIO(header + f.read())
+        first = 0 if start is None else np.searchsorted(
+            days, pd.Timestamp(start).strftime('%Y-%m-%d'), 'left')
+        last = len(days) if end is None else np.searchsorted(
+            days, pd.Timestamp(end).strftime('%Y-%m-%d'), 'right')
+        if first >= last:
+            return io.BytesIO(header)
+        offsets = index['offsets']
+        f.seek(offsets[first])
+        size = offsets[last] - offsets[first] if last < len(days) else -1
+        return io.BytesIO(header + f.read(size))
+
+
+def load_csv(path: str, columns=None, start=None, end=None,
+             dtype='float64', cache=True) -> pd.DataFrame:
+    ''' Loads a date-indexed CSV file.
+
+    Parameters
+    ==========
+    path: str
+        CSV file, the first column being the date
+    columns: list
+        value columns to read, all when None
+    start, end: datetime
+        optional date range, inclusive like DataFrame.loc[start:end]
+    dtype: str
+        dtype of the value columns
+    cache: bool
+        reuse the frame parsed by a previous call while the file is
+        unchanged
+
+    Returns
+    =======
+    data: pd.DataFrame
+        the selected rows and columns, indexed by date
+    '''
+    key = (os.path.abspath(path), tuple(columns or ()), str(start), str(end),
+           dtype)
+    stamp = file_stamp(path)
+    if cache and key in _cache and _cache[key][0] == stamp:
+        _cache.move_to_end(key)
+        return _cache[key][1].copy()
+
+    buffer = read_range(path, start, end)
+    names = buffer.readline().decode().strip().split(',')
+    buffer.seek(0)
+    usecols = None if columns is None else [names[0]] + list(columns)
+    values = names[1:] if columns is None else columns
+    data = pd.read_csv(buffer, index_col=0, usecols=usecols,
+                       parse_dates=True, dtype={c: dtype for c in values},
+                       engine=csv_engine())
+    if not isinstance(data.index, pd.DatetimeIndex):
+        # no row in the range
+        data.index = pd.to_datetime(data.index)
+    data = data.loc[start:end]
+
+    if cache:
+        _cache[key] = (stamp, data)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+        return data.copy()
+    return data
@@ -0,0 +1,153 @@
+#
+# Python Module with functions
+# for Vectorized Stop-Loss / Take-Profit simulation
+#
+import numpy as np
+import pandas as pd
+
+
+def first_touch(values, level, start, stop=None, below=True, window=256):
+    ''' Returns the index of the first bar in [start, stop) where `values`
+    touches `level`, or -1 if it never does.
+
+    The search runs over windows of growing size (so the cost follows the
+    holding period, not the length of the data). Inside a window the running
+    min (or max) is monotone, so the first breach is found by searchsorted.
+
+    Parameters
+    ==========
+    values: np.ndarray
+        low prices (below=True) or high prices (below=False)
+    level: float
+        price level to test against
+    start, stop: int
+        bar range to search in, stop defaults to the end of the data
+    below: bool
+        look for values <= level when True, values >= level otherwise
+    window: int
+        size of the first search window, doubled after each miss
+    '''
+    if stop is None or stop > len(values):
+        stop = len(values)
+    lo = start
+    while lo < stop:
+        hi = min(lo + window, stop)
+        chunk = values[lo:hi]
+        if below:
+            # non-increasing, negated to get a sorted array
+            running = -np.minimum.accumulate(chunk)
+            idx = np.searchsorted(running, -level, side='left')
+        else:
+            running = np.maximum.accumulate(chunk)
+            idx = np.searchsorted(running, level, side='left')
+        if idx < len(chunk):
+            return lo + int(idx)
+        lo = hi
+        window *= 2
+    return -1
+
+
+def simulate_exits(entries, open_, high, low, close, stop, target,
+                   direction=1, max_bars=None):
+    ''' Simulates stop-loss / take-profit exits on OHLC bars.
+
+    A position is entered at the close of each entry bar and checked against
+    its stop and target levels from the next bar on. Entries occurring while
+    a position is open are ignored (one position at a time).
+
+    When a bar touches both levels the stop is assumed to be hit first.
+    A stop gapped through at the open is filled at the open, a target is
+    always filled at its limit price.
+
+    Parameters
+    ==========
+    entries: np.ndarray
+        boolean mask of entry bars or array of entry bar indexes
+    open_, high, low, close: np.ndarray
+        OHLC prices
+    stop, target: np.ndarray, float
+        stop-loss and take-profit levels, per bar (the level of the entry bar
+        is used) or scalar
+    direction: int
+        1 for long positions, -1 for short positions
+    max_bars: int
+        optional time exit, at the close, after max_bars bars
+
+    Returns
+    =======
+    trades: pd.DataFrame
+        one row per trade with entry/exit bars, prices, exit reason
+        ('stop', 'target', 'time' or 'end') and log return
+    '''
+    open_, high, low, close = (np.asarray(a, dtype=float)
+                               for a in (open_, high, low, close))
+    n = len(close)
+    entries = np.asarray(entries)
+    if entries.dtype == bool:
+        entries = np.flatnonzero(entries)
+    entries = np.sort(entries)
+    stop = np.broadcast_to(np.asarray(stop, dtype=float), (n,))
+    target = np.broadcast_to(np.asarray(target, dtype=float), (n,))
+
+    # long: the stop is breached by lows, the target by highs
+    stop_side, target_side = (low, high) if direction > 0 else (high, low)
+
+    rows = []
+    i = 0
+    while i < len(entries):
+        entry = int(entries[i])
+        if entry >= n - 1:
+            break
+        end = n if max_bars is None else min(entry + 1 + max_bars, n)
+
+        stop_bar = first_touch(stop_side, stop[entry], entry + 1, end,
+                               below=direction > 0)
+        target_bar = first_touch(target_side, target[entry], entry + 1, end,
+                                 below=direction < 0)
+
+        if stop_bar >= 0 and (target_bar < 0 or stop_bar <= target_bar):
+            exit_bar, reason = stop_bar, 'stop'
+            gapped = (open_[exit_bar] - stop[entry]) * direction < 0
+            exit_price = open_[exit_bar] if gapped else stop[entry]
+        elif target_bar >= 0:
+            exit_bar, reason = target_bar, 'target'
+            exit_price = target[entry]
+        else:
+            exit_bar = end - 1
+            reason = 'end' if end == n else 'time'
+            exit_price = close[exit_bar]
+
+        rows.append((entry, exit_bar, close[entry], exit_price,
+                     stop[entry], target[entry], reason))
+
+        # next entry strictly after the exit bar
+        i = int(np.searchsorted(entries, exit_bar, side='right'))
+
+    trades = pd.DataFrame(rows, columns=['entry_bar', 'exit_bar',
+                                         'entry_price', 'exit_price',
+                                         'stop', 'target', 'reason'])
+    trades['bars'] = trades['exit_bar'] - trades['entry_bar']
+    trades['return'] = direction * np.log(trades['exit_price'] /
+                                          trades['entry_price'])
+    return trades
+
+
+if __name__ == '__main__':
+    # SMA crossover entries with ATR based levels,
+    # as in pinescript/strategies/learning/take-profit-stop-lose.pine
+    raw = pd.read_csv('../../py4at-04-vector-back-test/AAPL_1min_05052020.csv',
+                      index_col=0, parse_dates=True).dropna()
+    sma1 = raw['CLOSE'].rolling(10).mean()
+    sma2 = raw['CLOSE'].rolling(30).mean()
+    true_range = np.maximum(raw['HIGH'], raw['CLOSE'].shift(1)) - \
+        np.minimum(raw['LOW'], raw['CLOSE'].shift(1))
+    atr = true_range.ewm(alpha=1 / 14, adjust=False).mean()
+    crossover = (sma1 > sma2) & (sma1.shift(1) <= sma2.shift(1))
+
+    trades = simulate_exits(crossover.values, raw['OPEN'].values,
+                            raw['HIGH'].values, raw['LOW'].values,
+                            raw['CLOSE'].values,
+                            stop=(raw['LOW'] - 2 * atr).values,
+                            target=(raw['HIGH'] + 2 * atr).values)
+    print(trades)
+    print(f"Strategy return [%] {np.exp(trades['return'].sum()) * 100 - 100:.2f}")
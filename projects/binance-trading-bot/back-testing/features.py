@@ -0,0 +1,203 @@
+#
+# Python Module with Class
+# for sharing indicator computations between strategies
+#
+# Strategies ask a FeatureGraph for the features they need, e.g.
+# graph.get('sma', 20). Each feature is computed from the features it
+# depends on, once per data set: the results are kept in a cache bounded
+# in bytes (least recently used first out). The graph of the data without
+# its first row (base) shares the cache and so the limit of its parent.
+#
+#   graph = shared_graph(raw)      # same graph for every user of raw
+#   graph.get('distance', 50)      # computes sma 50, then the distance
+#   graph.base().get('sma', 20)    # on the data without its first row
+#
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+MAX_BYTES = 256 * 1024 ** 2
+
+# name: function(graph, *params) computing the feature
+FEATURES = {}
+# features read from the data when it has the column
+COLUMNS = ('price', 'return')
+
+
+def feature(name: str):
+    ''' Registers a feature function under `name` '''
+    def register(compute):
+        FEATURES[name] = compute
+        return compute
+    return register
+
+
+@feature('price')
+def price_feature(graph):
+    return graph.data['price']
+
+
+@feature('return')
+def return_feature(graph):
+    ''' log return of the price '''
+    price = graph.get('price')
+    return np.log(price / price.shift(1))
+
+
+@feature('sma')
+def sma_feature(graph, window: int):
+    ''' simple moving average of the price '''
+    return graph.get('price').rolling(window).mean()
+
+
+@feature('momentum')
+def momentum_feature(graph, window: int):
+    ''' mean of the returns over `window` bars '''
+    return graph.get('return').rolling(window).mean()
+
+
+@feature('distance')
+def distance_feature(graph, window: int):
+    ''' distance of the price to its simple moving average '''
+    return graph.get('price') - graph.get('sma', window)
+
+
+class FeatureGraph(object):
+    ''' Computes and caches the features of a data set.
+
+    Attributes
+    ==========
+    data: DataFrame
+        data set, with at least a price column
+    max_bytes: int
+        size limit of the cached features, of this graph and its base
+    root: FeatureGraph
+        graph holding the cache, this one or the graph it is the base of
+    hits, misses, evictions: int
+        cache statistics (of the root)
+
+    Methods
+    =======
+    get:
+        returns a feature, computed once
+    frame:
+        returns several features as a DataFrame
+    base:
+        returns the graph of the data with returns, without its first row
+    stats:
+        returns the cache statistics
+    clear:
+        empties the cache
+    '''
+
+    def __init__(self, data: pd.DataFrame, max_bytes: int = MAX_BYTES,
+                 parent=None):
+        self.data = data
+        self.max_bytes = max_bytes
+        self.parent = parent
+        self.root = self if parent is None else parent.root
+        # keys of the shared cache start with the depth of the graph
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.cache = OrderedDict() if parent is None else self.root.cache
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._base = None
+
+    def get(self, name: str, *params) -> pd.Series:
+        ''' Returns the feature `name` with its parameters, e.g.
+        get('sma', 20), computing it (and its dependencies) if needed.
+        '''
+        if name in COLUMNS and not params and name in self.data:
+            return self.data[name]
+        root = self.root
+        key = (self.depth, name) + params
+        if key in root.cache:
+            root.hits += 1
+            root.cache.move_to_end(key)
+            return root.cache[key]
+        if name not in FEATURES:
+            raise ValueError(f'Unknown feature {name}')
+        root.misses += 1
+        value = FEATURES[name](self, *params)
+        root._store(key, value)
+        return value
+
+    def _store(self, key, value: pd.Series):
+        size = value.values.nbytes
+        if size > self.max_bytes:
+            return
+        while self.cache and self.nbytes + size > self.max_bytes:
+            _, old = self.cache.popitem(last=False)
+            self.nbytes -= old.values.nbytes
+            self.evictions += 1
+        self.cache[key] = value
+        self.nbytes += size
+
+    def frame(self, *keys) -> pd.DataFrame:
+        ''' Returns the features of `keys` as columns, e.g.
+        frame(('sma', 10), ('sma', 50)).
+        '''
+        return pd.DataFrame({'_'.join(map(str, key)): self.get(*key)
+                             for key in keys})
+
+    def base(self) -> 'FeatureGraph':
+        ''' Returns the graph of the data with a return column and without
+        missing values (the first row): the data the vector testers and
+        the event engines run on. Its returns come from this graph.
+        '''
+        if self._base is None:
+            data = self.data.copy()
+            data['return'] = self.get('return')
+            data = data.dropna()
+            self._base = FeatureGraph(data, self.max_bytes, parent=self)
+        return self._base
+
+    def stats(self) -> dict:
+        ''' Returns the statistics of the cache, shared with the base '''
+        root = self.root
+        return {'features': len(root.cache), 'mb': root.nbytes / 1024 ** 2,
+                'hits': root.hits, 'misses': root.misses,
+                'evictions': root.evictions}
+
+    def clear(self):
+        ''' Empties the cache, of the base too '''
+        root = self.root
+        root.cache.clear()
+        root.nbytes = 0
+        root._base = None
+
+
+# id(DataFrame): (weak reference to it, its fingerprint, its FeatureGraph)
+_graphs = {}
+
+
+def fingerprint(data: pd.DataFrame) -> tuple:
+    ''' Returns a cheap fingerprint of a data set: its shape, first and
+    last dates and the sum of its prices.
+    '''
+    if data.empty:
+        return (data.shape,)
+    return (data.shape, data.index[0], data.index[-1],
+            float(np.nansum(data['price'].to_numpy(dtype=float))))
+
+
+def shared_graph(data: pd.DataFrame, max_bytes: int = MAX_BYTES) -> FeatureGraph:
+    ''' Returns the FeatureGraph of `data` without missing values, the same
+    for every caller passing this DataFrame while it is alive.
+
+    The data should not be modified in place between two callers: a change
+    of its fingerprint gives a new graph, but a change keeping the sum of
+    the prices (e.g. two values swapped) goes unnoticed.
+    '''
+    key = id(data)
+    stamp = fingerprint(data)
+    entry = _graphs.get(key)
+    if entry is not None and entry[0]() is data and entry[1] == stamp:
+        return entry[2]
+    graph = FeatureGraph(data.dropna(), max_bytes)
+    _graphs[key] = (weakref.ref(data, lambda _: _graphs.pop(key, None)),
+                    stamp, graph)
+    return graph
@@ -0,0 +1,401 @@
+#
+# Python Module with functions
+# for batch computation of the pine indicators
+#
+# The indicators of pinescript/indicators computed over whole arrays, with
+# the pine definitions (values are NaN where pine gives na). Arrays are 1-D
+# (bars) or 2-D (rows x bars, e.g. assets x bars): the indicators run along
+# the last axis.
+#
+# The window indicators (SMA, stdev, BB, CCI, RVI) reduce a sliding window
+# view of the array (no copy of the windows), by blocks of bars to bound the
+# size of the temporaries. The exponential averages (EMA, RMA and so RSI and
+# MACD) are first-order linear filters, run in C by scipy.signal.lfilter.
+# The Parabolic SAR is path dependent: it is a loop, compiled by numba
+# (requirements.txt). Without numba it runs in python, about 1 s per million
+# bars, no faster than the loops of ta and pandas-ta.
+#
+#   sma(prices, 20)                     # assets x bars -> assets x bars
+#   sweep(sma, price, range(10, 200))   # params x bars
+#
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# elements of the temporaries of a window reduction
+BLOCK = 2 ** 22
+
+
+def _rows(x: np.ndarray) -> np.ndarray:
+    ''' Returns x as a 2-D (rows x bars) view '''
+    return x.reshape(-1, x.shape[-1])
+
+
+def _first_full_window(rows: np.ndarray, window: int) -> np.ndarray:
+    ''' Returns the index of the first bar ending `window` non-NaN values
+    in each row (the length of the rows when there is none)
+    '''
+    defined = ~np.isnan(rows)
+    if defined.all():
+        return np.full(len(rows), window - 1 if window <= rows.shape[-1]
+                       else rows.shape[-1])
+    counts = np.cumsum(defined, axis=-1)
+    counts[:, window:] -= counts[:, :-window].copy()
+    full = counts >= window
+    return np.where(full.any(axis=-1), full.argmax(axis=-1), rows.shape[-1])
+
+
+def rolling(x, window: int, reduce) -> np.ndarray:
+    ''' Returns reduce(windows), the windows being the `window` last values
+    at each bar (NaN for the first window - 1 bars).
+
+    Parameters
+    ==========
+    x: np.ndarray
+        1-D or 2-D (rows x bars) array
+    window: int
+        number of bars of the windows
+    reduce: function
+        reduces an array of windows along its last axis, e.g.
+        lambda w: w.max(axis=-1)
+    '''
+    x = np.asarray(x, dtype=float)
+    out = np.full(x.shape, np.nan)
+    if window < 1 or window > x.shape[-1]:
+        return out
+    view = sliding_window_view(x, window, axis=-1)
+    rows = x.size // x.shape[-1]
+    step = max(1, BLOCK // (window * rows))
+    for i in range(0, view.shape[-2], step):
+        out[..., window - 1 + i:window - 1 + i + step] = \
+            reduce(view[..., i:i + step, :])
+    return out
+
+
+def sma(x, window: int) -> np.ndarray:
+    ''' Simple moving average (ta.sma) '''
+    return rolling(x, window, lambda w: w.mean(axis=-1))
+
+
+def stdev(x, window: int) -> np.ndarray:
+    ''' Population standard deviation over the window (ta.stdev) '''
+    return rolling(x, window, lambda w: w.std(axis=-1))
+
+
+def mean_dev(x, window: int) -> np.ndarray:
+    ''' Mean absolute deviation from the window average (ta.dev) '''
+    return rolling(x, window, lambda w: np.abs(
+        w - w.mean(axis=-1, keepdims=True)).mean(axis=-1))
+
+
+def bollinger(x, window: int = 20, mult: float = 2.0) -> tuple:
+    ''' Bollinger Bands (bb.pine)
+
+    Returns
+    =======
+    basis, upper, lower: np.ndarray
+        SMA and the SMA plus / minus mult standard deviations
+    '''
+    basis = sma(x, window)
+    dev = mult * stdev(x, window)
+    return basis, basis + dev, basis - dev
+
+
+def cci(close, window: int = 20, high=None, low=None) -> np.ndarray:
+    ''' Commodity Channel Index (cci.pine) of hlc3, or of the close when
+    high and low are not given.
+    '''
+    src = np.asarray(close, dtype=float)
+    if high is not None and low is not None:
+        src = (np.asarray(high, dtype=float) + np.asarray(low, dtype=float)
+               + src) / 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (src - sma(src, window)) / (0.015 * mean_dev(src, window))
+
+
+def rvi(x, length: int = 10, window: int = 14) -> np.ndarray:
+    ''' Relative Volatility Index (rvi.pine): the EMA of the standard
+    deviation over `length` bars on up bars, relative to its EMA on all bars.
+    '''
+    x = np.asarray(x, dtype=float)
+    change = np.diff(x, axis=-1, prepend=np.nan)
+    dev = stdev(x, length)
+    # na changes (first bar) count on both sides, like in pine
+    upper = ema(np.where(change <= 0, 0, dev), window)
+    lower = ema(np.where(change > 0, 0, dev), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return upper / (upper + lower) * 100
+
+
+def sweep(indicator, x, windows, **kwargs) -> np.ndarray:
+    ''' Returns the indicator for each window, stacked on a first axis:
+    params x bars for a 1-D x, params x rows x bars for a 2-D x.
+
+        sweep(ema, price, [50, 100, 150, 200])
+    '''
+    x = np.asarray(x, dtype=float)
+    out = np.empty((len(windows),) + x.shape)
+    for i, window in enumerate(windows):
+        out[i] = indicator(x, window, **kwargs)
+    return out
+
+
+def exp_average(x, window: int, alpha: float) -> np.ndarray:
+    ''' Returns y = alpha * x + (1 - alpha) * y[-1], seeded with the simple
+    average of the first `window` values, like ta.ema and ta.rma in pine.
+
+    Like in pine, the seed is the first average of `window` defined values,
+    leading NaNs (e.g. the start of an other indicator) are skipped. The
+    values are expected to be defined after the seed. All the values are
+    NaN for a window below 1, like in rolling.
+    '''
+    x = np.asarray(x, dtype=float)
+    out = np.full(x.shape, np.nan)
+    if x.size == 0 or window < 1:
+        return out
+    rows, res = _rows(x), _rows(out)
+    n = rows.shape[-1]
+    seeds = _first_full_window(rows, window)
+    # rows seeded at the same bar are filtered together
+    for seed_at in np.unique(seeds):
+        if seed_at >= n:
+            continue
+        idx = np.flatnonzero(seeds == seed_at)
+        seed = rows[idx, seed_at - window + 1:seed_at + 1].mean(axis=-1)
+        res[idx, seed_at] = seed
+        if seed_at + 1 < n:
+            zi = ((1 - alpha) * seed)[:, None]
+            res[idx, seed_at + 1:], _ = lfilter(
+                [alpha], [1, alpha - 1], rows[idx, seed_at + 1:], axis=-1,
+                zi=zi)
+    return out
+
+
+def ema(x, window: int) -> np.ndarray:
+    ''' Exponential moving average (ta.ema) '''
+    return exp_average(x, window, 2 / (window + 1))
+
+
+def rma(x, window: int) -> np.ndarray:
+    ''' Wilder's moving average (ta.rma) '''
+    return exp_average(x, window, 1 / window)
+
+
+def rsi(x, window: int = 14) -> np.ndarray:
+    ''' Relative Strength Index, with Wilder's averages (rsi.pine) '''
+    x = np.asarray(x, dtype=float)
+    change = np.diff(x, axis=-1, prepend=np.nan)
+    up = rma(np.maximum(change, 0), window)
+    down = rma(-np.minimum(change, 0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = 100 - 100 / (1 + up / down)
+    return np.where(down == 0, 100, np.where(up == 0, 0, value))
+
+
+def macd(x, fast: int = 12, slow: int = 26, signal: int = 9) -> tuple:
+    ''' Moving Average Convergence Divergence (macd.pine)
+
+    Returns
+    =======
+    macd, signal, hist: np.ndarray
+        fast EMA - slow EMA, its EMA and their difference
+    '''
+    line = ema(x, fast) - ema(x, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def _sar_loop(high, low, close, start, increment, maximum, out):
+    ''' ta.sar on a row, written in out[1:] (the reference pine script) '''
+    n = len(close)
+    if n < 2:
+        return
+    if close[1] > close[0]:
+        is_below, max_min, result = True, high[1], low[0]
+    else:
+        is_below, max_min, result = False, low[1], high[0]
+    acceleration = start
+    for i in range(1, n):
+        first_trend_bar = i == 1
+        result += acceleration * (max_min - result)
+        if is_below:
+            if result > low[i]:
+                first_trend_bar = True
+                is_below = False
+                result = max(high[i], max_min)
+                max_min = low[i]
+                acceleration = start
+        elif result < high[i]:
+            first_trend_bar = True
+            is_below = True
+            result = min(low[i], max_min)
+            max_min = high[i]
+            acceleration = start
+        if not first_trend_bar:
+            if is_below:
+                if high[i] > max_min:
+                    max_min = high[i]
+                    acceleration = min(acceleration + increment, maximum)
+            elif low[i] < max_min:
+                max_min = low[i]
+                acceleration = min(acceleration + increment, maximum)
+        if is_below:
+            result = min(result, low[i - 1])
+            if i > 1:
+                result = min(result, low[i - 2])
+        else:
+            result = max(result, high[i - 1])
+            if i > 1:
+                result = max(result, high[i - 2])
+        out[i] = result
+
+
+try:
+    from numba import njit
+    _sar_loop = njit(cache=True)(_sar_loop)
+    JIT = True
+except ImportError:
+    JIT = False
+
+
+def sar(close, high=None, low=None, start: float = 0.02,
+        increment: float = 0.02, maximum: float = 0.2) -> np.ndarray:
+    ''' Parabolic SAR (sar.pine)
+
+    Parameters
+    ==========
+    close: np.ndarray
+        close prices, also used as high and low when they are not given
+        (e.g. the price column of the back-testing data)
+    high, low: np.ndarray
+        high and low prices
+    start, increment, maximum: float
+        acceleration factor: initial value, step and maximum
+    '''
+    close = np.asarray(close, dtype=float)
+    high = close if high is None else np.asarray(high, dtype=float)
+    low = close if low is None else np.asarray(low, dtype=float)
+    out = np.full(close.shape, np.nan)
+    if close.size == 0:
+        return out
+    for h, l, c, res in zip(_rows(high), _rows(low), _rows(close), _rows(out)):
+        if JIT:
+            _sar_loop(h, l, c, start, increment, maximum, res)
+        else:
+            # python floats in lists are much faster to index than arrays
+            row = [math.nan] * len(c)
+            _sar_loop(h.tolist(), l.tolist(), c.tolist(), start, increment,
+                      maximum, row)
+            res[:] = row
+    return out
+
+
+if __name__ == '__main__':
+    # benchmark against pandas and the implementations of ta and pandas-ta
+    # (requirements.txt), on 1 million bars or the price column of a csv file
+    import sys
+    import time
+    import pandas as pd
+
+    if len(sys.argv) > 1:
+        price = pd.read_csv(sys.argv[1], index_col=0, parse_dates=True)['price']
+    else:
+        n = 1_000_000
+        returns = np.random.default_rng(0).normal(0, 1e-3, n)
+        price = pd.Series(24_000 * np.exp(np.cumsum(returns)))
+    x = price.to_numpy(dtype=float)
+
+    def timed(func):
+        t0 = time.perf_counter()
+        value = func()
+        return time.perf_counter() - t0, np.asarray(value, dtype=float)
+
+    def pandas_rsi(window):
+        change = price.diff()
+        up = change.clip(lower=0).ewm(alpha=1 / window, adjust=False).mean()
+        down = (-change.clip(upper=0)).ewm(alpha=1 / window, adjust=False).mean()
+        return 100 - 100 / (1 + up / down)
+
+    def pandas_macd(fast, slow, signal):
+        line = price.ewm(span=fast, adjust=False).mean() \
+            - price.ewm(span=slow, adjust=False).mean()
+        # the signal line too, like macd
+        line.ewm(span=signal, adjust=False).mean()
+        return line
+
+    # what both libraries do for the averages
+    libraries = {'pandas': {
+        'ema': lambda: price.ewm(span=50, adjust=False).mean(),
+        'rsi': lambda: pandas_rsi(14),
+        'macd': lambda: pandas_macd(12, 26, 9),
+        'sma': lambda: price.rolling(50).mean(),
+        'bb': lambda: price.rolling(20).mean()
+                      + 2 * price.rolling(20).std(ddof=0),
+        'cci': lambda: (price - price.rolling(20).mean()) / (0.015 * price
+            .rolling(20).apply(lambda w: np.abs(w - w.mean()).mean(), raw=True)),
+    }}
+    try:
+        import ta
+        libraries['ta'] = {
+            'ema': lambda: ta.trend.EMAIndicator(price, 50).ema_indicator(),
+            'rsi': lambda: ta.momentum.RSIIndicator(price, 14).rsi(),
+            'macd': lambda: ta.trend.MACD(price, 26, 12, 9).macd(),
+            'sar': lambda: ta.trend.PSARIndicator(
+                price, price, price, 0.02, 0.2).psar(),
+            'sma': lambda: ta.trend.SMAIndicator(price, 50).sma_indicator(),
+            'bb': lambda: ta.volatility.BollingerBands(
+                price, 20, 2).bollinger_hband(),
+            'cci': lambda: ta.trend.CCIIndicator(
+                price, price, price, 20, 0.015).cci(),
+        }
+    except ImportError:
+        print('ta is not installed')
+    try:
+        import pandas_ta
+        libraries['pandas-ta'] = {
+            'ema': lambda: pandas_ta.ema(price, 50),
+            'rsi': lambda: pandas_ta.rsi(price, 14),
+            'macd': lambda: pandas_ta.macd(price, 12, 26, 9).iloc[:, 0],
+            'sar': lambda: pandas_ta.psar(price, price, price, 0.02, 0.02, 0.2)
+                                    .iloc[:, :2].bfill(axis=1).iloc[:, 0],
+            'sma': lambda: pandas_ta.sma(price, 50),
+            'bb': lambda: pandas_ta.bbands(price, 20, 2).iloc[:, 2],
+            'cci': lambda: pandas_ta.cci(price, price, price, 20),
+        }
+    except ImportError:
+        print('pandas-ta is not installed')
+
+    ours = {
+        'ema': lambda: ema(x, 50),
+        'rsi': lambda: rsi(x, 14),
+        'macd': lambda: macd(x)[0],
+        'sar': lambda: sar(x),
+        'sma': lambda: sma(x, 50),
+        'bb': lambda: bollinger(x, 20, 2)[1],
+        'cci': lambda: cci(x, 20),
+        'rvi': lambda: rvi(x),
+    }
+    print(f'{len(x):,} bars, numba: {JIT}')
+    for name, func in ours.items():
+        elapsed, value = timed(func)
+        line = f'{name:>5}: {elapsed * 1000:8.1f} ms'
+        for library, funcs in libraries.items():
+            if name not in funcs:
+                continue
+            other, reference = timed(funcs[name])
+            # the seeds differ between implementations, compared once the
+            # averages have converged
+            half = len(x) // 2
+            diff = np.nanmax(np.abs(value[half:] - reference[half:]))
+            line += f' | {library} {other * 1000:8.1f} ms' \
+                    f' x{other / elapsed:5.1f} diff {diff:.2e}'
+        print(line)
+
+    # one call for many assets or many parameters
+    assets = np.vstack([x[i::10] for i in range(10)])[:, :len(x) // 10]
+    for name, func in (('sma', lambda: sma(assets, 50)),
+                       ('rsi', lambda: rsi(assets, 14)),
+                       ('ema sweep', lambda: sweep(ema, x, range(10, 210, 10)))):
+        elapsed, value = timed(func)
+        print(f'{name:>9} {value.shape}: {elapsed * 1000:8.1f} ms')
@@ -0,0 +1,32 @@
+#
+# Python Module with plotting helpers
+#
+# matplotlib is only imported when something is plotted,
+# so back-tests can run headless without paying its import time.
+#
+_plt = None
+
+
+def get_plt(backend=None):
+    ''' Returns matplotlib.pyplot, imported and styled on first use.
+
+    Parameters
+    ==========
+    backend: str
+        optional matplotlib backend to select before the first import
+        (e.g. 'Agg' to render files on a server)
+    '''
+    global _plt
+    if _plt is None:
+        import matplotlib
+        if backend is not None:
+            matplotlib.use(backend)
+        from pylab import mpl, plt
+        try:
+            plt.style.use('seaborn')
+        except OSError:
+            # renamed in matplotlib 3.6
+            plt.style.use('seaborn-v0_8')
+        mpl.rcParams['font.family'] = 'serif'
+        _plt = plt
+    return _plt
@@ -0,0 +1,125 @@
+#
+# Python Module with Class
+# for per-stage profiling of back-tests
+#
+import io
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+
+
+class StageProfiler(object):
+    ''' Records wall time, CPU time and allocated memory per stage
+    of a back-test (data loading, indicators, bar loop, statistics, plot).
+
+    Attributes
+    ==========
+    enabled: bool
+        when False, stages are not measured at all
+    cprofile: list
+        names of the stages to run under cProfile
+    memory: bool
+        trace allocated memory with tracemalloc; it slows python code down
+        and so skews the times, better measured in a separate run
+    stages: dict
+        measures by stage name, repeated stages are accumulated
+
+    Methods
+    =======
+    stage:
+        context manager measuring the wrapped block
+    reset:
+        clears the recorded stages
+    report:
+        returns the measures as a dict
+    to_json:
+        returns the measures as a JSON string
+    '''
+
+    def __init__(self, enabled=True, cprofile=None, memory=False):
+        self.enabled = enabled
+        self.cprofile = set(cprofile or [])
+        self.memory = memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, bars: int = None):
+        ''' Measures the wrapped block as stage `name`.
+        Stages are not meant to be nested.
+
+        Parameters
+        ==========
+        name: str
+            stage name, e.g. 'get_data', 'loop'
+        bars: int
+            number of bars processed, to report bars per second
+        '''
+        if not self.enabled:
+            yield
+            return
+
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.memory:
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+
+        profiler = cProfile.Profile() if name in self.cprofile else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            record = self.stages.setdefault(name, {
+                'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            record['calls'] += 1
+            record['wall_s'] += wall
+            record['cpu_s'] += cpu
+
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record['allocated_mb'] = record.get('allocated_mb', 0.0) + \
+                    (current - memory_start) / 1024 ** 2
+                record['peak_mb'] = max(record.get('peak_mb', 0.0),
+                                        (peak - memory_start) / 1024 ** 2)
+            if tracing:
+                tracemalloc.stop()
+
+            if bars is not None:
+                record['bars'] = record.get('bars', 0) + bars
+                if record['wall_s'] > 0:
+                    record['bars_per_s'] = record['bars'] / record['wall_s']
+
+            if profiler is not None:
+                out = io.StringIO()
+                stats = pstats.Stats(profiler, stream=out)
+                stats.sort_stats('cumulative').print_stats(20)
+                record['cprofile'] = out.getvalue()
+
+    def reset(self, keep=()):
+        ''' Clears the recorded stages, except the ones in `keep` '''
+        self.stages = {k: v for k, v in self.stages.items() if k in keep}
+
+    def report(self) -> dict:
+        ''' Returns the recorded stages and their totals '''
+        stages = {name: dict(record) for name, record in self.stages.items()}
+        return {
+            'stages': stages,
+            'wall_s': sum(r['wall_s'] for r in stages.values()),
+            'cpu_s': sum(r['cpu_s'] for r in stages.values()),
+        }
+
+    def to_json(self, **kwargs) -> str:
+        ''' Returns the report as a JSON string '''
+        return json.dumps(self.report(), **kwargs)
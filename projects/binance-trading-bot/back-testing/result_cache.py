@@ -0,0 +1,215 @@
+#
+# Python Module with Class
+# for caching back-test results on disk
+#
+import os
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import pandas as pd
+
+# engine attributes that configure a run (costs, sizing, SMA windows)
+CONFIG_ATTRS = ('initial_amount', 'ftc', 'ptc', 'tc', 'sma1', 'sma2')
+
+# engine attributes set by a run, restored on a cache hit
+STATE_ATTRS = ('result', 'statistics', 'results', 'benchmark', 'amount',
+               'units', 'position', 'trades', 'ledger', 'momentum', 'SMA',
+               'threshold', 'sma1', 'sma2')
+
+
+def source_path(source) -> str:
+    ''' Returns the absolute path of a data file, None when `source` is
+    not a path (e.g. a shared_data.SharedFrame)
+    '''
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.abspath(source)
+    return None
+
+
+class ResultCache(object):
+    ''' Content-addressed disk cache of back-test runs.
+
+    Runs are keyed by a fingerprint of the input data slice, the engine
+    class (name, `version` attribute and source code), the method, its
+    parameters and the engine's cost settings, so a changed input never
+    returns a stale result. Entries are evicted least recently used first
+    once the cache grows over `max_bytes`.
+
+    Attributes
+    ==========
+    directory: str
+        where the entries are stored
+    max_bytes: int
+        size bound of the cache directory
+
+    Methods
+    =======
+    run:
+        returns the cached run of engine.method(**params), or runs and stores it
+    key:
+        returns the cache key of a run
+    get:
+        returns a stored entry or None
+    put:
+        stores an entry and evicts old ones if needed
+    invalidate:
+        removes the entries computed from a data file (or all entries)
+    '''
+
+    def __init__(self, directory='.backtest-cache', max_bytes=1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, engine, method: str, source: str = None, **params):
+        ''' Returns engine.method(**params), from the cache when possible.
+        On a hit the engine state (result, statistics, amount, ...) is
+        restored as if the run happened.
+
+        Parameters
+        ==========
+        engine: object
+            back-testing engine with its data loaded
+        method: str
+            name of the run method, e.g. 'run_sma_strategy'
+        source: str
+            data file the engine was loaded from, used by invalidate()
+        '''
+        key = self.key(engine, method, params)
+        entry = self.get(key)
+        if entry is None:
+            value = getattr(engine, method)(**params)
+            state = {attr: getattr(engine, attr) for attr in STATE_ATTRS
+                     if hasattr(engine, attr)}
+            if source is None:
+                source = getattr(engine, 'csv_file', None)
+            self.put(key, {'value': value, 'state': state}, source)
+            return value
+
+        for attr, value in entry['state'].items():
+            setattr(engine, attr, value)
+        return entry['value']
+
+    def key(self, engine, method: str, params: dict) -> str:
+        ''' Returns the fingerprint of a run '''
+        data = getattr(engine, 'data', None)
+        if data is None:
+            data = engine.raw
+        digest = hashlib.sha256()
+        digest.update(pd.util.hash_pandas_object(data, index=True).values
+                      .tobytes())
+        digest.update(self._class_fingerprint(type(engine)).encode())
+        config = {attr: getattr(engine, attr) for attr in CONFIG_ATTRS
+                  if hasattr(engine, attr)}
+        if 'initial_amount' not in config:
+            config['amount'] = getattr(engine, 'amount', None)
+        digest.update(json.dumps([method, params, config], sort_keys=True,
+                                 default=str).encode())
+        return digest.hexdigest()
+
+    def _class_fingerprint(self, cls) -> str:
+        parts = [f'{cls.__module__}.{cls.__qualname__}',
+                 str(getattr(cls, 'version', ''))]
+        for klass in cls.__mro__:
+            try:
+                parts.append(inspect.getsource(klass))
+            except (OSError, TypeError):
+                pass
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    def get(self, key: str):
+        ''' Returns the entry stored under `key` or None '''
+        path = self._path(key, 'pkl')
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # the modification time records the last use for LRU eviction
+        os.utime(path)
+        return entry
+
+    def put(self, key: str, entry: dict, source: str = None):
+        ''' Stores `entry` under `key` and evicts old entries if needed '''
+        path = self._path(key, 'pkl')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+        meta = {'source': source_path(source),
+                'created': time.time()}
+        with open(self._path(key, 'json'), 'w') as f:
+            json.dump(meta, f)
+        self.evict()
+
+    def entries(self) -> list:
+        ''' Returns (last use, size, key) of the stored entries '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+        return entries
+
+    def evict(self):
+        ''' Removes the least recently used entries over max_bytes '''
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(key)
+            total -= size
+
+    def remove(self, key: str):
+        for ext in ('pkl', 'json'):
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, source: str = None) -> int:
+        ''' Removes the entries computed from the data file `source`
+        (e.g. after the kline store was extended), or every entry.
+        Returns the number of removed entries.
+        '''
+        if source is not None:
+            source = source_path(source)
+            if source is None:
+                # entries record data files only
+                return 0
+        removed = 0
+        for _, _, key in self.entries():
+            if source is not None:
+                try:
+                    with open(self._path(key, 'json')) as f:
+                        if json.load(f).get('source') != source:
+                            continue
+                except (FileNotFoundError, ValueError):
+                    pass
+            self.remove(key)
+            removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    import datetime as dt
+    from BackTestLongOnly import BackTestLongOnly
+
+    cache = ResultCache()
+    lobt = BackTestLongOnly(dt.datetime(2022, 6, 1), dt.datetime(2022, 6, 3),
+                            100000, verbose=False, plot=False)
+    for _ in range(2):
+        t0 = time.perf_counter()
+        cache.run(lobt, 'run_sma_strategy', SMA1=90, SMA2=194)
+        print(f'{time.perf_counter() - t0:.3f} s | {lobt.amount:.2f}')
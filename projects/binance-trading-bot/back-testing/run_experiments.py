@@ -0,0 +1,284 @@
+#
+# Python Script to run batches of back-tests
+# headless, from a YAML or JSON experiment file
+#
+# Usage:
+#   python run_experiments.py experiments.yaml --output results --workers 8
+#   python run_experiments.py experiments.yaml --cache .backtest-cache
+#   python run_experiments.py experiments.yaml --shared
+#
+# Experiment file:
+#
+#   defaults:
+#     data: ./BTCUSDT-1m-2020-01-01_2022-08-11.csv
+#     start: 2022-06-01
+#     end: 2022-06-03
+#     amount: 100000
+#   jobs:
+#     - name: sma
+#       engine: BackTestLongOnly
+#       method: run_sma_strategy
+#       params: {SMA1: 90, SMA2: 194}
+#       ptc: 0.001
+#     - name: momentum
+#       engine: MomVectorBackTester
+#       method: run_strategy
+#       grid: {momentum: [1, 5, 10, 30]}
+#       tc: 0.001
+#       plot: true
+#
+# Each job writes summary.json, stdout.log and optionally result.csv
+# and plot-*.png into <output>/<name>/. `grid` expands a job into one job
+# per combination of the listed parameter values. With --shared, each
+# data file is loaded once into shared memory for all the workers.
+#
+import os
+import sys
+import json
+import argparse
+import itertools
+import importlib
+import traceback
+import contextlib
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_store import load_csv
+
+# engine class name: 'event' engines load their data themselves,
+# 'vector' engines are given the data slice
+ENGINES = {
+    'BackTestLongOnly': 'event',
+    'BackTestLongOnlyVector': 'event',
+    'BackTestLongShort': 'event',
+    'SMAVectorBackTester': 'vector',
+    'MomVectorBackTester': 'vector',
+    'MRVectorBackTester': 'vector',
+}
+
+DEFAULTS = {
+    'data': './BTCUSDT-1m-2020-01-01_2022-08-11.csv',
+    'amount': 100_000,
+    'ftc': 0.0,
+    'ptc': 0.0,
+    'tc': 0.0,
+    'params': {},
+    'init': {},
+    'plot': False,
+    'save_result': True,
+}
+
+
+def load_experiments(path: str) -> list:
+    ''' Reads an experiment file and returns the list of expanded jobs '''
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+
+    defaults = {**DEFAULTS, **config.get('defaults', {})}
+    jobs = []
+    for i, job in enumerate(config['jobs']):
+        job = {**defaults, **job}
+        job.setdefault('name', f"{job['engine']}-{i}")
+        if job['engine'] not in ENGINES:
+            raise ValueError(f"Unknown engine {job['engine']}")
+
+        grid = job.pop('grid', None)
+        if not grid:
+            jobs.append(job)
+            continue
+        keys = list(grid)
+        for values in itertools.product(*(grid[k] for k in keys)):
+            params = {**job['params'], **dict(zip(keys, values))}
+            suffix = '-'.join(f'{k}={v}' for k, v in params.items())
+            jobs.append({**job, 'params': params,
+                         'name': f"{job['name']}-{suffix}"})
+    return jobs
+
+
+def to_builtin(value):
+    ''' JSON fallback for numpy scalars and other objects '''
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def to_timestamp(value):
+    return None if value is None else pd.Timestamp(value)
+
+
+def build_engine(job: dict, client=None):
+    ''' Instantiates the back-testing engine described by `job`, on the
+    shared data sets of `client` (a shared_data.DataClient) if given.
+    '''
+    name = job['engine']
+    cls = getattr(importlib.import_module(name), name)
+    start, end = to_timestamp(job.get('start')), to_timestamp(job.get('end'))
+
+    if ENGINES[name] == 'event':
+        data = job['data'] if client is None else client.acquire(job['data'])
+        return cls(start, end, job['amount'], job['ftc'], job['ptc'],
+                   verbose=False, csv_file=data,
+                   plot=job['plot'], **job['init'])
+
+    if client is None:
+        raw = load_csv(job['data'], start=start, end=end)
+    else:
+        raw = client.get(job['data'])
+    if start is not None:
+        raw = raw.loc[raw.index > start]
+    if end is not None:
+        raw = raw.loc[raw.index < end]
+    if name == 'SMAVectorBackTester':
+        return cls(raw, verbose=False, **job['init'])
+    return cls(raw, job['amount'], job['tc'], verbose=False, **job['init'])
+
+
+def summarize(engine, value) -> dict:
+    ''' Returns the JSON-serializable outcome of a run '''
+    summary = {}
+    if value is not None:
+        summary['return'] = value
+    if hasattr(engine, 'initial_amount'):
+        summary['initial_amount'] = engine.initial_amount
+        summary['final_amount'] = engine.amount
+        summary['trades'] = engine.trades
+        summary['performance'] = engine.get_gross_rate(
+            engine.initial_amount, engine.amount)
+        if engine.statistics is not None:
+            summary['max_drawdown'] = engine.statistics['drawdown'].max()
+    return json.loads(json.dumps(summary, default=to_builtin))
+
+
+def save_plots(job: dict, engine, directory: str):
+    ''' Renders the plots of the run into png files '''
+    from plotting import get_plt
+    plt = get_plt(backend='Agg')
+    if ENGINES[job['engine']] == 'vector':
+        engine.plot_results()
+    for i, num in enumerate(plt.get_fignums()):
+        plt.figure(num).savefig(os.path.join(directory, f'plot-{i}.png'))
+    plt.close('all')
+
+
+def run_job(job: dict, output: str, cache_dir: str = None,
+            cache_size: int = None, shared: tuple = None) -> dict:
+    ''' Runs one job and writes its outputs, errors are reported in the
+    summary instead of stopping the batch. With `cache_dir`, runs are
+    looked up in (and stored into) a ResultCache first. With `shared`,
+    the (address, authkey) of a DataServer, the data is read from
+    shared memory.
+    '''
+    directory = os.path.join(output, job['name'])
+    os.makedirs(directory, exist_ok=True)
+    summary = {'name': job['name'], 'job': job}
+
+    client = None
+    with open(os.path.join(directory, 'stdout.log'), 'w') as log, \
+            contextlib.redirect_stdout(log):
+        try:
+            if job['plot']:
+                # select a file backend before any plot is made
+                from plotting import get_plt
+                get_plt(backend='Agg')
+            if shared is not None:
+                from shared_data import DataClient
+                client = DataClient(*shared)
+            engine = build_engine(job, client)
+            method = job.get('method', 'run_strategy')
+            if cache_dir is None:
+                value = getattr(engine, method)(**job['params'])
+            else:
+                from result_cache import ResultCache
+                cache = ResultCache(cache_dir, cache_size or 1024 ** 3)
+                value = cache.run(engine, method, source=job['data'],
+                                  **job['params'])
+            summary.update(summarize(engine, value))
+
+            if job['save_result']:
+                result = getattr(engine, 'statistics', None)
+                if result is None:
+                    result = getattr(engine, 'results', None)
+                if result is not None:
+                    result.to_csv(os.path.join(directory, 'result.csv'))
+                if getattr(engine, 'ledger', None) is not None:
+                    engine.get_trades().to_csv(
+                        os.path.join(directory, 'trades.csv'), index=False)
+            if job['plot']:
+                save_plots(job, engine, directory)
+        except Exception:
+            summary['error'] = traceback.format_exc()
+        finally:
+            if client is not None:
+                client.close()
+
+    with open(os.path.join(directory, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+    return summary
+
+
+def run_experiments(jobs: list, output: str, workers: int = None,
+                    cache_dir: str = None, cache_size: int = None,
+                    shared: bool = False) -> list:
+    ''' Runs the jobs in parallel processes and returns their summaries.
+    With `shared`, each data file is loaded once into shared memory.
+    '''
+    os.makedirs(output, exist_ok=True)
+    server = None
+    if shared:
+        from shared_data import DataServer
+        server = DataServer()
+        for path in sorted({job['data'] for job in jobs}):
+            server.load(path, path)
+        shared = (server.address, server.authkey)
+    else:
+        shared = None
+
+    summaries = []
+    try:
+        if workers == 1:
+            for job in jobs:
+                summaries.append(run_job(job, output, cache_dir, cache_size,
+                                         shared))
+                print_progress(summaries[-1], len(summaries), len(jobs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(run_job, job, output, cache_dir,
+                                           cache_size, shared)
+                           for job in jobs]
+                for future in as_completed(futures):
+                    summaries.append(future.result())
+                    print_progress(summaries[-1], len(summaries), len(jobs))
+    finally:
+        if server is not None:
+            server.close()
+
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump(summaries, f, indent=2, default=str)
+    return summaries
+
+
+def print_progress(summary: dict, done: int, total: int):
+    status = 'ERROR' if 'error' in summary else 'ok'
+    print(f"[{done}/{total}] {summary['name']} {status}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('experiments', help='YAML or JSON experiment file')
+    parser.add_argument('--output', default='results')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='parallel processes, defaults to the CPU count')
+    parser.add_argument('--cache', default=None,
+                        help='directory of the result cache, disabled if unset')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='result cache size bound in MB')
+    parser.add_argument('--shared', action='store_true',
+                        help='load each data file once into shared memory')
+    args = parser.parse_args()
+
+    jobs = load_experiments(args.experiments)
+    summaries = run_experiments(jobs, args.output, args.workers, args.cache,
+                                args.cache_size * 1024 ** 2, args.shared)
+    if any('error' in s for s in summaries):
+        sys.exit(1)
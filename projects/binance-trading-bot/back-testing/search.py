@@ -0,0 +1,359 @@
+#
+# Python Module with Classes
+# for adaptive parameter search of back-tests
+#
+# Searchers maximize a scalar objective(params, fraction) over a parameter
+# space, where `fraction` is the share of the data to back-test on (used by
+# successive halving). Space dimensions are either a list of choices or a
+# (low, high) tuple, sampled as integers when both bounds are integers.
+#
+#   objective = BacktestObjective(MRVectorBackTester, raw,
+#                                 init={'amount': 10000, 'tc': 0.001})
+#   space = {'SMA': (10, 200), 'threshold': (0.5, 50.0)}
+#   searcher = TPESearch(objective, space, n_iter=100, seed=42, workers=4)
+#   params, perf = searcher.run()
+#   print(searcher.results().head())
+#
+import abc
+import math
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+
+class BacktestObjective(object):
+    ''' Scalar objective running a vectorized back-tester.
+
+    Parameters
+    ==========
+    cls: type
+        back-tester class taking the data as first argument
+        (SMAVectorBackTester, MomVectorBackTester, MRVectorBackTester)
+    data: pd.DataFrame
+        data passed to the back-tester, sliced to the first `fraction`
+    method: str
+        run method returning the score (or a tuple of scores)
+    init: dict
+        keyword arguments of the back-tester
+    init_params: tuple
+        names of the searched parameters passed to the back-tester
+        instead of the run method (e.g. ('sma1', 'sma2'))
+    score: int
+        index of the score when the run method returns a tuple
+    '''
+
+    def __init__(self, cls, data: pd.DataFrame, method='run_strategy',
+                 init=None, init_params=(), score=0):
+        self.cls = cls
+        self.data = data
+        self.method = method
+        self.init = {'verbose': False, **(init or {})}
+        self.init_params = tuple(init_params)
+        self.score = score
+        # the same slice object for a fraction, so that the back-testers
+        # share its indicators (see features.shared_graph)
+        self.slices = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['slices'] = {}
+        return state
+
+    def subset(self, fraction: float) -> pd.DataFrame:
+        n = max(2, int(len(self.data) * fraction))
+        if n not in self.slices:
+            self.slices[n] = self.data.iloc[:n]
+        return self.slices[n]
+
+    def __call__(self, params: dict, fraction: float = 1.0) -> float:
+        data = self.subset(fraction)
+        init = {**self.init, **{k: v for k, v in params.items()
+                                if k in self.init_params}}
+        kwargs = {k: v for k, v in params.items()
+                  if k not in self.init_params}
+        engine = self.cls(data, **init)
+        try:
+            value = getattr(engine, self.method)(**kwargs)
+        except IndexError:
+            # the windows are longer than the data subset
+            return -np.inf
+        if isinstance(value, tuple):
+            value = value[self.score]
+        return float(value)
+
+
+def _evaluate(objective, params: dict, fraction: float) -> float:
+    score = objective(params, fraction)
+    return -np.inf if score is None or np.isnan(score) else score
+
+
+class Searcher(abc.ABC):
+    ''' Base class of the searchers.
+
+    Attributes
+    ==========
+    objective: callable
+        objective(params, fraction) -> float, maximized; must be picklable
+        when workers != 1
+    space: dict
+        parameter name -> list of choices or (low, high) bounds
+    constraint: callable
+        optional constraint(params) -> bool, e.g. sma1 < sma2
+    workers: int
+        parallel processes, None for the CPU count
+    seed: int
+        seed of the random generator, for reproducible searches
+    cache: dict
+        scores by (params, fraction), nothing is evaluated twice
+
+    Methods
+    =======
+    run:
+        runs the search and returns the best params and score
+    sample:
+        draws random params satisfying the constraint
+    evaluate:
+        returns the scores of a list of params, evaluated in parallel
+    results:
+        returns every evaluation as a DataFrame, best first
+    '''
+
+    def __init__(self, objective, space: dict, constraint=None, workers=1,
+                 seed=None):
+        self.objective = objective
+        self.space = space
+        self.constraint = constraint
+        self.workers = workers
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.cache = {}
+        self.history = []
+
+    @abc.abstractmethod
+    def run(self) -> tuple:
+        ''' Runs the search, returns the best params and their score '''
+
+    def is_integer(self, name: str) -> bool:
+        dim = self.space[name]
+        return isinstance(dim, tuple) and all(
+            isinstance(v, (int, np.integer)) for v in dim)
+
+    def draw(self, name: str):
+        ''' Draws a random value of one dimension '''
+        dim = self.space[name]
+        if isinstance(dim, list):
+            return dim[self.rng.integers(len(dim))]
+        low, high = dim
+        if self.is_integer(name):
+            return int(self.rng.integers(low, high + 1))
+        return float(self.rng.uniform(low, high))
+
+    def is_valid(self, params: dict) -> bool:
+        return self.constraint is None or self.constraint(params)
+
+    def sample(self, n: int) -> list:
+        ''' Returns up to n random params satisfying the constraint '''
+        samples = []
+        for _ in range(100 * n):
+            if len(samples) == n:
+                break
+            params = {name: self.draw(name) for name in self.space}
+            if self.is_valid(params):
+                samples.append(params)
+        return samples
+
+    def key(self, params: dict, fraction: float) -> tuple:
+        return tuple(sorted(params.items())), fraction
+
+    def evaluate(self, candidates: list, fraction: float = 1.0) -> list:
+        ''' Returns the scores of the candidates on a data fraction,
+        computing only the ones missing from the cache.
+        '''
+        todo = {}
+        for params in candidates:
+            key = self.key(params, fraction)
+            if key not in self.cache:
+                todo.setdefault(key, params)
+
+        if self.workers == 1 or len(todo) < 2:
+            scores = [_evaluate(self.objective, p, fraction)
+                      for p in todo.values()]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                scores = list(executor.map(
+                    _evaluate, [self.objective] * len(todo), todo.values(),
+                    [fraction] * len(todo)))
+
+        for (key, params), score in zip(todo.items(), scores):
+            self.cache[key] = score
+            self.history.append({**params, 'fraction': fraction,
+                                 'score': score})
+        return [self.cache[self.key(p, fraction)] for p in candidates]
+
+    def results(self) -> pd.DataFrame:
+        ''' Returns the evaluations, full data first, best first '''
+        df = pd.DataFrame(self.history)
+        if df.empty:
+            return df
+        return df.sort_values(['fraction', 'score'], ascending=False,
+                              kind='stable').reset_index(drop=True)
+
+    def best(self) -> tuple:
+        ''' Returns the best params and score on the full data '''
+        full = [h for h in self.history if h['fraction'] == 1.0]
+        if not full:
+            return None, -np.inf
+        best = max(full, key=lambda h: h['score'])
+        return {name: best[name] for name in self.space}, best['score']
+
+
+class RandomSearch(Searcher):
+    ''' Random search with a budget of `n_iter` evaluations.
+    '''
+
+    def __init__(self, objective, space: dict, n_iter=50, **kwargs):
+        super().__init__(objective, space, **kwargs)
+        self.n_iter = n_iter
+
+    def run(self) -> tuple:
+        self.evaluate(self.sample(self.n_iter))
+        return self.best()
+
+
+class SuccessiveHalving(Searcher):
+    ''' Successive halving on growing data subsets.
+
+    `n_candidates` random params are back-tested on the first
+    `min_fraction` of the data, the best 1/eta are kept and back-tested
+    on a larger share, up to the full data set.
+    '''
+
+    def __init__(self, objective, space: dict, n_candidates=81, eta=3,
+                 min_fraction=None, **kwargs):
+        super().__init__(objective, space, **kwargs)
+        self.n_candidates = n_candidates
+        self.eta = eta
+        self.rounds = max(0, int(math.log(n_candidates, eta) + 1e-9))
+        if min_fraction is None:
+            min_fraction = float(eta) ** -self.rounds
+        self.min_fraction = min_fraction
+
+    def run(self) -> tuple:
+        candidates = self.sample(self.n_candidates)
+        fractions = np.geomspace(self.min_fraction, 1, self.rounds + 1)
+        fractions[-1] = 1.0
+        for fraction in fractions:
+            fraction = float(fraction)
+            scores = self.evaluate(candidates, fraction)
+            if fraction == 1.0:
+                break
+            keep = max(1, math.ceil(len(candidates) / self.eta))
+            order = np.argsort(scores, kind='stable')[::-1][:keep]
+            candidates = [candidates[i] for i in order]
+        return self.best()
+
+
+class TPESearch(Searcher):
+    ''' Tree-structured Parzen estimator search.
+
+    After `n_startup` random evaluations, the history is split into the
+    best `gamma` share and the rest; each dimension is modelled by a
+    Parzen (kernel) density over both groups, and the next params are the
+    candidates drawn from the good density with the highest good / bad
+    density ratio. `batch` params are proposed (and evaluated in
+    parallel) per step; the results depend on the seed and the batch,
+    not on the number of workers.
+    '''
+
+    def __init__(self, objective, space: dict, n_iter=100, n_startup=10,
+                 gamma=0.25, n_ei_candidates=24, batch=4, **kwargs):
+        super().__init__(objective, space, **kwargs)
+        self.n_iter = n_iter
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_ei_candidates = n_ei_candidates
+        self.batch = batch
+
+    def run(self) -> tuple:
+        self.evaluate(self.sample(min(self.n_startup, self.n_iter)))
+        while len(self.history) < self.n_iter:
+            size = min(self.batch, self.n_iter - len(self.history))
+            before = len(self.history)
+            self.evaluate(self.propose(size))
+            if len(self.history) == before:
+                # every proposal was cached, explore instead
+                self.evaluate(self.sample(size))
+                if len(self.history) == before:
+                    break
+        return self.best()
+
+    def propose(self, n: int) -> list:
+        ''' Returns n params maximizing the good / bad density ratio '''
+        history = sorted(self.history, key=lambda h: h['score'],
+                         reverse=True)
+        n_good = max(1, int(math.ceil(self.gamma * len(history))))
+        good, bad = history[:n_good], history[n_good:] or history[-1:]
+
+        proposals = []
+        for _ in range(100 * n):
+            if len(proposals) == n:
+                break
+            params = {}
+            for name in self.space:
+                params[name] = self.propose_value(
+                    name, [h[name] for h in good], [h[name] for h in bad])
+            if self.is_valid(params):
+                proposals.append(params)
+        return proposals
+
+    def propose_value(self, name: str, good: list, bad: list):
+        dim = self.space[name]
+        size = self.n_ei_candidates
+
+        if isinstance(dim, list):
+            # smoothed frequencies of each choice
+            def weights(values):
+                counts = np.array([1.0 + sum(v == c for v in values)
+                                   for c in dim])
+                return counts / counts.sum()
+            l, g = weights(good), weights(bad)
+            choices = self.rng.choice(len(dim), size=size, p=l)
+            return dim[choices[np.argmax(l[choices] / g[choices])]]
+
+        low, high = dim
+        good, bad = np.asarray(good, float), np.asarray(bad, float)
+        width = high - low
+
+        def bandwidth(values):
+            return max(width * len(values) ** -0.2 / 5, width * 1e-3, 1e-12)
+
+        def density(x, values):
+            h = bandwidth(values)
+            z = (x[:, None] - values[None, :]) / h
+            return np.exp(-0.5 * z ** 2).mean(axis=1) / h + 1e-12
+
+        centers = self.rng.choice(good, size=size)
+        x = np.clip(centers + self.rng.normal(0, bandwidth(good), size),
+                    low, high)
+        if self.is_integer(name):
+            x = np.round(x)
+        best = x[np.argmax(density(x, good) / density(x, bad))]
+        return int(best) if self.is_integer(name) else float(best)
+
+
+if __name__ == '__main__':
+    from MRVectorBackTester import MRVectorBackTester
+
+    raw = pd.read_csv('./input/binance-btc-usd-1m.csv',
+                      index_col=0, parse_dates=True).dropna()
+    objective = BacktestObjective(MRVectorBackTester, raw,
+                                  init={'amount': 10000, 'tc': 0.001})
+    space = {'SMA': (10, 200), 'threshold': (0.5, 50.0)}
+
+    for searcher in [RandomSearch(objective, space, n_iter=60, seed=42),
+                     SuccessiveHalving(objective, space, n_candidates=81,
+                                       seed=42),
+                     TPESearch(objective, space, n_iter=60, seed=42)]:
+        params, perf = searcher.run()
+        print(f'{type(searcher).__name__}: {params} | {perf:.2f} | '
+              f'{len(searcher.history)} evaluations')
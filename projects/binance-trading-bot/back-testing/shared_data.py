@@ -0,0 +1,341 @@
+#
+# Python Module with Classes
+# for sharing data sets between back-testing processes
+#
+# A DataServer loads each data set once into named shared memory and
+# keeps a registry of the data sets and of their users in a manager
+# process. Workers connect with a DataClient and get DataFrames whose
+# arrays are read-only, zero-copy views on the shared memory.
+#
+#   with DataServer() as server:
+#       server.load('btc', './BTCUSDT-1m-2020-01-01_2022-08-11.csv')
+#       # in each worker process:
+#       with DataClient(server.address, server.authkey) as client:
+#           raw = client.get('btc')
+#
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.managers import BaseManager
+from data_store import load_csv
+
+# shared memory blocks attached by this process, kept open while in use
+_attached = {}
+
+
+def _untrack(block: shared_memory.SharedMemory):
+    ''' Stops the resource tracker of this process from unlinking the
+    block when the process exits: the registry owns it.
+    '''
+    resource_tracker.unregister(block._name, 'shared_memory')
+
+
+def _open_block(name: str) -> shared_memory.SharedMemory:
+    ''' Attaches an existing block without owning it '''
+    block = shared_memory.SharedMemory(name)
+    _untrack(block)
+    return block
+
+
+class SharedFrame(object):
+    ''' Picklable description of a DataFrame stored in shared memory:
+    an int64 block with the dates and a float64 block with the values.
+
+    Methods
+    =======
+    create:
+        copies a DataFrame into new shared memory blocks
+    attach:
+        returns a read-only zero-copy DataFrame on the blocks
+    detach:
+        closes the blocks in this process
+    unlink:
+        frees the blocks
+    '''
+
+    def __init__(self, index_block: str, values_block: str, rows: int,
+                 columns: list, index_name=None, unit='ns'):
+        self.index_block = index_block
+        self.values_block = values_block
+        self.rows = rows
+        self.columns = list(columns)
+        self.index_name = index_name
+        self.unit = unit
+
+    def __repr__(self):
+        return f'SharedFrame({self.rows} rows, {self.columns})'
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows * (1 + len(self.columns)) * 8
+
+    @classmethod
+    def create(cls, data: pd.DataFrame) -> 'SharedFrame':
+        unit = getattr(data.index, 'unit', 'ns')
+        dates = data.index.values.view(np.int64)
+        values = data.to_numpy(dtype=np.float64)
+        blocks = []
+        for array in (dates, values):
+            block = shared_memory.SharedMemory(create=True,
+                                               size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, block.buf)[:] = array
+            _untrack(block)
+            blocks.append(block)
+        for block in blocks:
+            block.close()
+        return cls(blocks[0].name, blocks[1].name, len(data), data.columns,
+                   data.index.name, unit)
+
+    def attach(self) -> pd.DataFrame:
+        ''' Returns the data as a DataFrame backed by the shared memory '''
+        blocks = []
+        for name in (self.index_block, self.values_block):
+            if name not in _attached:
+                _attached[name] = _open_block(name)
+            blocks.append(_attached[name])
+        dates = np.ndarray(self.rows, np.int64, blocks[0].buf)
+        values = np.ndarray((self.rows, len(self.columns)), np.float64,
+                            blocks[1].buf)
+        dates.flags.writeable = False
+        values.flags.writeable = False
+        index = pd.DatetimeIndex(dates.view(f'datetime64[{self.unit}]'),
+                                 name=self.index_name)
+        return pd.DataFrame(values, index=index, columns=self.columns,
+                            copy=False)
+
+    def detach(self):
+        ''' Closes the blocks in this process; frames returned by attach()
+        must not be used anymore.
+        '''
+        for name in (self.index_block, self.values_block):
+            block = _attached.pop(name, None)
+            if block is not None:
+                try:
+                    block.close()
+                except BufferError:
+                    # still referenced by a live array, closed at exit
+                    _attached[name] = block
+
+    def unlink(self):
+        ''' Frees the shared memory blocks '''
+        self.detach()
+        for name in (self.index_block, self.values_block):
+            try:
+                # tracked, so that unlink() can unregister it
+                shared_memory.SharedMemory(name).unlink()
+            except FileNotFoundError:
+                pass
+
+
+class DataRegistry(object):
+    ''' Registry of the shared data sets, served by the manager process.
+
+    A data set removed while in use is unlinked by its last release.
+    '''
+
+    def __init__(self):
+        self.frames = {}
+        self.refs = {}
+        self.removed = set()
+
+    def add(self, name: str, frame: SharedFrame):
+        if name in self.frames:
+            raise KeyError(f'Data set {name} already exists')
+        self.frames[name] = frame
+        self.refs[name] = 0
+
+    def acquire(self, name: str) -> SharedFrame:
+        if name not in self.frames or name in self.removed:
+            raise KeyError(f'Unknown data set {name}')
+        self.refs[name] += 1
+        return self.frames[name]
+
+    def release(self, name: str) -> int:
+        self.refs[name] = max(0, self.refs[name] - 1)
+        if self.refs[name] == 0 and name in self.removed:
+            self._unlink(name)
+            return 0
+        return self.refs.get(name, 0)
+
+    def remove(self, name: str) -> bool:
+        ''' Removes a data set, returns False if it is still in use '''
+        self.removed.add(name)
+        if self.refs.get(name):
+            return False
+        self._unlink(name)
+        return True
+
+    def _unlink(self, name: str):
+        self.frames.pop(name).unlink()
+        self.refs.pop(name)
+        self.removed.discard(name)
+
+    def names(self) -> list:
+        return [name for name in self.frames if name not in self.removed]
+
+    def info(self) -> dict:
+        return {name: {'rows': frame.rows, 'columns': frame.columns,
+                       'nbytes': frame.nbytes, 'refs': self.refs[name]}
+                for name, frame in self.frames.items()}
+
+    def close(self):
+        for name in list(self.frames):
+            self._unlink(name)
+
+
+class RegistryManager(BaseManager):
+    pass
+
+
+_registry = None
+
+
+def _get_registry() -> DataRegistry:
+    global _registry
+    if _registry is None:
+        _registry = DataRegistry()
+    return _registry
+
+
+RegistryManager.register('registry', callable=_get_registry)
+
+
+class DataServer(object):
+    ''' Loads data sets into shared memory and serves their registry.
+
+    Attributes
+    ==========
+    address: tuple
+        address of the registry, for DataClient
+    authkey: bytes
+        authentication key of the registry, for DataClient
+
+    Methods
+    =======
+    load:
+        loads a CSV file into shared memory
+    publish:
+        copies a DataFrame into shared memory
+    remove:
+        frees a data set once its users released it
+    info:
+        returns the data sets with their size and number of users
+    close:
+        frees every data set and stops the registry
+    '''
+
+    def __init__(self, address=('127.0.0.1', 0), authkey: bytes = None):
+        if authkey is None:
+            authkey = np.random.default_rng().bytes(16)
+        self.authkey = authkey
+        self.manager = RegistryManager(address=address, authkey=authkey)
+        self.manager.start()
+        self.address = self.manager.address
+        self.registry = self.manager.registry()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self, name: str, csv_file: str, columns=None, start=None,
+             end=None) -> SharedFrame:
+        ''' Loads a CSV file (see data_store.load_csv) into shared memory
+        under `name`.
+        '''
+        data = load_csv(csv_file, columns, start, end, cache=False)
+        return self.publish(name, data)
+
+    def publish(self, name: str, data: pd.DataFrame) -> SharedFrame:
+        ''' Copies `data` into shared memory under `name` '''
+        frame = SharedFrame.create(data)
+        try:
+            self.registry.add(name, frame)
+        except KeyError:
+            frame.unlink()
+            raise
+        return frame
+
+    def remove(self, name: str) -> bool:
+        return self.registry.remove(name)
+
+    def info(self) -> dict:
+        return self.registry.info()
+
+    def close(self):
+        if self.manager is None:
+            return
+        self.registry.close()
+        self.manager.shutdown()
+        self.manager = None
+
+
+class DataClient(object):
+    ''' Connects to a DataServer registry and attaches its data sets.
+
+    Methods
+    =======
+    acquire:
+        returns the SharedFrame of a data set
+    get:
+        returns a data set as a zero-copy DataFrame
+    release:
+        tells the registry the data set is no longer used
+    names:
+        returns the names of the available data sets
+    '''
+
+    def __init__(self, address, authkey: bytes):
+        self.manager = RegistryManager(address=tuple(address),
+                                       authkey=authkey)
+        self.manager.connect()
+        self.registry = self.manager.registry()
+        self.frames = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def acquire(self, name: str) -> SharedFrame:
+        if name not in self.frames:
+            self.frames[name] = self.registry.acquire(name)
+        return self.frames[name]
+
+    def get(self, name: str) -> pd.DataFrame:
+        return self.acquire(name).attach()
+
+    def release(self, name: str):
+        frame = self.frames.pop(name, None)
+        if frame is not None:
+            frame.detach()
+            self.registry.release(name)
+
+    def names(self) -> list:
+        return self.registry.names()
+
+    def close(self):
+        for name in list(self.frames):
+            self.release(name)
+
+
+if __name__ == '__main__':
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    def worker(address, authkey):
+        with DataClient(address, authkey) as client:
+            raw = client.get('btc')
+            return len(raw), raw['price'].mean()
+
+    with DataServer() as server:
+        t0 = time.perf_counter()
+        frame = server.load('btc', './BTCUSDT-1m-2020-01-01_2022-08-11.csv')
+        print(f'{frame} loaded in {time.perf_counter() - t0:.2f} s')
+        with ProcessPoolExecutor() as executor:
+            futures = [executor.submit(worker, server.address, server.authkey)
+                       for _ in range(8)]
+            print([f.result() for f in futures])
+        print(server.info())
@@ -0,0 +1,73 @@
+#
+# Python Module with functions
+# for out-of-core (chunked) vectorized back-testing
+#
+# A series is processed in fixed-size chunks. Rolling windows are
+# computed on the tail of the previous chunk followed by the new one, and
+# cumulative sums start from the carried total, so each chunk gives the
+# same values as the in-memory computation on the whole series.
+#
+import numpy as np
+import pandas as pd
+
+
+def iter_chunks(source, chunk_size: int = 100_000, column: str = 'price'):
+    ''' Yields the `column` of a data set as Series of at most
+    `chunk_size` rows (missing values dropped).
+
+    Parameters
+    ==========
+    source: str or pd.DataFrame
+        path of a csv file (Date index, streamed from disk) or a DataFrame
+    '''
+    if isinstance(source, pd.DataFrame):
+        for i in range(0, len(source), chunk_size):
+            yield source[column].iloc[i:i + chunk_size].dropna()
+        return
+    for chunk in pd.read_csv(source, index_col=0, parse_dates=True,
+                             chunksize=chunk_size):
+        yield chunk[column].dropna()
+
+
+class RollingMean(object):
+    ''' Rolling mean over a series fed chunk by chunk '''
+
+    def __init__(self, window: int):
+        self.window = window
+        self.tail = np.empty(0)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        ''' Returns the rolling means at each of the new values '''
+        values = np.concatenate((self.tail, values))
+        means = pd.Series(values).rolling(self.window).mean().to_numpy()
+        n = len(values) - len(self.tail)
+        self.tail = values[max(0, len(values) - self.window + 1):] \
+            if self.window > 1 else values[:0]
+        return means[len(means) - n:]
+
+
+class CumSum(object):
+    ''' Cumulative sum over a series fed chunk by chunk '''
+
+    def __init__(self):
+        self.total = 0.0
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        # summed in sequence after the carried total, like a single cumsum
+        sums = np.cumsum(np.concatenate(([self.total], values)))[1:]
+        if len(sums):
+            self.total = sums[-1]
+        return sums
+
+
+class LogReturns(object):
+    ''' Log returns over a price series fed chunk by chunk '''
+
+    def __init__(self):
+        self.last = np.nan
+
+    def update(self, prices: np.ndarray) -> np.ndarray:
+        previous = np.concatenate(([self.last], prices[:-1]))
+        if len(prices):
+            self.last = prices[-1]
+        return np.log(prices / previous)
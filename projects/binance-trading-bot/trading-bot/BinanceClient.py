@@ -1,4 +1,6 @@
+import time
 import configparser
+import pandas as pd
 from binance.client import Client
 from binance.enums import SIDE_BUY, SIDE_SELL, ORDER_TYPE_MARKET
 
@@ -18,6 +20,7 @@ class BinanceClient(object):
 
         self.symbol = symbol
         self.client = Client(api_key, api_secret, testnet=testnet)
+        self.latency = None  # optional latency.LatencyTracker
 
     def buy(self, qty: float):
         self.__order(SIDE_BUY, qty)
@@ -25,6 +28,57 @@ class BinanceClient(object):
     def sell(self, qty: float):
         self.__order(SIDE_SELL, qty)
 
+    def klines(self, count: int = None, start_time=None,
+               interval: str = '1m') -> pd.DataFrame:
+        ''' Fetch closed klines, in batches of 1000 (the API limit)
+
+        Arguments:
+            - count: fetch the last `count` closed klines
+            - start_time: or every closed kline since this (naive UTC) date
+            - interval: kline interval (1m, 5m, 1h...)
+
+        Returns a DataFrame indexed by the (naive UTC) open time
+        with the close price, like the back-testing kline store
+        '''
+        if count is None and start_time is None:
+            raise Exception("Either count or start_time is required.")
+        limit = 1000
+        now = int(time.time() * 1000)
+        klines = []
+        if start_time is None:
+            # walk backwards from now, the current kline is not closed yet
+            end_time = None
+            while len(klines) < count + 1:
+                batch = self.client.get_klines(
+                    symbol=self.symbol, interval=interval,
+                    limit=min(limit, count + 1 - len(klines)),
+                    endTime=end_time)
+                if not batch:
+                    break
+                klines = batch + klines
+                end_time = batch[0][0] - 1
+        else:
+            start = int(pd.Timestamp(start_time).tz_localize('UTC')
+                        .timestamp() * 1000)
+            while True:
+                batch = self.client.get_klines(
+                    symbol=self.symbol, interval=interval, limit=limit,
+                    startTime=start)
+                klines += batch
+                if len(batch) < limit:
+                    break
+                start = batch[-1][0] + 1
+
+        # kline: [open time, open, high, low, close, volume, close time, ...]
+        closed = [k for k in klines if k[6] < now]
+        if count is not None:
+            closed = closed[-count:]
+        df = pd.DataFrame({
+            'Date': pd.to_datetime([k[0] for k in closed], unit='ms'),
+            'price': [float(k[4]) for k in closed],
+        })
+        return df.set_index('Date')
+
     def balance_of(self, asset) -> float:
         balance = self.client.get_asset_balance(asset=asset)
         if balance is None:
@@ -40,9 +94,16 @@ class BinanceClient(object):
 
         return order list or raise exception
         '''
+        sent = time.time()
         order = self.client.create_order(
             symbol=self.symbol,
             side=side,
             type=ORDER_TYPE_MARKET,
             quantity=qty,
         )
+        if self.latency is not None:
+            # submit: until the exchange matched the order (its clock), ack: round trip
+            self.latency.record('order_ack', time.time() - sent)
+            if order and 'transactTime' in order:
+                self.latency.record('order_submit', order['transactTime'] / 1000 - sent)
+        return order
@@ -0,0 +1,115 @@
+#
+# Memory-mapped snapshots of the live bot state
+#
+# The file has a fixed layout: a header then two slots, written in turn.
+# Each slot holds the scalar state of the bot and the last `capacity`
+# candles. A slot is guarded by a sequence number (seqlock): it is odd
+# while the slot is written and even once complete, so a snapshot torn by
+# a crash is detected and the other slot, one snapshot older, is used.
+#
+import os
+import mmap
+import struct
+import time
+import numpy as np
+
+MAGIC = b'BOTSTATE'
+VERSION = 1
+HEADER = struct.Struct('<8sII')  # magic, version, capacity
+FIELDS = ('seq', 'generation', 'saved_at', 'position', 'position_size', 'trade_count',
+          'balance', 'initial_balance', 'balance_delta', 'pending_time', 'pending_price', 'count')
+SLOT = struct.Struct('<QQdqdqdddqdQ')
+NO_TIME = np.iinfo(np.int64).min
+
+
+class BotState(object):
+    '''Fixed-size state snapshot file of the bot'''
+
+    def __init__(self, filename: str, capacity: int = 1_440):
+        '''
+        Parameters:
+        - filename: str
+            snapshot file, created if missing
+        - capacity: int
+            number of candles kept (the last ones)
+        '''
+        self.filename = filename
+        self.capacity = capacity
+        self.slot_size = SLOT.size + capacity * 16
+        size = HEADER.size + 2 * self.slot_size
+
+        new = not os.path.exists(filename) or os.path.getsize(filename) != size
+        if not new:
+            with open(filename, 'rb') as f:
+                new = HEADER.unpack(f.read(HEADER.size)) != (MAGIC, VERSION, capacity)
+        if new:
+            # another layout: start from an empty file
+            with open(filename, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, capacity))
+                f.truncate(size)
+
+        self.file = open(filename, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.times = []
+        self.prices = []
+        for i in range(2):
+            offset = HEADER.size + i * self.slot_size + SLOT.size
+            self.times.append(np.ndarray(capacity, np.int64, self.mm, offset))
+            self.prices.append(np.ndarray(capacity, np.float64, self.mm, offset + capacity * 8))
+        self.generation = max((self.read_slot(i) or {}).get('generation', 0) for i in range(2))
+
+    def slot_offset(self, i: int) -> int:
+        return HEADER.size + i * self.slot_size
+
+    def read_slot(self, i: int) -> dict:
+        '''Return the snapshot of the slot i, or None if it is empty or torn'''
+        offset = self.slot_offset(i)
+        seq = struct.unpack_from('<Q', self.mm, offset)[0]
+        if seq == 0 or seq % 2:
+            return None
+        state = dict(zip(FIELDS, SLOT.unpack_from(self.mm, offset)))
+        n = min(state['count'], self.capacity)
+        state['times'] = self.times[i][:n].copy()
+        state['prices'] = self.prices[i][:n].copy()
+        if struct.unpack_from('<Q', self.mm, offset)[0] != seq:
+            return None  # written meanwhile
+        return state
+
+    def load(self) -> dict:
+        '''Return the latest complete snapshot, or None'''
+        states = [s for s in (self.read_slot(0), self.read_slot(1)) if s is not None]
+        if not states:
+            return None
+        return max(states, key=lambda s: s['generation'])
+
+    def save(self, state: dict, times: np.ndarray, prices: np.ndarray, sync: bool = False):
+        '''Write a snapshot in the older slot, then flush it to disk if `sync`
+
+        - state: the scalar FIELDS except seq, generation, saved_at and count
+        - times, prices: candles as int64 ns timestamps and prices, the last
+            `capacity` ones are kept
+        '''
+        self.generation += 1
+        i = self.generation % 2
+        offset = self.slot_offset(i)
+        seq = struct.unpack_from('<Q', self.mm, offset)[0]
+        seq += 1 if seq % 2 == 0 else 2  # odd: slot being written
+        struct.pack_into('<Q', self.mm, offset, seq)
+
+        times = times[-self.capacity:]
+        prices = prices[-self.capacity:]
+        n = len(times)
+        self.times[i][:n] = times
+        self.prices[i][:n] = prices
+        values = dict(state, generation=self.generation, saved_at=time.time(), count=n)
+        SLOT.pack_into(self.mm, offset, seq, *(values[f] for f in FIELDS[1:]))
+
+        struct.pack_into('<Q', self.mm, offset, seq + 1)  # even: complete
+        if sync:
+            self.mm.flush()
+
+    def close(self):
+        self.mm.flush()
+        self.times = self.prices = None
+        self.mm.close()
+        self.file.close()
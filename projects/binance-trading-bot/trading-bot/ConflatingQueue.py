@@ -0,0 +1,118 @@
+#
+# Bounded queue between the websocket thread and the strategy thread
+#
+# Intermediate kline updates are only useful until a newer update of the
+# same candle arrives: a queued one is overwritten in place (conflated)
+# instead of queuing both. Closed-candle messages are never conflated nor
+# dropped. When the queue is full, the oldest intermediate update is
+# dropped; if there is none, put() waits for the consumer.
+#
+import threading
+import time
+from collections import deque
+
+
+class ConflatingQueue(object):
+    '''Bounded FIFO queue with per-key conflation'''
+
+    def __init__(self, maxsize: int = 1_000):
+        self.maxsize = maxsize
+        self.items = deque()  # slots [key, item, conflatable, enqueue time]
+        self.pending = {}  # key -> queued conflatable slot
+        self.closed = False
+        self.cond = threading.Condition()
+        self.put_count = 0
+        self.get_count = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.unfinished = 0  # queued or being handled, see task_done
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, key, item, conflatable: bool = True):
+        '''Queue `item`. A conflatable item replaces the queued conflatable
+        item of the same key, if any'''
+        with self.cond:
+            self.put_count += 1
+            now = time.perf_counter()
+            if conflatable:
+                slot = self.pending.get(key)
+                if slot is not None:
+                    slot[1] = item
+                    slot[3] = now
+                    self.conflated += 1
+                    return
+            else:
+                # a later update must be queued after this one
+                self.pending.pop(key, None)
+
+            while len(self.items) >= self.maxsize and not self.closed:
+                if not self.drop_oldest():
+                    self.cond.wait()
+            slot = [key, item, conflatable, now]
+            self.items.append(slot)
+            self.unfinished += 1
+            if conflatable:
+                self.pending[key] = slot
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.cond.notify_all()
+
+    def drop_oldest(self) -> bool:
+        '''Drop the oldest conflatable item, return False if there is none'''
+        for i, slot in enumerate(self.items):
+            if slot[2]:
+                del self.items[i]
+                if self.pending.get(slot[0]) is slot:
+                    del self.pending[slot[0]]
+                self.dropped += 1
+                self.unfinished -= 1
+                self.cond.notify_all()
+                return True
+        return False
+
+    def get(self, timeout: float = None):
+        '''Return (item, seconds spent in the queue), or None once the
+        queue is closed and empty'''
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if not self.items:
+                return None
+            slot = self.items.popleft()
+            key, item, conflatable, enqueued = slot
+            if self.pending.get(key) is slot:
+                del self.pending[key]
+            self.get_count += 1
+            self.cond.notify_all()
+        return item, time.perf_counter() - enqueued
+
+    def task_done(self):
+        '''Called by the consumer when it has handled an item from get()'''
+        with self.cond:
+            self.unfinished -= 1
+            self.cond.notify_all()
+
+    def join(self):
+        '''Wait until every queued item has been handled (or dropped)'''
+        with self.cond:
+            self.cond.wait_for(lambda: self.unfinished <= 0)
+
+    def close(self):
+        '''Wake up the consumer, which gets None after the last item'''
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "depth": len(self.items),
+                "max_depth": self.max_depth,
+                "maxsize": self.maxsize,
+                "put": self.put_count,
+                "get": self.get_count,
+                "conflated": self.conflated,
+                "dropped": self.dropped,
+            }
@@ -1,3 +1,4 @@
+import os
 from posixpath import dirname
 import pandas as pd
 import numpy as np
@@ -6,23 +7,73 @@ import websocket
 import zmq
 import time
 import math
-import json
-from utils import get_gross_rate
+import threading
+import traceback
+from decoder import decode, dumps
+from latency import LatencyTracker
+from ConflatingQueue import ConflatingQueue
+from BotState import BotState, NO_TIME
+from utils import get_gross_rate, read_csv_tail, utc_to_local, local_to_utc
 from BinanceClient import BinanceClient
 
 
+HISTORY_FILE = "../back-testing/BTCUSDT-1m-2020-01-01_2022-08-11.csv"
+LOGS_DIR = "logs"
+STATE_FILE = "bot-state.bin"
+
+
 class OnlineTradingBot(object):
-    def __init__(self, budget: int = 1_000, reserve: int = 50, momentum: int = 1, testnet=True, verbose=True):
+    def __init__(self, budget: int = 1_000, reserve: int = 50, momentum: int = 1, testnet=True, verbose=True,
+                 warmup: int = None, history_file: str = None, latency_interval: float = 60,
+                 queue_size: int = 1_000, resume: bool = False, state_file: str = None, client=None,
+                 logs_dir: str = None):
+        '''
+        Parameters:
+        - warmup: int
+            number of past 1m candles loaded before connecting the websocket,
+            defaults to what the strategy needs to trade on the first candle (0 to disable)
+        - history_file: str
+            local kline store (Date, price csv) read for the warm-up,
+            missing candles are fetched from the REST API
+        - latency_interval: float
+            seconds between two latency and queue reports on the ZMQ socket
+        - queue_size: int
+            capacity of the queue of ticks between the websocket and the strategy threads
+        - resume: bool
+            restore the state saved by a previous run (after a crash)
+            and append to its trading logs
+        - state_file: str
+            memory-mapped snapshot of the bot state, saved on each closed candle
+            and flushed to disk on each trade
+        - client:
+            exchange client, defaults to a BinanceClient (a SimulatedBinanceClient runs without network)
+        - logs_dir: str
+            directory of the trading logs, the latency report and the default state file
+        '''
         self.data = pd.DataFrame()
         self.momentum = momentum
+        self.warmup_size = momentum + 2 if warmup is None else warmup
+        self.history_file = history_file or f"{dirname(__file__)}/{HISTORY_FILE}"
+        self.seam_checked = False
+        self.pending = None  # last tick of the current minute
         self.reserve = reserve
         self.position: int = 0
+        self.position_size = 0
         self.trade_count = 0
         self.verbose = verbose
         self.WS_URL = 'wss://stream.binance.us:9443/ws/btcusdt@kline_1m'
-        self.client = BinanceClient("BTCUSDT", testnet=testnet)
-        self.init_trading_balance(budget)
-        self.open_logs_file()
+        self.client = client or BinanceClient("BTCUSDT", testnet=testnet)
+        self.latency = LatencyTracker(interval=latency_interval)
+        self.client.latency = self.latency
+        self.tick_time = None  # binance event time (ms) of the current tick
+        self.queue = ConflatingQueue(queue_size)
+        self.strategy_thread = None
+        self.ws = None
+        self.logs_dir = logs_dir or f"{dirname(__file__)}/{LOGS_DIR}"
+        self.state = BotState(state_file or f"{self.logs_dir}/{STATE_FILE}")
+        if not (resume and self.restore_state()):
+            self.init_trading_balance(budget)
+        self.open_logs_file(append=resume)
         self.open_logs_ws_connection()
         if self.verbose:
             print(f"Bot initialized with {budget} USDT")
@@ -38,21 +89,148 @@ class OnlineTradingBot(object):
         self.balance = budget
         self.BALANCE_DELTA = initial_binance_balance - budget
 
-    def run(self):
-        '''Listen the binance websocket'''
-        ws = websocket.WebSocketApp(
+    def save_state(self, sync: bool = False):
+        '''Snapshot the bot state, `sync` to flush it to disk'''
+        pending_time, pending_price = NO_TIME, math.nan
+        if self.pending is not None:
+            pending_time = pd.Timestamp(self.pending[0]).value
+            pending_price = self.pending[1]
+        times = self.data.index.values.astype('datetime64[ns]').view(np.int64) if len(self.data) else np.empty(0, np.int64)
+        prices = self.data['price'].to_numpy(dtype=float) if len(self.data) else np.empty(0)
+        self.state.save({
+            "position": self.position,
+            "position_size": self.position_size,
+            "trade_count": self.trade_count,
+            "balance": self.balance,
+            "initial_balance": self.INITIAL_BALANCE,
+            "balance_delta": self.BALANCE_DELTA,
+            "pending_time": pending_time,
+            "pending_price": pending_price,
+        }, times, prices, sync=sync)
+
+    def restore_state(self) -> bool:
+        '''Restore the last snapshot, return False if there is none'''
+        state = self.state.load()
+        if state is None:
+            print("No state to resume from")
+            return False
+        self.position = int(state["position"])
+        self.position_size = state["position_size"]
+        self.trade_count = int(state["trade_count"])
+        self.balance = state["balance"]
+        self.INITIAL_BALANCE = state["initial_balance"]
+        self.BALANCE_DELTA = state["balance_delta"]
+        if state["pending_time"] != NO_TIME:
+            self.pending = (pd.Timestamp(state["pending_time"]).to_pydatetime(), state["pending_price"])
+        self.data = pd.DataFrame({"price": state["prices"]}, index=pd.DatetimeIndex(state["times"].view('datetime64[ns]'), name='Date'))
+        # the first streamed tick fills the candles missed while down
+        self.seam_checked = False
+        if self.verbose:
+            saved_at = dt.datetime.fromtimestamp(state["saved_at"])
+            print(f"Resumed state of {saved_at}: position {self.position}, balance {self.balance}, {len(self.data)} candles")
+        return True
+
+    def run(self, messages=None):
+        '''Listen the binance websocket, or replay kline stream `messages`
+        (like SimulatedBinanceClient.messages()) until they are exhausted'''
+        self.warm_up()
+        self.strategy_thread = threading.Thread(target=self.__consume, name="strategy", daemon=True)
+        self.strategy_thread.start()
+        if messages is not None:
+            self.__on_open(None)
+            for message in messages:
+                self.__on_message(None, message)
+                # the next message moves the simulated clock: wait until this
+                # one is handled, so orders fill at the price of their tick
+                self.queue.join()
+            self.__on_close(None, None, None)
+            return
+        self.ws = websocket.WebSocketApp(
             self.WS_URL,
             on_open=self.__on_open,
             on_message=self.__on_message,
             on_close=self.__on_close
         )
-        ws.run_forever()
+        self.ws.run_forever()
+
+    def warm_up(self):
+        '''Load the latest candles into self.data, from the local kline store
+        then the REST API for the candles it does not have yet'''
+        n = self.warmup_size
+        if n <= 0:
+            self.seam_checked = True
+            return
+        if len(self.data) >= n:
+            # resumed with enough candles
+            return
+
+        history = pd.DataFrame()
+        if os.path.exists(self.history_file):
+            history = read_csv_tail(self.history_file, n)[['price']]
 
-    def open_logs_file(self):
-        '''Create a trading logs file'''
+        # kline dates are naive UTC
+        now = pd.Timestamp.now(tz='UTC').tz_localize(None)
+        try:
+            if history.empty or history.index[-1] < now - pd.Timedelta(minutes=n):
+                # the store is too old to help
+                history = self.client.klines(count=n)
+            else:
+                since = history.index[-1] + pd.Timedelta(minutes=1)
+                history = pd.concat([history, self.client.klines(start_time=since)])
+        except Exception as e:
+            # a stale store would make check_seam backfill all the candles
+            # since its last one: keep only the last n minutes
+            history = history[history.index >= now - pd.Timedelta(minutes=n)]
+            print(f"Warm-up: cannot fetch klines ({e}), starting with {len(history)} candles")
+
+        history = history[~history.index.duplicated(keep='last')].tail(n)
+        history.index = utc_to_local(history.index)
+        history.index.name = 'Date'
+        self.data = history
+        if self.verbose and not history.empty:
+            print(f"Warmed up with {len(history)} candles up to {history.index[-1]}")
+
+    def check_seam(self, datetime: dt.datetime):
+        '''On the first streamed tick, make sure no candle is missing or
+        repeated between the warm-up history and the stream'''
+        self.seam_checked = True
+        if self.data.empty:
+            return
+
+        minute = pd.Timestamp(datetime).floor('min')
+        last = self.data.index[-1]
+        one = pd.Timedelta(minutes=1)
+        if last >= minute:
+            # the history already holds candles of the streamed minute
+            self.data = self.data[self.data.index < minute]
+            if self.verbose:
+                print(f"Seam: dropped history from {minute}")
+        elif minute - last > one:
+            # candles closed between the warm-up and the first tick
+            start = last + one
+            if minute - start > self.warmup_size * one:
+                # too old to bridge, only the last warmup_size candles are fetched
+                start = minute - self.warmup_size * one
+                self.data = self.data.iloc[0:0]
+            try:
+                missing = self.client.klines(start_time=local_to_utc(start))
+                missing.index = utc_to_local(missing.index)
+                missing = missing[(missing.index >= start) & (missing.index < minute)]
+                self.data = pd.concat([self.data, missing])
+            except Exception as e:
+                missing = []
+                print(f"Seam: cannot fetch missing candles ({e})")
+            first = self.data.index[-1] if len(self.data) else start - one
+            gap = int((minute - first) / one) - 1
+            if self.verbose or gap > 0:
+                print(f"Seam: added {len(missing)} candles, {gap} still missing")
+
+    def open_logs_file(self, append: bool = False):
+        '''Create a trading logs file, or append to it'''
         logs_filename = f"trading-logs.csv"
-        self.logs_filename = f"{dirname(__file__)}/logs/{logs_filename}"
-        open(self.logs_filename, "w", newline='')
+        self.logs_filename = f"{self.logs_dir}/{logs_filename}"
+        self.logs_file = open(self.logs_filename, "a" if append else "w", newline='', buffering=1)
+        self.latency_filename = f"{self.logs_dir}/latency.json"
 
     def open_logs_ws_connection(self):
         '''Open a websocket to send trading logs in real-time'''
@@ -70,15 +248,46 @@ class OnlineTradingBot(object):
         '''Handled when binance websocket connection is closed'''
         if self.verbose:
             print(f"Connection closed, close position by selling out if needed.")
-        self.sell_order()
+        # let the strategy thread handle the queued ticks first
+        self.queue.close()
+        if self.strategy_thread is not None:
+            self.strategy_thread.join()
+        if self.position == 1:
+            self.sell_order()
+        self.save_state(sync=True)
+        self.latency.dump(self.latency_filename)
+        if self.verbose:
+            self.latency.print_summary()
 
     def __on_message(self, ws, message):
-        '''Handled when binance websocket connection receive tick'''
-        data = json.loads(message)
-        datetime = dt.datetime.fromtimestamp(int(int(data['E']) / 1000))
-        price = float(data['k']['c'])
-        is_candle_closed = bool(data['k']['x'])
-        self.__on_data(datetime, price, is_candle_closed)
+        '''Handled when binance websocket connection receive tick,
+        on the websocket thread: only decode and queue it'''
+        start = time.perf_counter()
+        tick = decode(message)
+        self.latency.record('decode', time.perf_counter() - start)
+        self.latency.since_event('receive', tick.event_time)
+        # a newer update of the same candle replaces a queued one
+        self.queue.put((self.client.symbol, tick.open_time), tick, conflatable=not tick.closed)
+
+    def __consume(self):
+        '''Strategy thread: handle the queued ticks until the queue is closed.
+        Like the websocket callbacks, a failing tick (e.g. a rejected order) is
+        reported and the next ones are handled'''
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                break
+            tick, waited = entry
+            self.latency.record('queue_wait', waited)
+            self.tick_time = tick.event_time
+            try:
+                self.__on_data(tick.datetime, tick.price, tick.closed)
+                if self.latency.maybe_publish(self.socket):
+                    self.socket.send_string(f"QUEUE:{dumps(self.queue.stats())}")
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.queue.task_done()
 
     def new_log(self, datetime: dt.datetime, price: float):
         '''Create base logs object'''
@@ -113,28 +322,48 @@ class OnlineTradingBot(object):
         if self.verbose:
             print(datetime, price)
 
-        # create & append new candle to self.data
-        candle = pd.DataFrame({"price": price}, index=[datetime])
-        candle.index.name = 'Date'
-        self.data = pd.concat([self.data, candle])
+        if not self.seam_checked:
+            self.check_seam(datetime)
+
+        # the strategy resamples self.data to the last price of each minute,
+        # so intermediate updates only replace the pending tick of the minute
+        if self.pending is not None and \
+                self.pending[0].replace(second=0) != datetime.replace(second=0):
+            self.append_tick(*self.pending)
+        self.pending = (datetime, price)
+        if is_candle_closed:
+            self.append_tick(datetime, price)
+            self.pending = None
 
         # prepare logs
         log = self.new_log(datetime, price)
 
         if is_candle_closed:
+            trade_count = self.trade_count
+
             # Calc mandatory technical indicator to be able to trade
+            start = time.perf_counter()
             dr = self.data.resample(pd.Timedelta(1, 'm'), label='right').last()
             dr['return'] = np.log(dr['price'] / dr['price'].shift(1))
             dr['momentum'] = dr['return'].rolling(self.momentum).mean()
+            self.latency.record('indicators', time.perf_counter() - start)
+
+            # decide
+            start = time.perf_counter()
+            signal = np.sign(dr['momentum'].iloc[-2]) if len(dr) > self.momentum + 1 else 0
+            self.latency.record('decision', time.perf_counter() - start)
+            if self.tick_time is not None:
+                self.latency.since_event('tick_to_decision', self.tick_time)
 
             # trade
-            if len(dr) > self.momentum + 1:
-                if np.sign(dr['momentum'].iloc[-2]) > 0 and self.position == 0:
-                    self.update_position_size(price)
-                    self.buy_order()
+            if signal > 0 and self.position == 0:
+                self.update_position_size(price)
+                self.buy_order()
+                self.record_tick_to_order()
 
-                elif np.sign(dr['momentum'].iloc[-2]) < 0 and self.position == 1:
-                    self.sell_order()
+            elif signal < 0 and self.position == 1:
+                self.sell_order()
+                self.record_tick_to_order()
 
             self.update_balance(price)
 
@@ -142,10 +371,24 @@ class OnlineTradingBot(object):
             log["raw"]['position'] = self.position
             log["raw"]['balance'] = self.balance
 
+            # snapshot, on disk at once after a trade
+            self.save_state(sync=self.trade_count != trade_count)
+
         # send logs
-        self.socket.send_string(f"LOGS:{json.dumps(log)}")
-        log = pd.DataFrame(log["raw"], index=[datetime])
-        log.to_csv(self.logs_filename, header=False, mode='a')
+        self.socket.send_string(f"LOGS:{dumps(log)}")
+        raw = log["raw"]
+        self.logs_file.write(f"{datetime},{raw['price']},{raw['position']},{raw['balance']}\n")
+
+    def record_tick_to_order(self):
+        '''Time from the exchange event to the acknowledged order'''
+        if self.tick_time is not None:
+            self.latency.since_event('tick_to_order', self.tick_time)
+
+    def append_tick(self, datetime: dt.datetime, price: float):
+        '''Append a tick to self.data'''
+        candle = pd.DataFrame({"price": price}, index=[datetime])
+        candle.index.name = 'Date'
+        self.data = pd.concat([self.data, candle])
 
     def update_balance(self, price: float):
         '''Calculate and save the theoretical balance integrating PnL'''
@@ -0,0 +1,224 @@
+#
+# In-process exchange simulator, a drop-in for BinanceClient
+#
+# Market orders are matched against a replayed price feed: the simulator
+# produces the kline websocket messages the bot listens to, and fills each
+# order at the last price of the feed (plus half the spread), with fees,
+# fill latency and random rejections. No keys, no network.
+#
+#   client = SimulatedBinanceClient(data, balances={"USDT": 10_000})
+#   bot = OnlineTradingBot(budget=1_000, client=client)
+#   bot.run(client.messages())
+#
+import json
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+class SimulatedBinanceClient(object):
+    def __init__(self, data: pd.DataFrame, symbol: str = "BTCUSDT", balances: dict = None, start: int = 0,
+                 fee: float = 0.001, fee_asset: str = "quote", spread: float = 0.0, fill_latency: float = 0.0,
+                 reject_rate: float = 0.0, step_size: float = 0.0001, min_notional: float = 10.0, seed: int = None):
+        '''
+        Parameters:
+        - data: pd.DataFrame
+            1m klines with a price column, indexed by the (naive UTC) open time
+        - symbol: str
+            pair symbol in uppercase like "BTCUSDT"
+        - balances: dict
+            initial free balance of each asset, defaults to 10 000 USDT
+        - start: int
+            position in data of the first replayed candle,
+            the previous ones are returned by klines() (warm-up)
+        - fee: float
+            commission rate of a fill
+        - fee_asset: str
+            "quote" to pay the commission in USDT (like with BNB discounts),
+            "received" to take it from the received asset (binance default)
+        - spread: float
+            relative bid-ask spread, buys fill half above the feed price, sells half below
+        - fill_latency: float
+            seconds each order takes (blocking, like the REST call)
+        - reject_rate: float
+            probability an order is rejected
+        - step_size, min_notional:
+            LOT_SIZE and MIN_NOTIONAL filters of the pair
+        '''
+        self.symbol = symbol
+        self.base, self.quote = symbol[:-4], symbol[-4:]
+        self.data = data
+        self.times = data.index.values.astype('datetime64[ms]').view(np.int64)
+        self.prices = data['price'].to_numpy(dtype=float)
+        self.balances = dict(balances or {self.quote: 10_000.0})
+        self.balances.setdefault(self.base, 0.0)
+        self.fee = fee
+        self.fee_asset = fee_asset
+        self.spread = spread
+        self.fill_latency = fill_latency
+        self.reject_rate = reject_rate
+        self.step_size = step_size
+        self.min_notional = min_notional
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+        self.orders = []
+        self.rejected = 0
+        self.latency = None  # optional latency.LatencyTracker
+        # simulated clock (ms) and last price of the feed
+        self.now = int(self.times[start]) if start < len(self.times) else int(self.times[-1]) + 60_000
+        self.price = float(self.prices[start - 1] if start > 0 else self.prices[0])
+        self.start = start
+
+    def buy(self, qty: float):
+        self.__order("BUY", qty)
+
+    def sell(self, qty: float):
+        self.__order("SELL", qty)
+
+    def balance_of(self, asset) -> float:
+        with self.lock:
+            if asset not in self.balances:
+                raise Exception(f"Cannot get {asset} balance.")
+            return self.balances[asset]
+
+    def klines(self, count: int = None, start_time=None, interval: str = '1m') -> pd.DataFrame:
+        ''' Closed klines before the simulated clock, like BinanceClient.klines '''
+        if count is None and start_time is None:
+            raise Exception("Either count or start_time is required.")
+        if interval != '1m':
+            raise Exception("The simulator only has 1m klines.")
+        # a kline is closed one minute after its open time
+        end = np.searchsorted(self.times, self.now - 60_000, side='right')
+        if start_time is None:
+            begin = max(0, end - count)
+        else:
+            start = int(pd.Timestamp(start_time).value // 1_000_000)
+            begin = np.searchsorted(self.times, start)
+            if count is not None:
+                begin = max(begin, end - count)
+        return self.data.iloc[begin:end][['price']].copy()
+
+    def __order(self, side, qty: float):
+        ''' Fill a market order at the feed price, or raise an exception '''
+        sent = time.time()
+        if self.fill_latency > 0:
+            time.sleep(self.fill_latency)
+        with self.lock:
+            order = self.__match(side, qty)
+        if self.latency is not None:
+            self.latency.record('order_ack', time.time() - sent)
+        return order
+
+    def __match(self, side, qty: float) -> dict:
+        if self.reject_rate > 0 and self.rng.random() < self.reject_rate:
+            return self.__reject("Order rejected (simulated).")
+        steps = qty / self.step_size
+        if qty <= 0 or abs(steps - round(steps)) > 1e-6:
+            return self.__reject(f"Filter failure: LOT_SIZE ({qty}).")
+        half_spread = self.spread / 2
+        price = self.price * (1 + half_spread if side == "BUY" else 1 - half_spread)
+        quote_qty = qty * price
+        if quote_qty < self.min_notional:
+            return self.__reject(f"Filter failure: MIN_NOTIONAL ({quote_qty}).")
+
+        if side == "BUY":
+            pay, paid, receive, received = self.quote, quote_qty, self.base, qty
+        else:
+            pay, paid, receive, received = self.base, qty, self.quote, quote_qty
+        if self.fee_asset == "quote":
+            commission, commission_asset = quote_qty * self.fee, self.quote
+        else:
+            commission, commission_asset = received * self.fee, receive
+        need = paid + (commission if commission_asset == pay else 0)
+        if need > self.balances[pay] + 1e-12:
+            return self.__reject("Account has insufficient balance for requested action.")
+
+        self.balances[pay] -= paid
+        self.balances[receive] += received
+        self.balances[commission_asset] -= commission
+        order = {
+            "symbol": self.symbol,
+            "orderId": len(self.orders) + 1,
+            "transactTime": self.now,
+            "side": side,
+            "type": "MARKET",
+            "status": "FILLED",
+            "executedQty": qty,
+            "cummulativeQuoteQty": quote_qty,
+            "fills": [{"price": price, "qty": qty, "commission": commission,
+                       "commissionAsset": commission_asset}],
+        }
+        self.orders.append(order)
+        return order
+
+    def __reject(self, reason: str):
+        self.rejected += 1
+        raise Exception(f"APIError(code=-2010): {reason}")
+
+    def messages(self, ticks_per_candle: int = 1, stop: int = None):
+        ''' Generate the kline stream messages of the replayed candles
+
+        Each candle gives `ticks_per_candle` intermediate updates, then the
+        closing message, stamped one minute (plus a few ms) after the open.
+        The simulated clock and price follow the generated messages: an
+        order fills at the price of the last generated message, so each
+        message must be handled before the next one is requested (like
+        OnlineTradingBot.run does).
+        '''
+        stop = len(self.times) if stop is None else stop
+        for i in range(self.start, stop):
+            open_time = int(self.times[i])
+            price = self.prices[i]
+            previous = self.prices[i - 1] if i > 0 else price
+            for j in range(ticks_per_candle):
+                # intermediate updates move from the previous close to this one
+                w = (j + 1) / (ticks_per_candle + 1)
+                yield self.__message(open_time + int(60_000 * w), open_time, previous + (price - previous) * w, False)
+            yield self.__message(open_time + 60_005, open_time, price, True)
+
+    def __message(self, event_time: int, open_time: int, price: float, closed: bool) -> str:
+        with self.lock:
+            self.now = event_time
+            self.price = float(price)
+        return json.dumps({
+            "e": "kline", "E": event_time, "s": self.symbol,
+            "k": {"t": open_time, "T": open_time + 59_999, "s": self.symbol, "i": "1m",
+                  "c": f"{price:.2f}", "x": closed}}, separators=(',', ':'))
+
+
+if __name__ == '__main__':
+    # load test: order throughput of the simulator, then the bot on a replay
+    import os
+    import sys
+    import tempfile
+    from os.path import dirname
+    from utils import read_csv_tail
+    from OnlineTradingBot import OnlineTradingBot, HISTORY_FILE
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    history_file = f"{dirname(__file__)}/{HISTORY_FILE}"
+    if os.path.exists(history_file):
+        data = read_csv_tail(history_file, n)[['price']]
+    else:
+        # random walk
+        returns = np.random.default_rng(0).normal(0, 1e-3, n)
+        index = pd.date_range('2022-08-01', periods=n, freq='1min', name='Date')
+        data = pd.DataFrame({'price': 24_000 * np.exp(np.cumsum(returns))}, index=index)
+
+    client = SimulatedBinanceClient(data, balances={"USDT": 1e9})
+    count = 100_000
+    t0 = time.perf_counter()
+    for i in range(count):
+        client.buy(0.01) if i % 2 == 0 else client.sell(0.01)
+    print(f"{count / (time.perf_counter() - t0):,.0f} orders/s")
+
+    client = SimulatedBinanceClient(data, balances={"USDT": 10_000}, start=10, spread=0.0002, reject_rate=0.01, seed=0)
+    # logs and state outside of the source tree
+    bot = OnlineTradingBot(budget=1_000, momentum=3, verbose=False, client=client, logs_dir=tempfile.mkdtemp())
+    t0 = time.perf_counter()
+    bot.run(client.messages(ticks_per_candle=5))
+    elapsed = time.perf_counter() - t0
+    print(f"{n - 10} candles replayed in {elapsed:.1f} s, {len(client.orders)} orders, "
+          f"{client.rejected} rejected, balance {bot.balance:.2f} USDT")
+    bot.latency.print_summary()
@@ -0,0 +1,98 @@
+#
+# Decoding of the binance kline websocket messages
+#
+# Most messages are intermediate updates of the current candle ("x":false):
+# their event time and close price are read with a string scan, only the
+# messages closing a candle are parsed as JSON (orjson or ujson when
+# installed).
+#
+import datetime as dt
+
+try:
+    import orjson
+
+    def loads(message):
+        return orjson.loads(message)
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    try:
+        import ujson as json
+    except ImportError:
+        import json
+
+    def loads(message):
+        return json.loads(message)
+
+    def dumps(obj) -> str:
+        return json.dumps(obj)
+
+
+class KlineTick(object):
+    '''One kline update, with integer timestamps (ms)'''
+    __slots__ = ('event_time', 'open_time', 'price', 'closed')
+
+    def __init__(self, event_time: int, open_time: int, price: float, closed: bool):
+        self.event_time = event_time
+        self.open_time = open_time
+        self.price = price
+        self.closed = closed
+
+    def __repr__(self):
+        return f"KlineTick({self.event_time}, {self.open_time}, {self.price}, {self.closed})"
+
+    @property
+    def datetime(self) -> dt.datetime:
+        '''Event time as a naive local datetime, truncated to the second'''
+        return dt.datetime.fromtimestamp(self.event_time // 1000)
+
+
+def decode(message: str) -> KlineTick:
+    '''Decodes a kline stream message'''
+    if '"x":false' in message:
+        # intermediate update: the values are sliced out, no JSON parsing
+        i = message.index('"E":') + 4
+        event_time = int(message[i:message.index(',', i)])
+        k = message.index('"k":')
+        i = message.index('"t":', k) + 4
+        open_time = int(message[i:message.index(',', i)])
+        i = message.index('"c":"', k) + 5
+        price = float(message[i:message.index('"', i)])
+        return KlineTick(event_time, open_time, price, False)
+
+    data = loads(message)
+    k = data['k']
+    return KlineTick(int(data['E']), int(k['t']), float(k['c']), bool(k['x']))
+
+
+if __name__ == '__main__':
+    # micro-benchmark of the per-message cost
+    import json
+    import timeit
+
+    def message(closed: bool) -> str:
+        return json.dumps({
+            "e": "kline", "E": 1660486922123, "s": "BTCUSDT",
+            "k": {"t": 1660486920000, "T": 1660486979999, "s": "BTCUSDT", "i": "1m",
+                  "f": 1, "L": 2, "o": "24506.34", "c": "24501.83", "h": "24510.00",
+                  "l": "24499.00", "v": "12.5", "n": 100, "x": closed, "q": "306329.25",
+                  "V": "6.2", "Q": "151935.25", "B": "0"}},
+            separators=(',', ':'))
+
+    def baseline(msg):
+        # previous decoding in OnlineTradingBot.__on_message
+        data = json.loads(msg)
+        datetime = dt.datetime.fromtimestamp(int(int(data['E']) / 1000))
+        price = float(data['k']['c'])
+        is_candle_closed = bool(data['k']['x'])
+        return datetime, price, is_candle_closed
+
+    for closed in (False, True):
+        msg = message(closed)
+        tick = decode(msg)
+        assert (tick.datetime, tick.price, tick.closed) == baseline(msg)
+        n = 100_000
+        for name, func in [('json.loads', baseline), ('decode', decode)]:
+            best = min(timeit.repeat(lambda: func(msg), number=n, repeat=5))
+            print(f"x={str(closed).lower():5} {name:10} {best / n * 1e9:8.0f} ns/message")
@@ -0,0 +1,135 @@
+#
+# Latency tracking of the live bot
+#
+# Each stage (receive, decode, indicators, decision, order submit, ack...)
+# has a histogram of fixed size with logarithmic buckets, so recording is
+# O(1) and the memory does not grow however long the bot runs.
+#
+import math
+import time
+import json
+
+
+class LatencyHistogram(object):
+    '''Histogram of durations (seconds) in log-spaced buckets,
+    from `low` to `high` with `per_decade` buckets per power of 10'''
+    __slots__ = ('low', 'per_decade', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, low: float = 1e-6, high: float = 100.0, per_decade: int = 20):
+        self.low = low
+        self.per_decade = per_decade
+        size = int(math.ceil(math.log10(high / low) * per_decade)) + 1
+        self.counts = [0] * size
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value: float):
+        '''Add a duration in seconds'''
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if value <= self.low:
+            i = 0
+        else:
+            i = min(int(math.log10(value / self.low) * self.per_decade) + 1,
+                    len(self.counts) - 1)
+        self.counts[i] += 1
+
+    def upper_bound(self, i: int) -> float:
+        '''Upper bound of the bucket i'''
+        return self.low * 10 ** (i / self.per_decade)
+
+    def percentile(self, q: float) -> float:
+        '''Upper bound of the bucket holding the q-th percentile (0-100)'''
+        if self.count == 0:
+            return math.nan
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.upper_bound(i), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        '''Count, mean, percentiles and extremes in milliseconds'''
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p90_ms": self.percentile(90) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "min_ms": self.min * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+
+class LatencyTracker(object):
+    '''Latency histograms per stage, published every `interval` seconds'''
+
+    def __init__(self, interval: float = 60.0, **histogram):
+        self.interval = interval
+        self.histogram = histogram
+        self.stages = {}
+        self.started = time.time()
+        self.last_publish = time.monotonic()
+
+    def record(self, stage: str, seconds: float):
+        '''Add a duration to the histogram of a stage'''
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = LatencyHistogram(**self.histogram)
+        hist.record(seconds)
+
+    def since_event(self, stage: str, event_time: int):
+        '''Record the time elapsed since a binance event time (ms)'''
+        self.record(stage, time.time() - event_time / 1000)
+
+    def snapshot(self) -> dict:
+        return {
+            "since": int(self.started),
+            "timestamp": int(time.time()),
+            "stages": {name: hist.summary() for name, hist in self.stages.items()},
+        }
+
+    def maybe_publish(self, socket) -> bool:
+        '''Send the snapshot over the ZMQ socket when `interval` is elapsed'''
+        now = time.monotonic()
+        if now - self.last_publish < self.interval:
+            return False
+        self.last_publish = now
+        self.publish(socket)
+        return True
+
+    def publish(self, socket):
+        socket.send_string(f"LATENCY:{json.dumps(self.snapshot())}")
+
+    def dump(self, filename: str):
+        '''Save the snapshot with the raw bucket counts'''
+        snapshot = self.snapshot()
+        for name, hist in self.stages.items():
+            snapshot["stages"][name]["buckets"] = {
+                f"{hist.upper_bound(i):.3g}": n for i, n in enumerate(hist.counts) if n}
+        with open(filename, "w") as f:
+            json.dump(snapshot, f, indent=2)
+
+    def print_summary(self):
+        for name, hist in self.stages.items():
+            s = hist.summary()
+            if s["count"]:
+                print(f"{name:18} n={s['count']:<7} p50 {s['p50_ms']:9.3f} ms | "
+                      f"p99 {s['p99_ms']:9.3f} ms | max {s['max_ms']:9.3f} ms")
@@ -1,7 +1,50 @@
 #
 # Some useful functions
 #
+import io
+import os
+import pandas as pd
+from dateutil import tz
+
 
 def get_gross_rate(initial_value: float, final_value: float) -> float:
     '''Returns the gross rate (between -1.0 to 1.0)'''
     return (final_value - initial_value) / initial_value
+
+
+def read_csv_tail(path: str, n: int, block_size=1 << 16) -> pd.DataFrame:
+    '''Returns the last `n` rows of a date-indexed csv file,
+    reading blocks backwards from the end instead of the whole file'''
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        end = f.seek(0, os.SEEK_END)
+        pos, tail = end, b''
+        # n + 1 newlines make sure the first kept row is complete
+        while pos > start and tail.count(b'\n') <= n:
+            size = min(block_size, pos - start)
+            pos -= size
+            f.seek(pos)
+            tail = f.read(size) + tail
+    rows = tail.rstrip(b'\n').split(b'\n')[-n:] if n > 0 else []
+    data = b'\n'.join([header.rstrip(b'\n')] + rows)
+    return pd.read_csv(io.BytesIO(data), index_col=0, parse_dates=True)
+
+
+def local_timezone():
+    '''Returns the local timezone, with its DST changes (like
+    dt.datetime.fromtimestamp), not the current offset only'''
+    return tz.tzlocal()
+
+
+def utc_to_local(index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    '''Converts naive UTC dates (binance klines) to naive local dates
+    (like the ones built by the bot from the websocket)'''
+    return index.tz_localize('UTC').tz_convert(local_timezone()) \
+        .tz_localize(None)
+
+
+def local_to_utc(datetime) -> pd.Timestamp:
+    '''Converts a naive local date to a naive UTC date'''
+    return pd.Timestamp(datetime).tz_localize(local_timezone()) \
+        .tz_convert('UTC').tz_localize(None)